@@ -18,13 +18,36 @@ timeout_wrapper() {
 
 true "$0: INFO: Using 'return' in combination with 'exit' so this script can be both, being 'source'd as well as executed."
 
-if test -f "/usr/share/qubes/marker-vm" ; then
+## Probed once per boot by probe-environment.service. Read with shell
+## builtins only, so logging in does not need to start any process.
+environment_probed=false
+result=""
+qubes=""
+if test -r "/run/vm-config-dist/environment" ; then
+   environment_probed=true
+   while IFS='=' read -r key value ; do
+      case "$key" in
+         virtualizer)
+            result="$value"
+            ;;
+         qubes)
+            qubes="$value"
+            ;;
+      esac
+   done < "/run/vm-config-dist/environment"
+elif test -f "/usr/share/qubes/marker-vm" ; then
+   qubes=true
+fi
+
+if [ "$qubes" = "true" ] ; then
    true "$0: INFO: Running inside Qubes. Stop."
    return 0
    exit 0
 fi
 
-if command -v "systemd-detect-virt" >/dev/null 2>/dev/null ; then
+if [ "$environment_probed" = "true" ] ; then
+   true "$0: INFO: Using virtualizer '$result' probed at boot."
+elif command -v "systemd-detect-virt" >/dev/null 2>/dev/null ; then
    result="$(timeout_wrapper "systemd-detect-virt" 2>&1)" || true
 else
    true "$0: INFO: systemd-detect-virt not executable found. Stop."
@@ -27,51 +27,41 @@
 ## * Unavailable: Set the environment variable.
 ## * Available: Do nothing.
 
-## Package 'mesa-utils' provides 'eglinfo'.
+## Package 'mesa-utils' provides 'eglinfo'. If it is not installed, the
+## renderer is 'unknown' and nothing is done.
 
 #eglinfo | grep -- "OpenGL core profile renderer" | grep -- llvmpipe
 ## example output:
 ## OpenGL core profile renderer: llvmpipe (LLVM 19.1.7, 256 bits)
 
-if ! command -v eglinfo >/dev/null 2>/dev/null ; then
-   true "$0 ERROR: eglinfo not found. Stop."
-   return 0
-   exit 0
+## The renderer is classified by probe-environment, which keeps the list of
+## accelerated renderers. It is probed once per boot by
+## probe-environment-graphics.service, and only probed here if that has not
+## happened or could not tell.
+gl_renderer=""
+if test -r "/run/vm-config-dist/environment" ; then
+   while IFS='=' read -r key value ; do
+      if [ "$key" = "gl_renderer" ]; then
+         gl_renderer="$value"
+      fi
+   done < "/run/vm-config-dist/environment"
 fi
 
-eglinfo_output_temp="$(eglinfo -B 2>/dev/null)" || true
+if [ "$gl_renderer" = "" ] || [ "$gl_renderer" = "unknown" ]; then
+   gl_renderer="$(/usr/libexec/vm-config-dist/probe-environment --print gl_renderer 2>/dev/null)" || true
+fi
 
 ## Manual test.
-#eglinfo_output_temp="OpenGL core profile renderer: NVIDIA"
-
-opengl_core_profile_renderer_temp="$(printf '%s\n' "$eglinfo_output_temp" | grep -- "OpenGL core profile renderer:")" || true
+#gl_renderer="hardware"
 
-if printf '%s\n' "$opengl_core_profile_renderer_temp" | grep --fixed-strings \
-   -e "AMD" \
-   -e "NVIDIA" \
-   -e "Intel" \
-   -e "Apple" \
-   -e "Adreno" \
-   -e "Radeon" \
-   -e "ATI" \
-   -e "Mali" \
-   -e "Panfrost" \
-   -e "V3D" \
-   -e "VC4" \
-   -e "PowerVR" \
-   -e "Vivante" \
-   -e "etnaviv" \
-   -e "Lima" \
-   -e "virgl" \
-   -e "SVGA3D" \
-   -e "D3D12" \
-   >/dev/null 2>/dev/null; then
+if [ "$gl_renderer" = "hardware" ]; then
    true "$0 INFO: accelerated graphics renderer detected. Stop."
    return 0
    exit 0
 fi
 
-if printf '%s\n' "$opengl_core_profile_renderer_temp" | grep -- "llvmpipe" >/dev/null 2>/dev/null; then
+software_rendering_use=""
+if [ "$gl_renderer" = "llvmpipe" ]; then
    software_rendering_use=true
 fi
 
@@ -0,0 +1,800 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+benchmark.py - Latency benchmark for wlr_resize_watcher. Runs the daemon's
+event loop, resize scheduler and sync code against a synthetic
+/sys/class/drm tree, synthetic udev events and a stand-in for wlr-randr
+that records every call and simulates the time a mode change takes.
+
+Usage: python3 -m wlr_resize_watcher.benchmark [scenario ...] [options]
+
+Reports event-to-apply latency percentiles, compositor calls per event, CPU
+time and how many udev events never reach the daemon for each scenario.
+
+With --heap-check, instead feeds a large number of events through the same
+code on a virtual clock, with the compositor kept in memory, and fails if
+the Python heap has grown afterwards.
+"""
+
+import argparse
+import collections
+import contextlib
+import gc
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+from wlr_resize_watcher import wlr_resize_watcher as watcher
+from wlr_resize_watcher.event_loop import EventLoop
+from wlr_resize_watcher.replay import VirtualClockEventLoop
+from wlr_resize_watcher.startup_profile import read_rss
+
+STANDIN_TEMPLATE: str = """#!{python} -I
+import json, sys, time
+state_path = {state_path!r}
+with open(state_path, "r", encoding="utf-8") as state_file:
+    state = json.load(state_file)
+args = sys.argv[1:]
+if args == ["--json"]:
+    json.dump(
+        [
+            {{
+                "name": name,
+                "enabled": True,
+                "modes": [
+                    {{
+                        "width": width,
+                        "height": height,
+                        "refresh": 60.0,
+                        "preferred": True,
+                        "current": True,
+                    }}
+                ],
+                "position": {{"x": 0, "y": 0}},
+                "transform": "normal",
+                "scale": 1.0,
+            }}
+            for name, (width, height) in state.items()
+        ],
+        sys.stdout,
+    )
+    record = "list"
+else:
+    name = None
+    change_list = []
+    for idx, arg in enumerate(args):
+        if arg == "--output":
+            name = args[idx + 1]
+        elif arg == "--custom-mode":
+            change_list.append((name, args[idx + 1].split("@")[0]))
+    if "--dryrun" in args:
+        record = "test"
+    else:
+        time.sleep({apply_latency!r})
+        for name, mode in change_list:
+            width, height = mode.split("x")
+            state[name] = [int(width), int(height)]
+        with open(state_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file)
+        record = " ".join(["set"] + [name for name, _ in change_list])
+with open({log_path!r}, "a", encoding="utf-8") as log_file:
+    log_file.write(f"{{time.monotonic()}} {{record}}\\n")
+"""
+
+
+class FakeUdevDevice:
+    """
+    The parts of pyudev.Device that wlr_resize_watcher uses.
+    """
+
+    __slots__ = ("sys_path", "action", "properties", "device_type")
+
+    def __init__(
+        self,
+        sys_path: str,
+        action: str,
+        properties: dict[str, str],
+        device_type: str = "drm_minor",
+    ) -> None:
+        self.sys_path: str = sys_path
+        self.action: str = action
+        self.properties: dict[str, str] = properties
+        self.device_type: str = device_type
+
+
+class FakeUdevMonitor:
+    """
+    The parts of pyudev.Monitor that wlr_resize_watcher uses. A pipe makes
+    injected events visible to the event loop. Events not matching the
+    device type filter are counted and dropped, like the kernel does with
+    libudev's socket filter.
+    """
+
+    def __init__(self) -> None:
+        self.queue: collections.deque[FakeUdevDevice] = collections.deque()
+        self.read_fd, self.write_fd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.device_type: str | None = None
+        self.filtered_count: int = 0
+        self.delivered_count: int = 0
+
+    def fileno(self) -> int:
+        """
+        Returns the file descriptor that becomes readable on new events.
+        """
+
+        return self.read_fd
+
+    # pylint: disable=unused-argument
+    def filter_by(
+        self, subsystem: str, device_type: str | None = None
+    ) -> None:
+        """
+        Sets the device type filter. All events are DRM events already.
+        """
+
+        self.device_type = device_type
+
+    def inject(self, device: FakeUdevDevice) -> None:
+        """
+        Queues an event for the daemon to read, unless it is filtered out.
+        """
+
+        if (
+            self.device_type is not None
+            and device.device_type != self.device_type
+        ):
+            self.filtered_count += 1
+            return
+        self.delivered_count += 1
+        self.queue.append(device)
+        os.write(self.write_fd, b"\0")
+
+    # pylint: disable=unused-argument
+    def poll(self, timeout: float | None = None) -> FakeUdevDevice | None:
+        """
+        Returns the next queued event, or None.
+        """
+
+        try:
+            os.read(self.read_fd, 4096)
+        except BlockingIOError:
+            pass
+        if not self.queue:
+            return None
+        return self.queue.popleft()
+
+    def close(self) -> None:
+        """
+        Closes the pipe.
+        """
+
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+class FakeHead:
+    """
+    A connector in the synthetic sysfs tree.
+    """
+
+    __slots__ = ("card_name", "name", "connector_id")
+
+    def __init__(self, card_name: str, name: str, connector_id: int) -> None:
+        self.card_name: str = card_name
+        self.name: str = name
+        self.connector_id: int = connector_id
+
+
+class BenchEvent:
+    """
+    A scheduled synthetic hotplug event. All listed heads change to the
+    given mode. connector_id is put into the event if set, like the kernel
+    does for single-connector hotplug events.
+    """
+
+    __slots__ = ("offset", "head_list", "mode", "connector_id")
+
+    def __init__(
+        self,
+        offset: float,
+        head_list: list[FakeHead],
+        mode: str,
+        connector_id: int | None,
+    ) -> None:
+        self.offset: float = offset
+        self.head_list: list[FakeHead] = head_list
+        self.mode: str = mode
+        self.connector_id: int | None = connector_id
+
+
+class Scenario:
+    """
+    A named set of heads and events to replay against the daemon.
+    """
+
+    __slots__ = ("name", "head_list", "event_list")
+
+    def __init__(
+        self,
+        name: str,
+        head_list: list[FakeHead],
+        event_list: list[BenchEvent],
+    ) -> None:
+        self.name: str = name
+        self.head_list: list[FakeHead] = head_list
+        self.event_list: list[BenchEvent] = event_list
+
+
+def build_hotplug_scenario(args: argparse.Namespace) -> Scenario:
+    """
+    Single hotplug events on one connector, far enough apart to be handled
+    one at a time.
+    """
+
+    head: FakeHead = FakeHead("card0", "Virtual-1", 33)
+    event_list: list[BenchEvent] = [
+        BenchEvent(
+            0.1 + idx * args.hotplug_interval,
+            [head],
+            f"{1280 + (idx % 2) * 320}x{800 + (idx % 2) * 200}",
+            head.connector_id,
+        )
+        for idx in range(args.hotplug_count)
+    ]
+    return Scenario("hotplug", [head], event_list)
+
+
+def build_drag_scenario(args: argparse.Namespace) -> Scenario:
+    """
+    A VM window being resized by dragging its border, which makes the
+    hypervisor report a new size at a high rate.
+    """
+
+    head: FakeHead = FakeHead("card0", "Virtual-1", 33)
+    count: int = max(1, round(args.drag_rate * args.drag_duration))
+    event_list: list[BenchEvent] = [
+        BenchEvent(
+            0.1 + idx / args.drag_rate,
+            [head],
+            f"{1024 + idx * 8}x{768 + idx * 4}",
+            head.connector_id,
+        )
+        for idx in range(count)
+    ]
+    return Scenario("drag", [head], event_list)
+
+
+def build_multihead_scenario(args: argparse.Namespace) -> Scenario:
+    """
+    Many heads on one card changing at the same time, reported by a single
+    event without a connector, like a multi-monitor layout change.
+    """
+
+    head_list: list[FakeHead] = [
+        FakeHead("card0", f"Virtual-{idx + 1}", 33 + idx)
+        for idx in range(args.heads)
+    ]
+    event_list: list[BenchEvent] = [
+        BenchEvent(
+            0.1 + idx * args.hotplug_interval,
+            head_list,
+            f"{1280 + (idx % 2) * 320}x{800 + (idx % 2) * 200}",
+            None,
+        )
+        for idx in range(args.multihead_count)
+    ]
+    return Scenario("multihead", head_list, event_list)
+
+
+SCENARIO_BUILDER_MAP: dict[str, Callable[[argparse.Namespace], Scenario]] = {
+    "hotplug": build_hotplug_scenario,
+    "drag": build_drag_scenario,
+    "multihead": build_multihead_scenario,
+}
+
+
+class MemoryBackend(watcher.CompositorBackend):
+    """
+    Compositor stand-in that keeps the display modes in memory, for runs
+    with too many events to spawn a process for every call.
+    """
+
+    def __init__(self, head_list: list[FakeHead], mode: str) -> None:
+        self.mode_map: dict[str, str] = {x.name: mode for x in head_list}
+
+    def get_disp_list(self) -> list[watcher.DisplayInfo] | None:
+        return [watcher.DisplayInfo(x, y) for x, y in self.mode_map.items()]
+
+    def apply_layout(
+        self, target_list: list[watcher.DisplayTarget], test_only: bool
+    ) -> bool:
+        if not test_only:
+            for target in target_list:
+                if target.disp_mode is not None:
+                    self.mode_map[target.disp_name] = target.disp_mode
+        return True
+
+
+def write_modes(drm_path: Path, head: FakeHead, mode: str) -> None:
+    """
+    Makes mode the native mode of a connector in the synthetic sysfs tree.
+    """
+
+    conn_path: Path = (
+        drm_path / head.card_name / (f"{head.card_name}-{head.name}")
+    )
+    conn_path.mkdir(parents=True, exist_ok=True)
+    (conn_path / "connector_id").write_text(f"{head.connector_id}\n")
+    (conn_path / "status").write_text("connected\n")
+    (conn_path / "modes").write_text(f"{mode}\n1024x768\n800x600\n")
+
+
+def percentile(value_list: list[float], pct: float) -> float:
+    """
+    Returns the given percentile (nearest rank) of a sorted list.
+    """
+
+    if not value_list:
+        return math.nan
+    return value_list[max(0, math.ceil(pct / 100 * len(value_list)) - 1)]
+
+
+def cpu_seconds(who: int) -> float:
+    """
+    Returns the user plus system CPU time used so far.
+    """
+
+    usage: resource.struct_rusage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+# pylint: disable=too-many-locals
+def run_scenario(
+    scenario: Scenario, args: argparse.Namespace, work_path: Path
+) -> dict[str, Any]:
+    """
+    Replays a scenario against the daemon's event handling code and returns
+    its measurements.
+    """
+
+    drm_path: Path = work_path / "drm"
+    state_path: Path = work_path / "wlr-randr-state.json"
+    log_path: Path = work_path / "wlr-randr-calls.log"
+    standin_path: Path = work_path / "wlr-randr"
+
+    initial_mode: str = "1024x768"
+    for head in scenario.head_list:
+        write_modes(drm_path, head, initial_mode)
+    state_path.write_text(
+        json.dumps({x.name: [1024, 768] for x in scenario.head_list})
+    )
+    log_path.write_text("")
+    standin_path.write_text(
+        STANDIN_TEMPLATE.format(
+            python=sys.executable,
+            state_path=str(state_path),
+            log_path=str(log_path),
+            apply_latency=args.apply_latency_ms / 1000,
+        )
+    )
+    standin_path.chmod(0o755)
+
+    watcher.apply_config(
+        dict(
+            watcher.GlobalData.conf_defaults,
+            normal_wait_proc_list=[],
+            sysmaint_wait_proc_list=[],
+            compositor_backend="wlr-randr",
+            resize_settle_time_ms=args.settle_time_ms,
+            resize_max_delay_ms=args.max_delay_ms,
+            ## Don't touch the user's display snapshot.
+            enable_warm_start=False,
+        )
+    )
+    watcher.GlobalData.virtualizer_str = "kvm"
+    watcher.GlobalData.resize_helper_present = True
+    watcher.GlobalData.drm_path = drm_path
+    watcher.GlobalData.wlr_randr_path = str(standin_path)
+    watcher.GlobalData.active_backend = watcher.WlrRandrBackend()
+    watcher.GlobalData.drm_topology = watcher.DrmTopology(drm_path)
+    watcher.GlobalData.drm_topology.rescan_all()
+    watcher.GlobalData.reconciler = watcher.Reconciler()
+    watcher.GlobalData.output_index = watcher.OutputIndex()
+    watcher.GlobalData.resize_scheduler = watcher.ResizeScheduler(
+        watcher.GlobalData.drm_topology,
+        args.settle_time_ms / 1000,
+        args.max_delay_ms / 1000,
+    )
+    watcher.GlobalData.resize_check_timer = None
+    event_loop: EventLoop = EventLoop()
+    watcher.GlobalData.event_loop = event_loop
+    udev_monitor: FakeUdevMonitor = FakeUdevMonitor()
+    watcher.subscribe_udev_monitor(udev_monitor)
+    watcher.GlobalData.udev_monitor = udev_monitor
+    event_loop.add_reader(udev_monitor, watcher.handle_udev_events)
+
+    ## (inject time, head name) for every head changed by every event.
+    inject_list: list[tuple[float, str]] = []
+
+    def make_injector(bench_event: BenchEvent) -> Callable[[], None]:
+        def inject() -> None:
+            for head in bench_event.head_list:
+                write_modes(drm_path, head, bench_event.mode)
+            properties: dict[str, str] = {"HOTPLUG": "1"}
+            if bench_event.connector_id is not None:
+                properties["CONNECTOR"] = str(bench_event.connector_id)
+            now: float = time.monotonic()
+            inject_list.extend((now, x.name) for x in bench_event.head_list)
+            card_path: Path = drm_path / bench_event.head_list[0].card_name
+            udev_monitor.inject(
+                FakeUdevDevice(str(card_path), "change", properties)
+            )
+            ## Events that don't concern the displays, which drivers and
+            ## compositors cause along with hotplug events: connector
+            ## property changes and render node changes.
+            for idx in range(args.noise_events):
+                if idx % 2 == 0:
+                    head: FakeHead = bench_event.head_list[0]
+                    udev_monitor.inject(
+                        FakeUdevDevice(
+                            str(card_path / f"{head.card_name}-{head.name}"),
+                            "change",
+                            {},
+                            "drm_connector",
+                        )
+                    )
+                else:
+                    udev_monitor.inject(
+                        FakeUdevDevice(
+                            str(drm_path / "renderD128"), "change", {}
+                        )
+                    )
+
+        return inject
+
+    for bench_event in scenario.event_list:
+        event_loop.call_later(bench_event.offset, make_injector(bench_event))
+    last_offset: float = max(x.offset for x in scenario.event_list)
+
+    cpu_self_start: float = cpu_seconds(resource.RUSAGE_SELF)
+    cpu_children_start: float = cpu_seconds(resource.RUSAGE_CHILDREN)
+    start_time: float = time.monotonic()
+    deadline: float = start_time + last_offset + args.timeout
+    expected_inject_count: int = sum(
+        len(x.head_list) for x in scenario.event_list
+    )
+    while time.monotonic() < deadline:
+        event_loop.run_once()
+        ## Done once every event has been injected and read, and nothing is
+        ## pending in the scheduler anymore.
+        if (
+            len(inject_list) == expected_inject_count
+            and not udev_monitor.queue
+            and watcher.GlobalData.resize_scheduler.next_timeout(
+                time.monotonic()
+            )
+            is None
+        ):
+            break
+    cpu_self: float = cpu_seconds(resource.RUSAGE_SELF) - cpu_self_start
+    cpu_children: float = (
+        cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_children_start
+    )
+    udev_monitor.close()
+
+    call_count: int = 0
+    apply_map: dict[str, list[float]] = {}
+    with open(log_path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            stamp_str, operation, *disp_name_list = line.split()
+            call_count += 1
+            if operation != "set":
+                continue
+            for disp_name in disp_name_list:
+                apply_map.setdefault(disp_name, []).append(float(stamp_str))
+
+    ## Every event is considered handled by the first mode change of its
+    ## head after it arrived. During a drag, many events share one apply.
+    latency_list: list[float] = []
+    missed_count: int = 0
+    for inject_time, disp_name in inject_list:
+        apply_time: float | None = next(
+            (x for x in apply_map.get(disp_name, []) if x >= inject_time),
+            None,
+        )
+        if apply_time is None:
+            missed_count += 1
+            continue
+        latency_list.append(apply_time - inject_time)
+    latency_list.sort()
+
+    return {
+        "scenario": scenario.name,
+        "events": len(scenario.event_list),
+        "applies": sum(len(x) for x in apply_map.values()),
+        "missed": missed_count,
+        "calls_per_event": call_count / len(scenario.event_list),
+        "udev_events": udev_monitor.delivered_count
+        + udev_monitor.filtered_count,
+        "udev_filtered": udev_monitor.filtered_count,
+        "p50_ms": percentile(latency_list, 50) * 1000,
+        "p95_ms": percentile(latency_list, 95) * 1000,
+        "p99_ms": percentile(latency_list, 99) * 1000,
+        "cpu_self_ms": cpu_self * 1000,
+        "cpu_children_ms": cpu_children * 1000,
+    }
+
+
+def run_heap_check(
+    args: argparse.Namespace, work_path: Path
+) -> dict[str, Any]:
+    """
+    Feeds args.heap_events hotplug events, each handled to completion,
+    through the daemon's event handling code, and measures how much the
+    Python heap has grown afterwards. A number of events are handled before
+    measuring starts, so that caches and lazily imported modules are
+    already filled.
+    """
+
+    drm_path: Path = work_path / "drm"
+    head: FakeHead = FakeHead("card0", "Virtual-1", 33)
+    write_modes(drm_path, head, "1024x768")
+    watcher.apply_config(
+        dict(
+            watcher.GlobalData.conf_defaults,
+            normal_wait_proc_list=[],
+            sysmaint_wait_proc_list=[],
+            enable_warm_start=False,
+        )
+    )
+    watcher.GlobalData.virtualizer_str = "kvm"
+    watcher.GlobalData.resize_helper_present = True
+    watcher.GlobalData.drm_path = drm_path
+    watcher.GlobalData.active_backend = MemoryBackend([head], "1024x768")
+    watcher.GlobalData.drm_topology = watcher.DrmTopology(drm_path)
+    watcher.GlobalData.drm_topology.rescan_all()
+    watcher.GlobalData.reconciler = watcher.Reconciler()
+    watcher.GlobalData.output_index = watcher.OutputIndex()
+    watcher.GlobalData.resize_scheduler = watcher.ResizeScheduler(
+        watcher.GlobalData.drm_topology,
+        args.settle_time_ms / 1000,
+        args.max_delay_ms / 1000,
+    )
+    watcher.GlobalData.resize_check_timer = None
+    event_loop: VirtualClockEventLoop = VirtualClockEventLoop()
+    watcher.GlobalData.event_loop = event_loop
+    udev_monitor: FakeUdevMonitor = FakeUdevMonitor()
+    watcher.subscribe_udev_monitor(udev_monitor)
+    watcher.GlobalData.udev_monitor = udev_monitor
+    card_path: str = str(drm_path / head.card_name)
+    mode_list: list[str] = ["1280x800", "1600x900", "1920x1080", "1024x768"]
+
+    def handle_event(idx: int) -> None:
+        write_modes(drm_path, head, mode_list[idx % len(mode_list)])
+        udev_monitor.inject(
+            FakeUdevDevice(
+                card_path,
+                "change",
+                {"HOTPLUG": "1", "CONNECTOR": str(head.connector_id)},
+            )
+        )
+        watcher.handle_udev_events()
+        while event_loop.has_timers():
+            event_loop.run_once()
+
+    for idx in range(args.heap_warmup_events):
+        handle_event(idx)
+    gc.collect()
+    tracemalloc.start()
+    baseline: int = tracemalloc.get_traced_memory()[0]
+    for idx in range(args.heap_events):
+        handle_event(idx)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    udev_monitor.close()
+
+    return {
+        "events": args.heap_events,
+        "heap_growth_bytes": current - baseline,
+        "heap_peak_bytes": peak - baseline,
+        "rss_bytes": read_rss(),
+        "final_mode": watcher.GlobalData.active_backend.mode_map[head.name],
+    }
+
+
+def print_report(result_list: list[dict[str, Any]]) -> None:
+    """
+    Prints the results as a table.
+    """
+
+    print(
+        f"{'scenario':<10} {'events':>6} {'applies':>7} {'missed':>6} "
+        f"{'calls/ev':>8} {'udev ev':>7} {'filtered':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'cpu ms':>8} {'child ms':>8}"
+    )
+    for result in result_list:
+        print(
+            f"{result['scenario']:<10} {result['events']:>6} "
+            f"{result['applies']:>7} {result['missed']:>6} "
+            f"{result['calls_per_event']:>8.2f} "
+            f"{result['udev_events']:>7} {result['udev_filtered']:>8} "
+            f"{result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+            f"{result['cpu_self_ms']:>8.1f} "
+            f"{result['cpu_children_ms']:>8.1f}"
+        )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Parses command line arguments, argv if given, otherwise sys.argv.
+    """
+
+    arg_parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="python3 -m wlr_resize_watcher.benchmark",
+        description="Measures how long wlr_resize_watcher takes from a DRM "
+        "hotplug event to the compositor running at the new mode.",
+    )
+    arg_parser.add_argument(
+        "scenario",
+        nargs="*",
+        help="scenarios to run: "
+        f"{', '.join(SCENARIO_BUILDER_MAP)} (default: all)",
+    )
+    arg_parser.add_argument("--hotplug-count", type=int, default=10)
+    arg_parser.add_argument(
+        "--hotplug-interval",
+        type=float,
+        default=0.5,
+        help="seconds between events in the hotplug and multihead scenarios",
+    )
+    arg_parser.add_argument(
+        "--drag-rate", type=float, default=50.0, help="events per second"
+    )
+    arg_parser.add_argument(
+        "--drag-duration", type=float, default=2.0, help="seconds"
+    )
+    arg_parser.add_argument("--heads", type=int, default=16)
+    arg_parser.add_argument(
+        "--noise-events",
+        type=int,
+        default=2,
+        help="unrelated DRM events sent along with every hotplug event",
+    )
+    arg_parser.add_argument("--multihead-count", type=int, default=5)
+    arg_parser.add_argument(
+        "--apply-latency-ms",
+        type=float,
+        default=5.0,
+        help="time the wlr-randr stand-in takes to change a mode",
+    )
+    arg_parser.add_argument(
+        "--settle-time-ms",
+        type=int,
+        default=watcher.GlobalData.conf_defaults["resize_settle_time_ms"],
+    )
+    arg_parser.add_argument(
+        "--max-delay-ms",
+        type=int,
+        default=watcher.GlobalData.conf_defaults["resize_max_delay_ms"],
+    )
+    arg_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="seconds to wait for pending resizes after the last event",
+    )
+    arg_parser.add_argument(
+        "--heap-check",
+        action="store_true",
+        help="check that handling many events does not grow the heap, "
+        "instead of running scenarios",
+    )
+    arg_parser.add_argument("--heap-events", type=int, default=10000)
+    arg_parser.add_argument("--heap-warmup-events", type=int, default=1000)
+    ## The interpreter's own buffers and caches still grow by a few KiB
+    ## after warm-up. A leak of a single object per event exceeds this.
+    arg_parser.add_argument(
+        "--heap-growth-limit-kib",
+        type=int,
+        default=64,
+        help="largest heap growth the heap check tolerates",
+    )
+    arg_parser.add_argument(
+        "--json", action="store_true", help="print results as JSON"
+    )
+    arg_parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="show the daemon's log output",
+    )
+    args: argparse.Namespace = arg_parser.parse_args(argv)
+    for scenario_name in args.scenario:
+        if scenario_name not in SCENARIO_BUILDER_MAP:
+            arg_parser.error(f"unknown scenario: {scenario_name!r}")
+    return args
+
+
+def main() -> None:
+    """
+    Main function.
+    """
+
+    args: argparse.Namespace = parse_args()
+    if args.heap_check:
+        with tempfile.TemporaryDirectory(
+            prefix="wlr-resize-watcher-bench."
+        ) as work_dir:
+            with contextlib.ExitStack() as exit_stack:
+                if not args.verbose:
+                    exit_stack.enter_context(
+                        contextlib.redirect_stderr(
+                            exit_stack.enter_context(
+                                open(os.devnull, "w", encoding="utf-8")
+                            )
+                        )
+                    )
+                heap_result: dict[str, Any] = run_heap_check(
+                    args, Path(work_dir)
+                )
+        if args.json:
+            print(json.dumps(heap_result, indent=2))
+        else:
+            print(
+                f"{heap_result['events']} events: heap grew by "
+                f"{heap_result['heap_growth_bytes']} bytes, peaked "
+                f"{heap_result['heap_peak_bytes']} bytes above the start, "
+                f"RSS {heap_result['rss_bytes']} bytes"
+            )
+        if (
+            heap_result["heap_growth_bytes"]
+            > args.heap_growth_limit_kib * 1024
+        ):
+            print(
+                "FAIL: heap grew by more than "
+                f"{args.heap_growth_limit_kib} KiB",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        return
+    scenario_name_list: list[str] = args.scenario or list(SCENARIO_BUILDER_MAP)
+    result_list: list[dict[str, Any]] = []
+    for scenario_name in scenario_name_list:
+        scenario: Scenario = SCENARIO_BUILDER_MAP[scenario_name](args)
+        with tempfile.TemporaryDirectory(
+            prefix="wlr-resize-watcher-bench."
+        ) as work_dir:
+            with contextlib.ExitStack() as exit_stack:
+                if not args.verbose:
+                    exit_stack.enter_context(
+                        contextlib.redirect_stderr(
+                            exit_stack.enter_context(
+                                open(os.devnull, "w", encoding="utf-8")
+                            )
+                        )
+                    )
+                result_list.append(
+                    run_scenario(scenario, args, Path(work_dir))
+                )
+
+    if args.json:
+        print(json.dumps(result_list, indent=2))
+    else:
+        print_report(result_list)
+
+
+if __name__ == "__main__":
+    main()
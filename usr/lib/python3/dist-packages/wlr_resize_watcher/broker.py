@@ -0,0 +1,322 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+broker.py - Transport between the resize broker, a single system-wide
+wlr_resize_watcher instance that watches udev and the DRM connectors for
+all graphical sessions, and the per-session instances that only apply the
+result to their own compositor.
+
+The broker listens on a Unix stream socket. Messages are JSON objects, one
+per line, and are only ever sent by the broker: the full state right after
+a client connects, and again every time a card's displays have changed.
+Clients never send anything.
+
+Any local user may connect. A client only learns which modes the
+displays offer, which /sys/class/drm shows to everyone anyway, and
+whatever it sends is discarded, so connecting gives no control over the
+displays. The other way round, the broker decides the display modes of
+every session that uses it, so clients only accept a broker that runs as
+root.
+"""
+
+import errno
+import json
+import os
+import select
+import socket
+import stat
+import struct
+import time
+from pathlib import Path
+from typing import Any
+
+from wlr_resize_watcher import sd_notify
+
+PROTOCOL_VERSION: int = 1
+SOCKET_PATH: Path = Path("/run/wlr-resize-watcher/broker.sock")
+
+
+def parse_message(line: bytes) -> dict[str, Any] | None:
+    """
+    Decodes one message. Returns None if it is malformed or was sent by a
+    broker speaking a different protocol version.
+    """
+
+    try:
+        message: Any = json.loads(line)
+    except ValueError:
+        return None
+    if (
+        not isinstance(message, dict)
+        or message.get("version") != PROTOCOL_VERSION
+    ):
+        return None
+    return message
+
+
+class ClientQueue:
+    """
+    Output of the broker to one client. Client sockets are non-blocking, so
+    a client that does not read cannot stall the broker. What it cannot
+    take right away is kept in out_buf, and only the newest message that
+    has not been started yet is kept in queued_message, as every message
+    holds the full state.
+    """
+
+    __slots__ = ("out_buf", "queued_message")
+
+    def __init__(self) -> None:
+        self.out_buf: bytes = b""
+        self.queued_message: dict[str, Any] | None = None
+
+
+class BrokerServer:
+    """
+    The broker's listening socket and its connected clients.
+    """
+
+    def __init__(self, listen_sock: socket.socket) -> None:
+        self.listen_sock: socket.socket = listen_sock
+        self.listen_sock.setblocking(False)
+        self.client_map: dict[socket.socket, ClientQueue] = {}
+
+    def fileno(self) -> int:
+        """
+        Returns the listening socket's file descriptor, for the event loop.
+        """
+
+        return self.listen_sock.fileno()
+
+    def accept(self) -> socket.socket | None:
+        """
+        Accepts a pending connection, or returns None if there is none.
+        """
+
+        try:
+            client_sock, _ = self.listen_sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return None
+        client_sock.setblocking(False)
+        self.client_map[client_sock] = ClientQueue()
+        return client_sock
+
+    def send(
+        self, client_sock: socket.socket, message: dict[str, Any]
+    ) -> bool:
+        """
+        Sends a message to one client, or queues it if the client is not
+        reading fast enough, replacing any message queued before. Returns
+        False if sending failed, in which case the client should be
+        dropped.
+        """
+
+        client_queue: ClientQueue = self.client_map[client_sock]
+        if client_queue.out_buf:
+            queued_message: dict[str, Any] | None = client_queue.queued_message
+            if queued_message is not None and (
+                queued_message.get("changed_card")
+                != message.get("changed_card")
+            ):
+                ## Changes of different cards have been merged, the client
+                ## has to check all of them.
+                message = {**message, "changed_card": None}
+            client_queue.queued_message = message
+            return True
+        client_queue.out_buf = json.dumps(message).encode("utf-8") + b"\n"
+        return self.flush(client_sock)
+
+    def flush(self, client_sock: socket.socket) -> bool:
+        """
+        Sends as much of the output for a client as it takes without
+        blocking. Returns False if sending failed, in which case the client
+        should be dropped.
+        """
+
+        client_queue: ClientQueue = self.client_map[client_sock]
+        while client_queue.out_buf:
+            try:
+                sent_count: int = client_sock.send(
+                    client_queue.out_buf, socket.MSG_NOSIGNAL
+                )
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError:
+                return False
+            client_queue.out_buf = client_queue.out_buf[sent_count:]
+            if not client_queue.out_buf and client_queue.queued_message:
+                client_queue.out_buf = (
+                    json.dumps(client_queue.queued_message).encode("utf-8")
+                    + b"\n"
+                )
+                client_queue.queued_message = None
+        return True
+
+    def is_stalled(self, client_sock: socket.socket) -> bool:
+        """
+        Returns True if output for a client is waiting for it to become
+        writable.
+        """
+
+        return self.client_map[client_sock].out_buf != b""
+
+    def publish(self, message: dict[str, Any]) -> list[socket.socket]:
+        """
+        Sends a message to all clients. Returns the clients it could not be
+        sent to, which should be dropped.
+        """
+
+        return [x for x in self.client_map if not self.send(x, message)]
+
+    def is_connected(self, client_sock: socket.socket) -> bool:
+        """
+        Called when a client's socket becomes readable. Since clients never
+        send anything, this normally means the client has disconnected.
+        Anything it did send is discarded.
+        """
+
+        try:
+            return client_sock.recv(4096, socket.MSG_DONTWAIT) != b""
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+
+    def drop(self, client_sock: socket.socket) -> None:
+        """
+        Disconnects a client.
+        """
+
+        self.client_map.pop(client_sock, None)
+        client_sock.close()
+
+
+def get_peer_uid(sock: socket.socket) -> int:
+    """
+    Returns the user ID of the process at the other end of a connected Unix
+    socket. Raises OSError on failure.
+    """
+
+    cred: bytes = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    return struct.unpack("3i", cred)[1]
+
+
+def open_server_socket(path: Path) -> socket.socket:
+    """
+    Returns the broker's listening socket: the one passed by systemd socket
+    activation if there is one, or a new one bound to path otherwise.
+    Raises OSError on failure.
+    """
+
+    fd_list: list[int] = sd_notify.listen_fds()
+    if fd_list:
+        return socket.socket(fileno=fd_list[0])
+    path.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+    ## Only a stale socket is removed, never anything else found at path.
+    try:
+        if not stat.S_ISSOCK(path.lstat().st_mode):
+            raise FileExistsError(errno.EEXIST, "Not a socket", str(path))
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    listen_sock: socket.socket = socket.socket(
+        socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC
+    )
+    listen_sock.bind(str(path))
+    ## Every session's watcher may connect, see the module docstring.
+    os.chmod(path, 0o666)
+    listen_sock.listen()
+    return listen_sock
+
+
+class BrokerClient:
+    """
+    A per-session watcher's connection to the broker.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Connects to the broker. Raises OSError on failure.
+        """
+
+        self.sock: socket.socket = socket.socket(
+            socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC
+        )
+        try:
+            self.sock.connect(str(path))
+            if get_peer_uid(self.sock) != 0:
+                raise PermissionError(
+                    errno.EPERM,
+                    "Resize broker does not run as root",
+                    str(path),
+                )
+        except OSError:
+            self.sock.close()
+            raise
+        self.sock.setblocking(False)
+        self.read_buf: bytes = b""
+        ## Messages that arrived along with the one wait_message() returned.
+        self.pending_list: list[dict[str, Any]] = []
+
+    def fileno(self) -> int:
+        """
+        Returns the socket's file descriptor, for the event loop.
+        """
+
+        return self.sock.fileno()
+
+    def read_messages(self) -> list[dict[str, Any]] | None:
+        """
+        Reads all complete messages that have arrived. Returns None if the
+        broker has closed the connection or sent a message this client does
+        not understand.
+        """
+
+        out_list: list[dict[str, Any]] = self.pending_list
+        self.pending_list = []
+        try:
+            data: bytes = self.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return out_list
+        except OSError:
+            return None
+        if data == b"":
+            return None
+        line_list: list[bytes] = (self.read_buf + data).split(b"\n")
+        self.read_buf = line_list.pop()
+        for line in line_list:
+            message: dict[str, Any] | None = parse_message(line)
+            if message is None:
+                return None
+            out_list.append(message)
+        return out_list
+
+    def wait_message(self, timeout: float) -> dict[str, Any] | None:
+        """
+        Waits up to timeout seconds for the next message. Returns None if
+        none arrived in time or the connection is unusable.
+        """
+
+        deadline: float = time.monotonic() + timeout
+        while True:
+            remaining_time: float = deadline - time.monotonic()
+            if remaining_time <= 0:
+                return None
+            select.select([self.sock], [], [], remaining_time)
+            message_list: list[dict[str, Any]] | None = self.read_messages()
+            if message_list is None:
+                return None
+            if message_list:
+                self.pending_list = message_list[1:]
+                return message_list[0]
+
+    def close(self) -> None:
+        """
+        Disconnects from the broker.
+        """
+
+        self.sock.close()
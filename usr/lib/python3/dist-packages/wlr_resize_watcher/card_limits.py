@@ -0,0 +1,143 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+card_limits.py - Works out which display modes a graphics card can drive.
+The emulated graphics cards of virtual machines (QEMU's stdvga, VirtualBox's
+VMSVGA, Xen's emulated VGA, ...) scan out from a small, dedicated video
+memory. If the compositor's framebuffers for all displays do not fit into
+it, allocating them fails, and the graphical session crashes or hangs.
+"""
+
+from pathlib import Path
+
+## Drivers of emulated graphics cards that keep framebuffers in the card's
+## video memory. Cards with other drivers, e.g. virtio-gpu, use system
+## memory and are only limited by the KMS maximum framebuffer size.
+VRAM_DRIVER_SET: set[str] = {
+    "bochs",
+    "bochs-drm",
+    "cirrus",
+    "cirrus-qemu",
+    "qxl",
+    "vboxvideo",
+    "vmwgfx",
+}
+BYTES_PER_PIXEL: int = 4
+## From include/linux/ioport.h.
+IORESOURCE_MEM: int = 0x00000200
+IORESOURCE_PREFETCH: int = 0x00002000
+
+
+class CardLimits:
+    """
+    What a card can drive. vram_size is the size of its video memory in
+    bytes, 0 if framebuffers do not live in video memory or the size is
+    unknown. max_width and max_height are the largest framebuffer size KMS
+    reports, 0 if unknown.
+    """
+
+    __slots__ = ("vram_size", "max_width", "max_height")
+
+    def __init__(
+        self, vram_size: int, max_width: int = 0, max_height: int = 0
+    ) -> None:
+        self.vram_size: int = vram_size
+        self.max_width: int = max_width
+        self.max_height: int = max_height
+
+    def is_limited(self) -> bool:
+        """
+        Returns True if any limit is known.
+        """
+
+        return (
+            self.vram_size != 0 or self.max_width != 0 or self.max_height != 0
+        )
+
+    def fits(
+        self, width: int, height: int, output_count: int, buffer_count: int
+    ) -> bool:
+        """
+        Checks whether a mode of the given size fits, if each of
+        output_count displays on the card uses buffer_count framebuffers of
+        that size. A buffer_count of 0 disables the video memory check.
+        """
+
+        if (self.max_width != 0 and width > self.max_width) or (
+            self.max_height != 0 and height > self.max_height
+        ):
+            return False
+        return (
+            self.vram_size == 0
+            or width * height * BYTES_PER_PIXEL * buffer_count * output_count
+            <= self.vram_size
+        )
+
+
+def read_vram_size(card_path: Path) -> int:
+    """
+    Returns the size in bytes of the video memory framebuffers of a card are
+    kept in, read from the card's PCI memory regions in sysfs. Returns 0 if
+    the card's driver does not keep framebuffers there, or the size cannot
+    be read.
+    """
+
+    device_path: Path = card_path / "device"
+    try:
+        driver_name: str = (device_path / "driver").resolve(strict=True).name
+        if driver_name not in VRAM_DRIVER_SET:
+            return 0
+        resource_str: str = (device_path / "resource").read_text(
+            encoding="utf-8"
+        )
+    except OSError:
+        return 0
+    ## One line per region, "start end flags" in hexadecimal. The video
+    ## memory is the largest prefetchable memory region.
+    vram_size: int = 0
+    for line in resource_str.splitlines():
+        field_list: list[str] = line.split()
+        if len(field_list) != 3:
+            continue
+        try:
+            start, end, flags = (int(x, 16) for x in field_list)
+        except ValueError:
+            continue
+        if (
+            end > start
+            and flags & IORESOURCE_MEM
+            and flags & IORESOURCE_PREFETCH
+        ):
+            vram_size = max(vram_size, end - start + 1)
+    return vram_size
+
+
+def pick_fitting_mode(
+    mode_list: list[tuple[int, int, int]],
+    limits: CardLimits,
+    output_count: int,
+    buffer_count: int,
+) -> tuple[int, int, int]:
+    """
+    Returns the largest (width, height, refresh) mode from a non-empty
+    mode_list that fits within limits, preferring the earliest one among
+    modes of the same size. If none fits, the smallest one is returned.
+    """
+
+    best_mode: tuple[int, int, int] | None = None
+    for mode in mode_list:
+        if not limits.fits(mode[0], mode[1], output_count, buffer_count):
+            continue
+        if (
+            best_mode is None
+            or mode[0] * mode[1] > best_mode[0] * best_mode[1]
+        ):
+            best_mode = mode
+    if best_mode is None:
+        return min(mode_list, key=lambda x: x[0] * x[1])
+    return best_mode
@@ -0,0 +1,111 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+config_cache.py - Caches the merged and validated configuration of
+wlr_resize_watcher, so it does not need to be parsed and validated again as
+long as no configuration file has changed.
+
+The cache is keyed on the listing of the configuration directories, with
+the modification time, size and inode number of every entry, and on the
+same information for the code that parses the configuration.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+CACHE_VERSION: int = 1
+CACHE_FILE_NAME: str = "config-cache.json"
+## Written by configure-dynamic-resolution (as root), readable by everyone.
+SYSTEM_CACHE_DIR: Path = Path("/run/wlr-resize-watcher")
+
+
+def _stat_key(path: str) -> list[Any]:
+    try:
+        stat_result: os.stat_result = os.stat(path)
+    except FileNotFoundError:
+        return [path, None]
+    return [
+        path,
+        stat_result.st_mtime_ns,
+        stat_result.st_size,
+        stat_result.st_ino,
+    ]
+
+
+def compute_cache_key(
+    conf_dir_list: list[str], code_path_list: list[str]
+) -> list[Any]:
+    """
+    Returns the cache key for the current state of the configuration
+    directories and of the files in code_path_list. Any change to a
+    configuration file, including adding or removing one, changes the key.
+    """
+
+    key: list[Any] = [CACHE_VERSION]
+    for conf_dir in conf_dir_list:
+        key.append(_stat_key(conf_dir))
+        try:
+            entry_name_list: list[str] = sorted(os.listdir(conf_dir))
+        except FileNotFoundError:
+            continue
+        for entry_name in entry_name_list:
+            key.append(_stat_key(os.path.join(conf_dir, entry_name)))
+    for code_path in code_path_list:
+        key.append(_stat_key(code_path))
+    return key
+
+
+def get_user_cache_path() -> Path | None:
+    """
+    Returns the path of the cache written by wlr_resize_watcher itself, or
+    None if XDG_RUNTIME_DIR is not set.
+    """
+
+    runtime_dir: str | None = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        return None
+    return Path(runtime_dir) / "wlr-resize-watcher" / CACHE_FILE_NAME
+
+
+def load_cached_config(
+    path: Path, key: list[Any], require_root: bool
+) -> dict[str, Any] | None:
+    """
+    Returns the cached configuration if the cache at path exists and was
+    written for the given key, or None otherwise. With require_root, a
+    cache file not owned by root or writable by others is ignored.
+    """
+
+    try:
+        with open(path, "r", encoding="utf-8") as cache_file:
+            if require_root:
+                stat_result: os.stat_result = os.fstat(cache_file.fileno())
+                if stat_result.st_uid != 0 or stat_result.st_mode & 0o022:
+                    return None
+            cache: Any = json.load(cache_file)
+        if cache["key"] != key or not isinstance(cache["config"], dict):
+            return None
+        return cache["config"]
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def save_cached_config(
+    path: Path, key: list[Any], config_dict: dict[str, Any]
+) -> None:
+    """
+    Atomically replaces the cache at path. Raises OSError on failure.
+    """
+
+    path.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+    tmp_path: Path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(
+        json.dumps({"key": key, "config": config_dict}), encoding="utf-8"
+    )
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
@@ -0,0 +1,290 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+drm_kms.py - Reads DRM connectors and their modes straight from the kernel
+with the KMS GETRESOURCES and GETCONNECTOR ioctls, as a more complete
+alternative to the text files in /sys/class/drm. Only unprivileged,
+read-only ioctls are used, and connectors are never reprobed.
+"""
+
+import ctypes
+import fcntl
+import os
+
+DRM_IOCTL_BASE: int = ord("d")
+
+## From include/uapi/drm/drm_mode.h.
+DRM_MODE_TYPE_PREFERRED: int = 1 << 3
+DRM_MODE_FLAG_INTERLACE: int = 1 << 4
+DRM_MODE_FLAG_DBLSCAN: int = 1 << 5
+
+## Connection states, named like in the connectors' sysfs status files.
+CONNECTION_STATUS_MAP: dict[int, str] = {
+    1: "connected",
+    2: "disconnected",
+}
+
+## Connector type names as used by the kernel in connector names, indexed
+## by DRM_MODE_CONNECTOR_*.
+CONNECTOR_TYPE_NAME_LIST: list[str] = [
+    "Unknown",
+    "VGA",
+    "DVI-I",
+    "DVI-D",
+    "DVI-A",
+    "Composite",
+    "SVIDEO",
+    "LVDS",
+    "Component",
+    "DIN",
+    "DP",
+    "HDMI-A",
+    "HDMI-B",
+    "TV",
+    "eDP",
+    "Virtual",
+    "DSI",
+    "DPI",
+    "Writeback",
+    "SPI",
+    "USB",
+]
+
+
+class DrmModeCardRes(ctypes.Structure):
+    """
+    struct drm_mode_card_res
+    """
+
+    _fields_ = [
+        ("fb_id_ptr", ctypes.c_uint64),
+        ("crtc_id_ptr", ctypes.c_uint64),
+        ("connector_id_ptr", ctypes.c_uint64),
+        ("encoder_id_ptr", ctypes.c_uint64),
+        ("count_fbs", ctypes.c_uint32),
+        ("count_crtcs", ctypes.c_uint32),
+        ("count_connectors", ctypes.c_uint32),
+        ("count_encoders", ctypes.c_uint32),
+        ("min_width", ctypes.c_uint32),
+        ("max_width", ctypes.c_uint32),
+        ("min_height", ctypes.c_uint32),
+        ("max_height", ctypes.c_uint32),
+    ]
+
+
+class DrmModeModeInfo(ctypes.Structure):
+    """
+    struct drm_mode_modeinfo
+    """
+
+    _fields_ = [
+        ("clock", ctypes.c_uint32),
+        ("hdisplay", ctypes.c_uint16),
+        ("hsync_start", ctypes.c_uint16),
+        ("hsync_end", ctypes.c_uint16),
+        ("htotal", ctypes.c_uint16),
+        ("hskew", ctypes.c_uint16),
+        ("vdisplay", ctypes.c_uint16),
+        ("vsync_start", ctypes.c_uint16),
+        ("vsync_end", ctypes.c_uint16),
+        ("vtotal", ctypes.c_uint16),
+        ("vscan", ctypes.c_uint16),
+        ("vrefresh", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("name", ctypes.c_char * 32),
+    ]
+
+
+class DrmModeGetConnector(ctypes.Structure):
+    """
+    struct drm_mode_get_connector
+    """
+
+    _fields_ = [
+        ("encoders_ptr", ctypes.c_uint64),
+        ("modes_ptr", ctypes.c_uint64),
+        ("props_ptr", ctypes.c_uint64),
+        ("prop_values_ptr", ctypes.c_uint64),
+        ("count_modes", ctypes.c_uint32),
+        ("count_props", ctypes.c_uint32),
+        ("count_encoders", ctypes.c_uint32),
+        ("encoder_id", ctypes.c_uint32),
+        ("connector_id", ctypes.c_uint32),
+        ("connector_type", ctypes.c_uint32),
+        ("connector_type_id", ctypes.c_uint32),
+        ("connection", ctypes.c_uint32),
+        ("mm_width", ctypes.c_uint32),
+        ("mm_height", ctypes.c_uint32),
+        ("subpixel", ctypes.c_uint32),
+        ("pad", ctypes.c_uint32),
+    ]
+
+
+def _iowr(number: int, struct_type: type[ctypes.Structure]) -> int:
+    ## _IOWR() from include/uapi/asm-generic/ioctl.h.
+    return (
+        (3 << 30)
+        | (ctypes.sizeof(struct_type) << 16)
+        | (DRM_IOCTL_BASE << 8)
+        | number
+    )
+
+
+DRM_IOCTL_MODE_GETRESOURCES: int = _iowr(0xA0, DrmModeCardRes)
+DRM_IOCTL_MODE_GETCONNECTOR: int = _iowr(0xA7, DrmModeGetConnector)
+
+
+class KmsMode:
+    """
+    A mode of a connector. The refresh rate is in mHz, calculated from the
+    mode's timings the same way wlroots does, so it matches the refresh
+    rate of the compositor's mode exactly.
+    """
+
+    __slots__ = ("width", "height", "refresh", "preferred")
+
+    def __init__(
+        self, width: int, height: int, refresh: int, preferred: bool
+    ) -> None:
+        self.width: int = width
+        self.height: int = height
+        self.refresh: int = refresh
+        self.preferred: bool = preferred
+
+
+class KmsConnector:
+    """
+    A connector of a DRM card. name matches the connector's name in sysfs
+    and in the compositor, e.g. "Virtual-1", status its sysfs status
+    ("connected", "disconnected" or "unknown").
+    """
+
+    __slots__ = ("connector_id", "name", "status", "mode_list")
+
+    def __init__(
+        self,
+        connector_id: int,
+        name: str,
+        status: str,
+        mode_list: list[KmsMode],
+    ) -> None:
+        self.connector_id: int = connector_id
+        self.name: str = name
+        self.status: str = status
+        self.mode_list: list[KmsMode] = mode_list
+
+    def native_mode(self) -> KmsMode | None:
+        """
+        Returns the preferred mode, or the first mode if none is marked as
+        preferred, or None if the connector has no modes.
+        """
+
+        for mode in self.mode_list:
+            if mode.preferred:
+                return mode
+        if self.mode_list:
+            return self.mode_list[0]
+        return None
+
+
+def _mode_refresh(mode_info: DrmModeModeInfo) -> int:
+    if mode_info.htotal == 0 or mode_info.vtotal == 0:
+        return mode_info.vrefresh * 1000
+    refresh: int = (
+        mode_info.clock * 1_000_000 // mode_info.htotal + mode_info.vtotal // 2
+    ) // mode_info.vtotal
+    if mode_info.flags & DRM_MODE_FLAG_INTERLACE:
+        refresh *= 2
+    if mode_info.flags & DRM_MODE_FLAG_DBLSCAN:
+        refresh //= 2
+    if mode_info.vscan > 1:
+        refresh //= mode_info.vscan
+    return refresh
+
+
+def open_card(dev_path: str) -> int:
+    """
+    Opens a DRM card device node for querying. Raises OSError on failure.
+    """
+
+    return os.open(dev_path, os.O_RDONLY | os.O_CLOEXEC)
+
+
+def get_connector_id_list(card_fd: int) -> list[int]:
+    """
+    Returns the object IDs of all connectors of a card. Raises OSError on
+    failure.
+    """
+
+    while True:
+        card_res: DrmModeCardRes = DrmModeCardRes()
+        fcntl.ioctl(card_fd, DRM_IOCTL_MODE_GETRESOURCES, card_res)
+        count: int = card_res.count_connectors
+        id_array = (ctypes.c_uint32 * max(count, 1))()
+        card_res = DrmModeCardRes()
+        card_res.connector_id_ptr = ctypes.addressof(id_array)
+        card_res.count_connectors = count
+        fcntl.ioctl(card_fd, DRM_IOCTL_MODE_GETRESOURCES, card_res)
+        ## Connectors may come and go between the two calls (e.g. DP MST).
+        if card_res.count_connectors <= count:
+            return list(id_array[: card_res.count_connectors])
+
+
+def get_max_framebuffer_size(card_fd: int) -> tuple[int, int]:
+    """
+    Returns the largest framebuffer width and height the card supports.
+    Raises OSError on failure.
+    """
+
+    card_res: DrmModeCardRes = DrmModeCardRes()
+    fcntl.ioctl(card_fd, DRM_IOCTL_MODE_GETRESOURCES, card_res)
+    return card_res.max_width, card_res.max_height
+
+
+def get_connector(card_fd: int, connector_id: int) -> KmsConnector | None:
+    """
+    Reads the state and mode list of a connector, or returns None if it does
+    not exist (anymore). Raises OSError on other failures.
+    """
+
+    ## Asking for zero modes makes the kernel reprobe the connector, which
+    ## can take long and is the compositor's job. Always ask for at least
+    ## one mode, and grow the buffer if there are more.
+    mode_count: int = 1
+    while True:
+        mode_array = (DrmModeModeInfo * mode_count)()
+        get_conn: DrmModeGetConnector = DrmModeGetConnector()
+        get_conn.connector_id = connector_id
+        get_conn.modes_ptr = ctypes.addressof(mode_array)
+        get_conn.count_modes = mode_count
+        try:
+            fcntl.ioctl(card_fd, DRM_IOCTL_MODE_GETCONNECTOR, get_conn)
+        except FileNotFoundError:
+            return None
+        if get_conn.count_modes <= mode_count:
+            break
+        mode_count = get_conn.count_modes
+
+    type_name: str = "Unknown"
+    if get_conn.connector_type < len(CONNECTOR_TYPE_NAME_LIST):
+        type_name = CONNECTOR_TYPE_NAME_LIST[get_conn.connector_type]
+    return KmsConnector(
+        connector_id,
+        f"{type_name}-{get_conn.connector_type_id}",
+        CONNECTION_STATUS_MAP.get(get_conn.connection, "unknown"),
+        [
+            KmsMode(
+                x.hdisplay,
+                x.vdisplay,
+                _mode_refresh(x),
+                bool(x.type & DRM_MODE_TYPE_PREFERRED),
+            )
+            for x in mode_array[: get_conn.count_modes]
+        ],
+    )
@@ -0,0 +1,85 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+edid.py - Identifies a display from the EDID its connector reports, for
+matching DRM connectors to compositor outputs independently of their
+names. Model and serial are derived from the EDID the same way wlroots
+does, so they can be compared with what the compositor reports.
+"""
+
+import hashlib
+from pathlib import Path
+
+EDID_HEADER: bytes = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+EDID_BLOCK_SIZE: int = 128
+## Offsets of the four 18 byte descriptors in the base block.
+DESCRIPTOR_OFFSET_LIST: list[int] = [54, 72, 90, 108]
+DESCRIPTOR_TAG_SERIAL: int = 0xFF
+DESCRIPTOR_TAG_NAME: int = 0xFC
+
+
+class EdidInfo:
+    """
+    Identity of a display. edid_hash identifies the exact EDID, model and
+    serial are what the compositor reports for a display with this EDID.
+    """
+
+    __slots__ = ("edid_hash", "model", "serial")
+
+    def __init__(self, edid_hash: str, model: str, serial: str) -> None:
+        self.edid_hash: str = edid_hash
+        self.model: str = model
+        self.serial: str = serial
+
+
+def _descriptor_text(descriptor: bytes) -> str:
+    return (
+        descriptor[5:18]
+        .partition(b"\n")[0]
+        .decode("ascii", errors="replace")
+        .strip()
+    )
+
+
+def parse_edid(edid_bytes: bytes) -> EdidInfo | None:
+    """
+    Returns the identity of the display an EDID describes, or None if
+    edid_bytes is not a valid EDID.
+    """
+
+    if (
+        len(edid_bytes) < EDID_BLOCK_SIZE
+        or edid_bytes[:8] != EDID_HEADER
+        or sum(edid_bytes[:EDID_BLOCK_SIZE]) % 256 != 0
+    ):
+        return None
+    model: str = f"0x{int.from_bytes(edid_bytes[10:12], 'little'):04X}"
+    serial_number: int = int.from_bytes(edid_bytes[12:16], "little")
+    ## Newer wlroots leave the serial empty if the EDID has none.
+    serial: str = f"0x{serial_number:08X}" if serial_number != 0 else ""
+    for offset in DESCRIPTOR_OFFSET_LIST:
+        descriptor: bytes = edid_bytes[offset : offset + 18]
+        if descriptor[0:2] != b"\x00\x00" or descriptor[2] != 0:
+            continue
+        if descriptor[3] == DESCRIPTOR_TAG_NAME:
+            model = _descriptor_text(descriptor)
+        elif descriptor[3] == DESCRIPTOR_TAG_SERIAL:
+            serial = _descriptor_text(descriptor)
+    return EdidInfo(hashlib.sha256(edid_bytes).hexdigest()[:16], model, serial)
+
+
+def read_edid(conn_path: Path) -> EdidInfo | None:
+    """
+    Reads the EDID of a connector from its sysfs directory. Returns None if
+    there is none, e.g. because nothing is connected, or it is invalid.
+    """
+
+    try:
+        return parse_edid((conn_path / "edid").read_bytes())
+    except OSError:
+        return None
@@ -0,0 +1,138 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+event_loop.py - Single-threaded event loop for wlr_resize_watcher. File
+descriptors (udev monitor, compositor connection, inotify, ...) and timers
+are registered as independent event sources, and the process only wakes up
+when one of them has work to do.
+"""
+
+import heapq
+import itertools
+import selectors
+import time
+from typing import Any, Callable, NoReturn
+
+
+class Timer:
+    """
+    A callback scheduled to run at a point in time on the monotonic clock.
+    """
+
+    __slots__ = ("when", "seq", "callback", "cancelled")
+
+    def __init__(
+        self, when: float, seq: int, callback: Callable[[], None]
+    ) -> None:
+        self.when: float = when
+        self.seq: int = seq
+        self.callback: Callable[[], None] = callback
+        self.cancelled: bool = False
+
+    def __lt__(self, other: "Timer") -> bool:
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def cancel(self) -> None:
+        """
+        Prevents the timer from firing.
+        """
+
+        self.cancelled = True
+
+
+class EventLoop:
+    """
+    Multiplexes readable file descriptors and timers.
+    """
+
+    def __init__(self) -> None:
+        self.selector: selectors.BaseSelector = selectors.DefaultSelector()
+        self.timer_heap: list[Timer] = []
+        self.timer_seq: itertools.count[int] = itertools.count()
+
+    def time(self) -> float:
+        """
+        Returns the current time on the clock timers are scheduled on.
+        """
+
+        return time.monotonic()
+
+    def has_timers(self) -> bool:
+        """
+        Returns True if any timer is still waiting to fire.
+        """
+
+        return any(not x.cancelled for x in self.timer_heap)
+
+    def add_reader(self, fileobj: Any, callback: Callable[[], None]) -> None:
+        """
+        Runs callback whenever fileobj (a file descriptor or an object with a
+        fileno() method) becomes readable.
+        """
+
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def set_write_interest(self, fileobj: Any, enabled: bool) -> None:
+        """
+        While enabled is set, also runs the callback of a reader whenever
+        fileobj becomes writable, e.g. to finish sending buffered output.
+        """
+
+        events: int = selectors.EVENT_READ
+        if enabled:
+            events |= selectors.EVENT_WRITE
+        key: selectors.SelectorKey = self.selector.get_key(fileobj)
+        if key.events != events:
+            self.selector.modify(fileobj, events, key.data)
+
+    def remove_reader(self, fileobj: Any) -> None:
+        """
+        Stops watching fileobj.
+        """
+
+        self.selector.unregister(fileobj)
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        """
+        Runs callback once after delay seconds.
+        """
+
+        timer: Timer = Timer(
+            self.time() + delay, next(self.timer_seq), callback
+        )
+        heapq.heappush(self.timer_heap, timer)
+        return timer
+
+    def run_once(self) -> None:
+        """
+        Waits for the next event source to become ready and runs the
+        callbacks of all ready sources and all due timers.
+        """
+
+        while self.timer_heap and self.timer_heap[0].cancelled:
+            heapq.heappop(self.timer_heap)
+        timeout: float | None = None
+        if self.timer_heap:
+            timeout = max(0.0, self.timer_heap[0].when - self.time())
+
+        for key, _ in self.selector.select(timeout):
+            key.data()
+
+        now: float = self.time()
+        while self.timer_heap and self.timer_heap[0].when <= now:
+            timer: Timer = heapq.heappop(self.timer_heap)
+            if not timer.cancelled:
+                timer.callback()
+
+    def run_forever(self) -> NoReturn:
+        """
+        Runs the event loop until the process exits.
+        """
+
+        while True:
+            self.run_once()
@@ -0,0 +1,227 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+inotify.py - Minimal ctypes binding to the Linux inotify API, used to notice
+changes to wlr_resize_watcher's configuration directories, and starts of
+the resize helper when the process events connector is unavailable.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+from pathlib import Path
+
+IN_CLOSE_WRITE: int = 0x00000008
+IN_OPEN: int = 0x00000020
+IN_MOVED_FROM: int = 0x00000040
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_DELETE: int = 0x00000200
+IN_DELETE_SELF: int = 0x00000400
+IN_MOVE_SELF: int = 0x00000800
+IN_IGNORED: int = 0x00008000
+IN_ONLYDIR: int = 0x01000000
+IN_NONBLOCK: int = os.O_NONBLOCK
+IN_CLOEXEC: int = os.O_CLOEXEC
+
+EVENT_HDR_FMT: str = "=iIII"
+EVENT_HDR_LEN: int = struct.calcsize(EVENT_HDR_FMT)
+
+DIR_CHANGE_MASK: int = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+PARENT_CHANGE_MASK: int = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+## Executing a file opens it.
+EXEC_MASK: int = IN_OPEN | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+class InotifyWatcher:
+    """
+    An inotify instance and its watches.
+    """
+
+    def __init__(self) -> None:
+        libc_name: str | None = ctypes.util.find_library("c")
+        self.libc: ctypes.CDLL = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd: int = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno: int = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.wd_map: dict[int, Path] = {}
+
+    def fileno(self) -> int:
+        """
+        Returns the inotify file descriptor, for use with poll/select.
+        """
+
+        return self.fd
+
+    def close(self) -> None:
+        """
+        Closes the inotify file descriptor.
+        """
+
+        os.close(self.fd)
+
+    def _add_watch(self, path: Path, mask: int) -> int:
+        wd: int = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(str(path)), mask
+        )
+        if wd < 0:
+            errno: int = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        self.wd_map[wd] = path
+        return wd
+
+
+class DirWatcher(InotifyWatcher):
+    """
+    Watches a list of directories for files being written, created, renamed
+    or deleted. Directories that do not exist yet are picked up once they are
+    created, by watching their parent directory.
+    """
+
+    def __init__(self, dir_list: list[str]) -> None:
+        super().__init__()
+        self.dir_list: list[Path] = [Path(x) for x in dir_list]
+        for dir_path in self.dir_list:
+            self._watch_dir(dir_path)
+
+    def read_changes(self) -> bool:
+        """
+        Reads all pending inotify events. Returns True if any of them changed
+        the contents of a watched directory.
+        """
+
+        changed: bool = False
+        while True:
+            try:
+                data: bytes = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset: int = 0
+            while offset + EVENT_HDR_LEN <= len(data):
+                wd, mask, _, name_len = struct.unpack_from(
+                    EVENT_HDR_FMT, data, offset
+                )
+                offset += EVENT_HDR_LEN + name_len
+                wd_path: Path | None = self.wd_map.get(wd)
+                if wd_path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    ## The watched directory itself is gone, wait for it to
+                    ## come back.
+                    del self.wd_map[wd]
+                    if wd_path in self.dir_list:
+                        self._watch_dir(wd_path)
+                    changed = True
+                    continue
+                if wd_path in self.dir_list:
+                    changed = True
+                    continue
+                ## An event on the parent of a watched directory, check if
+                ## the directory now exists.
+                for dir_path in self.dir_list:
+                    if dir_path.parent == wd_path and dir_path.is_dir():
+                        if self._watch_dir(dir_path):
+                            changed = True
+
+    def _watch_dir(self, dir_path: Path) -> bool:
+        ## Returns True if the directory itself is being watched now.
+        try:
+            self._add_watch(dir_path, DIR_CHANGE_MASK)
+            return True
+        except OSError:
+            pass
+        try:
+            self._add_watch(dir_path.parent, PARENT_CHANGE_MASK)
+        except OSError:
+            ## The parent doesn't exist either. Not worth going further up,
+            ## changes to this directory will only be seen after a restart.
+            pass
+        return False
+
+
+class ExecWatcher(InotifyWatcher):
+    """
+    Watches an executable for being opened, which includes being executed.
+    If the executable is replaced or removed, e.g. by a package upgrade, its
+    directory is watched until it is back. Raises OSError if the executable
+    cannot be watched.
+    """
+
+    def __init__(self, exe_path: Path) -> None:
+        super().__init__()
+        self.exe_path: Path = exe_path
+        self.exe_wd: int | None = None
+        self.parent_wd: int | None = None
+        try:
+            self.exe_wd = self._add_watch(exe_path, EXEC_MASK)
+        except OSError:
+            self.close()
+            raise
+
+    def read_opens(self) -> bool:
+        """
+        Reads all pending inotify events. Returns True if the executable may
+        have been executed since the last call.
+        """
+
+        opened: bool = False
+        while True:
+            try:
+                data: bytes = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return opened
+            offset: int = 0
+            while offset + EVENT_HDR_LEN <= len(data):
+                wd, mask, _, name_len = struct.unpack_from(
+                    EVENT_HDR_FMT, data, offset
+                )
+                name: bytes = data[
+                    offset + EVENT_HDR_LEN : offset + EVENT_HDR_LEN + name_len
+                ].rstrip(b"\0")
+                offset += EVENT_HDR_LEN + name_len
+                if wd == self.exe_wd:
+                    opened = True
+                    if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                        self._rewatch()
+                elif wd == self.parent_wd and name == os.fsencode(
+                    self.exe_path.name
+                ):
+                    opened = True
+                    self._rewatch()
+
+    def _rewatch(self) -> None:
+        ## Watches the executable again if it exists, or its directory
+        ## otherwise.
+        if self.exe_wd is not None:
+            self.libc.inotify_rm_watch(self.fd, self.exe_wd)
+            self.wd_map.pop(self.exe_wd, None)
+            self.exe_wd = None
+        try:
+            self.exe_wd = self._add_watch(self.exe_path, EXEC_MASK)
+        except OSError:
+            if self.parent_wd is None:
+                try:
+                    self.parent_wd = self._add_watch(
+                        self.exe_path.parent, PARENT_CHANGE_MASK
+                    )
+                except OSError:
+                    pass
+            return
+        if self.parent_wd is not None:
+            self.libc.inotify_rm_watch(self.fd, self.parent_wd)
+            self.wd_map.pop(self.parent_wd, None)
+            self.parent_wd = None
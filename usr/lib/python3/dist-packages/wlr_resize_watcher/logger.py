@@ -0,0 +1,312 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+logger.py - Log messages of wlr_resize_watcher. Messages are formatted
+printf-style, and only if their level is enabled. Each message is rate
+limited on its own, keyed on its format string, so an event storm cannot
+flood the journal with the same few lines. How many messages were
+suppressed is reported once the window ends: when anything is logged
+afterwards, from a timer once an event loop runs, and at exit.
+
+If stderr is connected to the journal, messages are sent straight to the
+journal's native protocol socket, with the priority and any extra fields
+(e.g. OUTPUT, CARD, PHASE_MS) as structured data. Otherwise, or if that
+fails, they are written to stderr with a level prefix.
+"""
+
+import atexit
+import math
+import os
+import socket
+import struct
+import sys
+import time
+import traceback
+from typing import Any, Callable
+
+## Levels are syslog priorities, as the journal expects them.
+ERROR: int = 3
+WARNING: int = 4
+INFO: int = 6
+DEBUG: int = 7
+LEVEL_NAME_MAP: dict[str, int] = {
+    "error": ERROR,
+    "warning": WARNING,
+    "info": INFO,
+    "debug": DEBUG,
+}
+PREFIX_MAP: dict[int, str] = {
+    ERROR: "ERROR",
+    WARNING: "WARNING",
+    INFO: "INFO",
+    DEBUG: "DEBUG",
+}
+JOURNAL_SOCKET_PATH: str = "/run/systemd/journal/socket"
+
+
+class RateState:
+    """
+    How often a message has been logged in the current rate limit window.
+    """
+
+    __slots__ = ("window_start", "count", "suppressed", "level")
+
+    def __init__(self, window_start: float) -> None:
+        self.window_start: float = window_start
+        self.count: int = 0
+        self.suppressed: int = 0
+        ## Level of the last suppressed message, for the report.
+        self.level: int = INFO
+
+
+def stderr_is_journal() -> bool:
+    """
+    Checks whether stderr is connected to the journal, the way systemd
+    documents it for JOURNAL_STREAM.
+    """
+
+    journal_stream: str | None = os.environ.get("JOURNAL_STREAM")
+    if not journal_stream:
+        return False
+    try:
+        dev_str, _, ino_str = journal_stream.partition(":")
+        dev: int = int(dev_str)
+        ino: int = int(ino_str)
+        stat_result: os.stat_result = os.fstat(sys.stderr.fileno())
+        return stat_result.st_dev == dev and stat_result.st_ino == ino
+    except (OSError, ValueError, AttributeError):
+        ## AttributeError or io.UnsupportedOperation (a ValueError) if
+        ## stderr has been replaced with something that is not a file.
+        return False
+
+
+def encode_journal_field(name: str, value: str) -> bytes:
+    """
+    Encodes a field for the journal's native protocol. Values containing
+    newlines are sent with an explicit length.
+    """
+
+    data: bytes = value.encode("utf-8", errors="replace")
+    if b"\n" in data:
+        return (
+            name.encode("ascii")
+            + b"\n"
+            + struct.pack("<Q", len(data))
+            + data
+            + b"\n"
+        )
+    return name.encode("ascii") + b"=" + data + b"\n"
+
+
+class Logger:
+    """
+    Level filtering, rate limiting and output of log messages. Messages at
+    ERROR level are never rate limited.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, identifier: str) -> None:
+        self.identifier: str = identifier
+        self.level: int = INFO
+        ## Each message is let through at most rate_limit_burst times per
+        ## rate_limit_interval seconds. An interval of 0 disables the limit.
+        self.rate_limit_interval: float = 0.0
+        self.rate_limit_burst: int = 0
+        self.rate_map: dict[str, RateState] = {}
+        ## When the next count of suppressed messages is due to be reported,
+        ## inf if none is.
+        self.flush_time: float = math.inf
+        ## Runs a callback after a delay, e.g. EventLoop.call_later. Set once
+        ## an event loop runs, so counts are reported even if nothing else
+        ## is logged.
+        self.call_later: Callable[[float, Callable[[], None]], Any] | None = (
+            None
+        )
+        self.flush_timer_pending: bool = False
+        ## None until the first message, when it is checked whether stderr
+        ## is the journal.
+        self.journal_sock: socket.socket | None = None
+        self.use_journal: bool | None = None
+        atexit.register(self.flush_suppressed, True)
+
+    def configure(
+        self, level: int, rate_limit_interval: float, rate_limit_burst: int
+    ) -> None:
+        """
+        Changes the level and the rate limit.
+        """
+
+        self.level = level
+        self.rate_limit_interval = rate_limit_interval
+        self.rate_limit_burst = rate_limit_burst
+
+    def is_enabled(self, level: int) -> bool:
+        """
+        Checks whether messages of a level are logged, for skipping the
+        computation of expensive arguments.
+        """
+
+        return level <= self.level
+
+    def error(self, fmt: str, *args: Any, **kwargs: Any) -> None:
+        """
+        Logs a message at ERROR level, see log().
+        """
+
+        self.log(ERROR, fmt, *args, **kwargs)
+
+    def warning(self, fmt: str, *args: Any, **kwargs: Any) -> None:
+        """
+        Logs a message at WARNING level, see log().
+        """
+
+        self.log(WARNING, fmt, *args, **kwargs)
+
+    def info(self, fmt: str, *args: Any, **kwargs: Any) -> None:
+        """
+        Logs a message at INFO level, see log().
+        """
+
+        self.log(INFO, fmt, *args, **kwargs)
+
+    def debug(self, fmt: str, *args: Any, **kwargs: Any) -> None:
+        """
+        Logs a message at DEBUG level, see log().
+        """
+
+        self.log(DEBUG, fmt, *args, **kwargs)
+
+    def log(
+        self,
+        level: int,
+        fmt: str,
+        *args: Any,
+        exc_info: bool = False,
+        **field_map: Any,
+    ) -> None:
+        """
+        Logs fmt % args. With exc_info, the traceback of the exception being
+        handled is appended. field_map holds extra journal fields, with
+        upper case names; they are not written to stderr.
+        """
+
+        if level > self.level:
+            return
+        if level != ERROR and self.rate_limit_interval > 0:
+            now: float = time.monotonic()
+            if now >= self.flush_time:
+                self.flush_suppressed()
+            state: RateState | None = self.rate_map.get(fmt)
+            if state is None:
+                state = RateState(now)
+                self.rate_map[fmt] = state
+            elif now - state.window_start >= self.rate_limit_interval:
+                state.window_start = now
+                state.count = 0
+            if state.count >= self.rate_limit_burst:
+                state.suppressed += 1
+                state.level = level
+                if state.suppressed == 1:
+                    self.flush_time = min(
+                        self.flush_time,
+                        state.window_start + self.rate_limit_interval,
+                    )
+                    self.schedule_flush(now)
+                return
+            state.count += 1
+        message: str = fmt % args if args else fmt
+        if exc_info:
+            message += "\n" + traceback.format_exc().rstrip("\n")
+        self.write(level, message, field_map)
+
+    def flush_suppressed(self, force: bool = False) -> None:
+        """
+        Reports how many messages were suppressed in each rate limit window
+        that has ended, or in all windows if force is set.
+        """
+
+        now: float = time.monotonic()
+        self.flush_time = math.inf
+        for fmt, state in self.rate_map.items():
+            if state.suppressed == 0:
+                continue
+            window_end: float = state.window_start + self.rate_limit_interval
+            if not force and now < window_end:
+                self.flush_time = min(self.flush_time, window_end)
+                continue
+            self.write(
+                state.level,
+                f"Suppressed {state.suppressed} messages like {fmt!r} in "
+                f"the last {now - state.window_start:.1f} s.",
+                {},
+            )
+            state.suppressed = 0
+        self.schedule_flush(now)
+
+    def schedule_flush(self, now: float) -> None:
+        """
+        Arms the timer for the next report of suppressed messages, if there
+        is an event loop to run it.
+        """
+
+        if (
+            self.call_later is None
+            or self.flush_timer_pending
+            or self.flush_time == math.inf
+        ):
+            return
+        self.flush_timer_pending = True
+        self.call_later(max(0.0, self.flush_time - now), self.run_flush_timer)
+
+    def run_flush_timer(self) -> None:
+        """
+        Timer callback for reporting suppressed messages.
+        """
+
+        self.flush_timer_pending = False
+        self.flush_suppressed()
+
+    def write(
+        self, level: int, message: str, field_map: dict[str, Any]
+    ) -> None:
+        """
+        Writes a formatted message to the journal or to stderr.
+        """
+
+        if self.use_journal is None:
+            self.use_journal = stderr_is_journal()
+        if self.use_journal and self.write_journal(level, message, field_map):
+            return
+        print(f"{PREFIX_MAP[level]}: {message}", file=sys.stderr)
+
+    def write_journal(
+        self, level: int, message: str, field_map: dict[str, Any]
+    ) -> bool:
+        """
+        Sends a message to the journal. Returns False if that failed, e.g.
+        because the message is too large for a datagram.
+        """
+
+        data: bytes = (
+            encode_journal_field("MESSAGE", message)
+            + encode_journal_field("PRIORITY", str(level))
+            + encode_journal_field("SYSLOG_IDENTIFIER", self.identifier)
+            + b"".join(
+                encode_journal_field(name, str(value))
+                for name, value in field_map.items()
+            )
+        )
+        try:
+            if self.journal_sock is None:
+                self.journal_sock = socket.socket(
+                    socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC
+                )
+            self.journal_sock.sendto(data, JOURNAL_SOCKET_PATH)
+        except OSError:
+            return False
+        return True
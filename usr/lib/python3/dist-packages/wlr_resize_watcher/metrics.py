@@ -0,0 +1,208 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+metrics.py - Latency histograms and event counters for wlr_resize_watcher,
+written out in the Prometheus text format. While disabled, recording a
+value is a single attribute check.
+"""
+
+import bisect
+import os
+import time
+from pathlib import Path
+from types import TracebackType
+
+## Upper bounds of the histogram buckets, in seconds.
+BUCKET_BOUND_LIST: list[float] = [
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+
+
+class Histogram:
+    """
+    Counts observed durations in fixed buckets.
+    """
+
+    __slots__ = ("bucket_list", "total", "count")
+
+    def __init__(self) -> None:
+        ## One more bucket than bounds, for values above the largest bound.
+        self.bucket_list: list[int] = [0] * (len(BUCKET_BOUND_LIST) + 1)
+        self.total: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Records one duration.
+        """
+
+        self.bucket_list[bisect.bisect_left(BUCKET_BOUND_LIST, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class NullTimer:
+    """
+    Context manager that does nothing, handed out while metrics are off.
+    """
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        return None
+
+
+NULL_TIMER: NullTimer = NullTimer()
+
+
+class PhaseTimer:
+    """
+    Context manager that records the time spent in its body in a
+    histogram.
+    """
+
+    __slots__ = ("metrics", "name", "start_time")
+
+    def __init__(self, metrics: "Metrics", name: str) -> None:
+        self.metrics: Metrics = metrics
+        self.name: str = name
+        self.start_time: float = 0.0
+
+    def __enter__(self) -> None:
+        self.start_time = time.monotonic()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.metrics.observe(self.name, time.monotonic() - self.start_time)
+
+
+class Metrics:
+    """
+    Registry of all histograms, counters and gauges. Histogram names are
+    exported with a "_seconds" suffix, counter names with "_total", gauge
+    names as they are.
+    """
+
+    def __init__(self, prefix: str) -> None:
+        self.prefix: str = prefix
+        self.enabled: bool = False
+        self.dirty: bool = False
+        self.histogram_map: dict[str, Histogram] = {}
+        self.counter_map: dict[str, int] = {}
+        self.gauge_map: dict[str, int] = {}
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        """
+        Increments a counter.
+        """
+
+        if not self.enabled:
+            return
+        self.counter_map[name] = self.counter_map.get(name, 0) + amount
+        self.dirty = True
+
+    def set_gauge(self, name: str, value: int) -> None:
+        """
+        Sets a gauge to its current value.
+        """
+
+        if not self.enabled or self.gauge_map.get(name) == value:
+            return
+        self.gauge_map[name] = value
+        self.dirty = True
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Records a duration, in seconds, in a histogram.
+        """
+
+        if not self.enabled:
+            return
+        histogram: Histogram | None = self.histogram_map.get(name)
+        if histogram is None:
+            histogram = Histogram()
+            self.histogram_map[name] = histogram
+        histogram.observe(value)
+        self.dirty = True
+
+    def timed(self, name: str) -> PhaseTimer | NullTimer:
+        """
+        Returns a context manager that records the time spent in its body.
+        """
+
+        if not self.enabled:
+            return NULL_TIMER
+        return PhaseTimer(self, name)
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+
+        out_list: list[str] = []
+        for name, histogram in sorted(self.histogram_map.items()):
+            full_name: str = f"{self.prefix}_{name}_seconds"
+            out_list.append(f"# TYPE {full_name} histogram\n")
+            cumulative: int = 0
+            for bound, bucket_count in zip(
+                BUCKET_BOUND_LIST, histogram.bucket_list
+            ):
+                cumulative += bucket_count
+                out_list.append(
+                    f'{full_name}_bucket{{le="{bound}"}} {cumulative}\n'
+                )
+            out_list.append(
+                f'{full_name}_bucket{{le="+Inf"}} {histogram.count}\n'
+            )
+            out_list.append(f"{full_name}_sum {histogram.total:.6f}\n")
+            out_list.append(f"{full_name}_count {histogram.count}\n")
+        for name, value in sorted(self.counter_map.items()):
+            full_name = f"{self.prefix}_{name}_total"
+            out_list.append(f"# TYPE {full_name} counter\n")
+            out_list.append(f"{full_name} {value}\n")
+        for name, value in sorted(self.gauge_map.items()):
+            full_name = f"{self.prefix}_{name}"
+            out_list.append(f"# TYPE {full_name} gauge\n")
+            out_list.append(f"{full_name} {value}\n")
+        return "".join(out_list)
+
+    def write(self, path: Path) -> None:
+        """
+        Atomically replaces the file at path with the current metrics, if
+        anything changed since the last write.
+        """
+
+        if not self.dirty:
+            return
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        tmp_path: Path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self.dirty = False
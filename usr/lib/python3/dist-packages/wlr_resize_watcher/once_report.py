@@ -0,0 +1,163 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+once_report.py - Report of a single display sync run with --once, for boot
+tests and image build pipelines. Records how long each phase took, the
+displays the graphics cards and the compositor reported, every display
+change requested from the compositor and its outcome. With --json, the
+report is written to stdout as a single JSON object.
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+REPORT_VERSION: int = 1
+## Outcomes a run can end with. Only "applied", "unchanged" and "skipped"
+## count as success.
+OUTCOME_APPLIED: str = "applied"
+OUTCOME_UNCHANGED: str = "unchanged"
+OUTCOME_SKIPPED: str = "skipped"
+OUTCOME_NO_DISPLAYS: str = "no_displays"
+OUTCOME_FAILED: str = "failed"
+SUCCESS_OUTCOME_SET: set[str] = {
+    OUTCOME_APPLIED,
+    OUTCOME_UNCHANGED,
+    OUTCOME_SKIPPED,
+}
+
+
+class OnceReport:
+    """
+    Collects what a --once run did. Display lists and display changes are
+    stored in the JSON form of the trace records.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self) -> None:
+        self.start_time: float = time.monotonic()
+        ## (name, duration in milliseconds)
+        self.phase_list: list[tuple[str, float]] = []
+        self.environment_map: dict[str, Any] = {}
+        self.mode: str = ""
+        self.hw_disp_list: list[dict[str, Any]] | None = None
+        self.compositor_state_list: list[list[dict[str, Any]] | None] = []
+        self.action_list: list[dict[str, Any]] = []
+        self.outcome: str = OUTCOME_FAILED
+        self.message: str = ""
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Context manager that records the time spent in its body under the
+        given name.
+        """
+
+        phase_start: float = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phase_list.append(
+                (name, (time.monotonic() - phase_start) * 1000)
+            )
+
+    def add_compositor_state(
+        self, disp_list: list[dict[str, Any]] | None
+    ) -> None:
+        """
+        Records the displays the compositor reported, None if it reported
+        none.
+        """
+
+        self.compositor_state_list.append(disp_list)
+
+    def add_action(
+        self,
+        target_list: list[dict[str, Any]],
+        test_only: bool,
+        success: bool,
+        duration: float,
+    ) -> None:
+        """
+        Records a display change handed to the compositor, and how long it
+        took in seconds.
+        """
+
+        self.action_list.append(
+            {
+                "target_list": target_list,
+                "test_only": test_only,
+                "success": success,
+                "ms": round(duration * 1000, 3),
+            }
+        )
+
+    def finish(self, outcome: str, message: str = "") -> int:
+        """
+        Sets the outcome of the run. Returns the exit status for it.
+        """
+
+        self.outcome = outcome
+        self.message = message
+        return 0 if outcome in SUCCESS_OUTCOME_SET else 1
+
+    def to_json(self) -> dict[str, Any]:
+        """
+        Returns the report in a form that can be serialized to JSON.
+        """
+
+        return {
+            "version": REPORT_VERSION,
+            "outcome": self.outcome,
+            "success": self.outcome in SUCCESS_OUTCOME_SET,
+            "message": self.message,
+            "mode": self.mode,
+            "environment": self.environment_map,
+            "phases": [
+                {"name": name, "ms": round(duration, 3)}
+                for name, duration in self.phase_list
+            ],
+            "total_ms": round((time.monotonic() - self.start_time) * 1000, 3),
+            "hw_displays": self.hw_disp_list,
+            "compositor_displays": (
+                self.compositor_state_list[0]
+                if self.compositor_state_list
+                else None
+            ),
+            "final_displays": (
+                self.compositor_state_list[-1]
+                if self.compositor_state_list
+                else None
+            ),
+            "actions": self.action_list,
+        }
+
+    def write_json(self) -> None:
+        """
+        Writes the report to stdout.
+        """
+
+        json.dump(self.to_json(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    def write_summary(self) -> None:
+        """
+        Writes a short summary of the report to stdout.
+        """
+
+        for name, duration in self.phase_list:
+            print(f"{name}: {duration:.1f} ms")
+        applied_count: int = sum(
+            1 for x in self.action_list if not x["test_only"]
+        )
+        print(
+            f"Outcome: {self.outcome} ({self.mode or 'no sync'}, "
+            f"{applied_count} display change(s))"
+            + (f": {self.message}" if self.message else "")
+        )
@@ -0,0 +1,356 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+proc_watch.py - Process discovery helpers for wlr_resize_watcher. Provides a
+client for the kernel's process events connector (netlink), which reports
+every exec as it happens, a cheap in-process scan of /proc to use when
+the connector is unavailable, and tracking of the resize helper's lifetime
+built on both and on pidfds.
+"""
+
+import os
+import socket
+import struct
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from wlr_resize_watcher.inotify import ExecWatcher
+
+NETLINK_CONNECTOR: int = 11
+NLMSG_DONE: int = 3
+CN_IDX_PROC: int = 1
+CN_VAL_PROC: int = 1
+PROC_CN_MCAST_LISTEN: int = 1
+PROC_EVENT_NONE: int = 0x00000000
+PROC_EVENT_EXEC: int = 0x00000002
+PROC_EVENT_COMM: int = 0x00000200
+PROC_EVENT_EXIT: int = 0x80000000
+## The kernel acknowledges a subscription request right away, this only
+## guards against a connector that never answers.
+ACK_TIMEOUT: float = 0.5
+
+NLMSGHDR_FMT: str = "=IHHII"
+NLMSGHDR_LEN: int = struct.calcsize(NLMSGHDR_FMT)
+CN_MSG_FMT: str = "=IIIIHH"
+CN_MSG_LEN: int = struct.calcsize(CN_MSG_FMT)
+PROC_EVENT_HDR_FMT: str = "=IIQ"
+PROC_EVENT_HDR_LEN: int = struct.calcsize(PROC_EVENT_HDR_FMT)
+
+
+class ProcConnector:
+    """
+    Subscription to the kernel's process events connector. Linux 6.6 and
+    later allow unprivileged processes to subscribe, on older kernels
+    open() raises PermissionError.
+    """
+
+    def __init__(self) -> None:
+        self.sock: socket.socket | None = None
+
+    def open(self) -> None:
+        """
+        Subscribes to process events.
+        """
+
+        sock: socket.socket = socket.socket(
+            socket.AF_NETLINK,
+            socket.SOCK_DGRAM | socket.SOCK_CLOEXEC,
+            NETLINK_CONNECTOR,
+        )
+        ## The kernel answers with the request's ack field plus one. Setting
+        ## it to the PID identifies the acknowledgement of our own request,
+        ## as those of other subscribers are sent to all of them.
+        ack: int = os.getpid()
+        try:
+            sock.bind((0, CN_IDX_PROC))
+            sock.sendto(
+                struct.pack(
+                    NLMSGHDR_FMT,
+                    NLMSGHDR_LEN + CN_MSG_LEN + 4,
+                    NLMSG_DONE,
+                    0,
+                    0,
+                    0,
+                )
+                + struct.pack(
+                    CN_MSG_FMT, CN_IDX_PROC, CN_VAL_PROC, 0, ack, 4, 0
+                )
+                + struct.pack("=I", PROC_CN_MCAST_LISTEN),
+                (0, 0),
+            )
+            self.wait_ack(sock, ack + 1)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    @staticmethod
+    def wait_ack(sock: socket.socket, ack: int) -> None:
+        """
+        Waits for the kernel to acknowledge the subscription request, with
+        the given value in the ack field, skipping the process events and
+        acknowledgements of other subscribers that may arrive first.
+        Raises PermissionError if the request was refused, and TimeoutError
+        if no acknowledgement arrives within ACK_TIMEOUT.
+        """
+
+        event_offset: int = NLMSGHDR_LEN + CN_MSG_LEN
+        deadline: float = time.monotonic() + ACK_TIMEOUT
+        while True:
+            remaining_time: float = deadline - time.monotonic()
+            if remaining_time <= 0:
+                raise TimeoutError(
+                    "Process events connector did not acknowledge the "
+                    "subscription."
+                )
+            sock.settimeout(remaining_time)
+            data: bytes = sock.recv(4096)
+            if len(data) < event_offset + PROC_EVENT_HDR_LEN + 4:
+                continue
+            msg_ack: int = struct.unpack_from("=I", data, NLMSGHDR_LEN + 12)[0]
+            what: int = struct.unpack_from("=I", data, event_offset)[0]
+            if what != PROC_EVENT_NONE or msg_ack != ack:
+                continue
+            ack_err: int = struct.unpack_from(
+                "=I", data, event_offset + PROC_EVENT_HDR_LEN
+            )[0]
+            if ack_err != 0:
+                raise PermissionError(ack_err, os.strerror(ack_err))
+            return
+
+    def fileno(self) -> int:
+        """
+        Returns the connector socket's file descriptor, for use with
+        poll/select.
+        """
+
+        assert self.sock is not None
+        return self.sock.fileno()
+
+    def read_events(self) -> list[tuple[int, int]] | None:
+        """
+        Reads all pending process events. Returns a list of (event type, PID)
+        tuples for exec, comm change and exit events. Returns None if the
+        kernel dropped events because they were not read quickly enough, in
+        which case the caller has to rescan /proc.
+        """
+
+        assert self.sock is not None
+        out_list: list[tuple[int, int]] = []
+        event_offset: int = NLMSGHDR_LEN + CN_MSG_LEN
+        data_offset: int = event_offset + PROC_EVENT_HDR_LEN
+        while True:
+            try:
+                data: bytes = self.sock.recv(4096)
+            except BlockingIOError:
+                return out_list
+            except OSError:
+                ## ENOBUFS, the socket buffer overflowed.
+                return None
+            if len(data) < data_offset + 8:
+                continue
+            what: int = struct.unpack_from("=I", data, event_offset)[0]
+            if what not in (PROC_EVENT_EXEC, PROC_EVENT_COMM, PROC_EVENT_EXIT):
+                continue
+            ## All three event types start with the PID and TGID. Only
+            ## thread group leaders are of interest.
+            pid, tgid = struct.unpack_from("=ii", data, data_offset)
+            if pid == tgid:
+                out_list.append((what, tgid))
+
+    def close(self) -> None:
+        """
+        Ends the subscription.
+        """
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def read_proc_comm(pid: int) -> str | None:
+    """
+    Returns the command name of a process, or None if it no longer exists.
+    """
+
+    try:
+        with open(f"/proc/{pid}/comm", "r", encoding="utf-8") as comm_file:
+            return comm_file.read().rstrip("\n")
+    except OSError:
+        return None
+
+
+def scan_proc_comm() -> dict[int, str]:
+    """
+    Returns the command names of all running processes, keyed by PID.
+    """
+
+    out_dict: dict[int, str] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        comm: str | None = read_proc_comm(int(entry))
+        if comm is not None:
+            out_dict[int(entry)] = comm
+    return out_dict
+
+
+def read_proc_argv0(pid: int) -> bytes | None:
+    """
+    Returns the first command line argument of a process, or None if it no
+    longer exists.
+    """
+
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as cmdline_file:
+            return cmdline_file.read().partition(b"\0")[0]
+    except OSError:
+        return None
+
+
+def find_exe_pid(exe_name: str) -> int | None:
+    """
+    Returns the PID of a process that was started with the given executable
+    path as its first command line argument, or None if there is none.
+    """
+
+    exe_bytes: bytes = os.fsencode(exe_name)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit() and read_proc_argv0(int(entry)) == exe_bytes:
+            return int(entry)
+    return None
+
+
+class HelperWatcher:
+    """
+    Tracks whether a process started from a given executable is running,
+    without polling. While one is, only its pidfd is watched, which becomes
+    readable once it exits. While none is, process starts are watched
+    through inotify on the executable, which only wakes up when it is
+    opened. An open is only a hint, and /proc has to be scanned shortly
+    after, once the exec has completed. If the executable cannot be
+    watched, the process events connector is used instead, which wakes up
+    on every exec on the system.
+    """
+
+    def __init__(self, exe_name: str) -> None:
+        self.exe_name: str = exe_name
+        self.exe_bytes: bytes = os.fsencode(exe_name)
+        self.pid: int | None = None
+        self.pidfd: int | None = None
+        self.proc_conn: ProcConnector | None = None
+        self.exec_watcher: "ExecWatcher | None" = None
+        ## The file descriptor of the start watch, None if it is closed.
+        self.start_fd: int | None = None
+
+    def find(self) -> bool:
+        """
+        Scans /proc for the process. If it is found, its pidfd is opened,
+        unless pidfds are unsupported. Returns True if the process runs.
+        """
+
+        while True:
+            pid: int | None = find_exe_pid(self.exe_name)
+            if pid is None:
+                return False
+            try:
+                self._attach(pid)
+            except ProcessLookupError:
+                ## Exited in between, look for another one.
+                continue
+            return True
+
+    def open_start_watch(self) -> int:
+        """
+        Starts watching for the process to be started. Returns the file
+        descriptor that becomes readable when it may have been. Raises
+        OSError if starts cannot be watched.
+        """
+
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher.inotify import ExecWatcher
+
+        try:
+            self.exec_watcher = ExecWatcher(Path(self.exe_name))
+            self.start_fd = self.exec_watcher.fileno()
+            return self.start_fd
+        except OSError:
+            self.exec_watcher = None
+        self.proc_conn = ProcConnector()
+        try:
+            self.proc_conn.open()
+        except OSError:
+            self.proc_conn = None
+            raise
+        self.start_fd = self.proc_conn.fileno()
+        return self.start_fd
+
+    def read_start_events(self) -> bool:
+        """
+        Reads the pending events of the start watch. Returns True if the
+        process has started. With inotify, also returns True if the
+        executable was opened, in which case the caller has to check with
+        find() once the exec has completed.
+        """
+
+        if self.exec_watcher is not None:
+            return self.exec_watcher.read_opens()
+        assert self.proc_conn is not None
+        proc_event_list: list[tuple[int, int]] | None = (
+            self.proc_conn.read_events()
+        )
+        if proc_event_list is None:
+            return self.find()
+        for event_type, pid in proc_event_list:
+            if (
+                event_type == PROC_EVENT_EXEC
+                and read_proc_argv0(pid) == self.exe_bytes
+            ):
+                try:
+                    self._attach(pid)
+                except ProcessLookupError:
+                    continue
+                return True
+        return False
+
+    def close_start_watch(self) -> None:
+        """
+        Stops watching for the process to be started.
+        """
+
+        if self.proc_conn is not None:
+            self.proc_conn.close()
+            self.proc_conn = None
+        if self.exec_watcher is not None:
+            self.exec_watcher.close()
+            self.exec_watcher = None
+        self.start_fd = None
+
+    def release(self) -> None:
+        """
+        Forgets the process after it has exited.
+        """
+
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+        self.pid = None
+        self.pidfd = None
+
+    def _attach(self, pid: int) -> None:
+        ## Raises ProcessLookupError if the process has exited already.
+        self.release()
+        try:
+            self.pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            raise
+        except OSError:
+            ## Kernels before 5.3. The process is known to run, but its exit
+            ## goes unnoticed.
+            self.pidfd = None
+        self.pid = pid
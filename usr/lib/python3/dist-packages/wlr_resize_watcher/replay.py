@@ -0,0 +1,364 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+replay.py - Plays back a trace recorded with --record. The daemon's event
+handling, resize scheduler and sync code run as they would have, but the
+DRM topology and the compositor are replaced with stand-ins that answer
+from the trace. Every display change the logic makes is compared with the
+one recorded, so changes to the logic or its timing can be checked against
+real sessions without a hypervisor.
+
+Events are replayed at the recorded pace, or, with --replay-fast, on a
+virtual clock that jumps straight to the next timer or event.
+"""
+
+import collections
+import heapq
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Callable, NoReturn
+
+from wlr_resize_watcher import trace
+from wlr_resize_watcher import wlr_resize_watcher as watcher
+from wlr_resize_watcher.event_loop import EventLoop, Timer
+
+
+class VirtualClockEventLoop(EventLoop):
+    """
+    Event loop whose clock only moves when a timer fires, so no time is
+    spent waiting. File descriptors are not supported.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.now: float = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def run_once(self) -> None:
+        while self.timer_heap and self.timer_heap[0].cancelled:
+            heapq.heappop(self.timer_heap)
+        if not self.timer_heap:
+            return
+        self.now = max(self.now, self.timer_heap[0].when)
+        while self.timer_heap and self.timer_heap[0].when <= self.now:
+            timer: Timer = heapq.heappop(self.timer_heap)
+            if not timer.cancelled:
+                timer.callback()
+
+
+class ReplayStats:
+    """
+    Counts how far the replayed run strays from the recorded one.
+    """
+
+    def __init__(self) -> None:
+        self.divergence_count: int = 0
+        self.recorded_apply_count: int = 0
+        self.replayed_apply_count: int = 0
+
+    def diverge(self, message: str) -> None:
+        """
+        Reports a difference between the recorded and the replayed run.
+        """
+
+        self.divergence_count += 1
+        print(f"WARNING: Replay diverges: {message}", file=sys.stderr)
+
+
+class ReplayTopology(watcher.DrmTopology):
+    """
+    DRM topology index that answers with the mode lists and displays the
+    recorded run read, in the order it read them.
+    """
+
+    def __init__(
+        self,
+        stats: ReplayStats,
+        modes_map: dict[str, collections.deque[dict[str, Any]]],
+        hw_queue: collections.deque[dict[str, Any]],
+    ) -> None:
+        super().__init__(Path("/nonexistent"))
+        self.stats: ReplayStats = stats
+        self.modes_map: dict[str, collections.deque[dict[str, Any]]] = (
+            modes_map
+        )
+        self.hw_queue: collections.deque[dict[str, Any]] = hw_queue
+
+    def rescan_all(self) -> None:
+        return
+
+    def rescan_card(self, card_name: str) -> None:
+        return
+
+    def refresh(
+        self, card_name: str, connector_id_set: set[int] | None
+    ) -> None:
+        return
+
+    def get_card_list(self) -> list[str]:
+        if not self.hw_queue:
+            return []
+        return list(self.hw_queue[0]["card_list"])
+
+    def get_disp_list(self, card_list: list[str]) -> list[watcher.DisplayInfo]:
+        if not self.hw_queue:
+            self.stats.diverge(f"extra display read for cards {card_list!r}")
+            return []
+        record: dict[str, Any] = self.hw_queue.popleft()
+        if record["card_list"] != card_list:
+            self.stats.diverge(
+                f"display read for cards {card_list!r}, recorded "
+                f"{record['card_list']!r}"
+            )
+        disp_list: list[watcher.DisplayInfo] | None = (
+            watcher.disp_list_from_json(record["disp_list"])
+        )
+        assert disp_list is not None
+        return disp_list
+
+    def get_modes_snapshot(
+        self, card_name: str, connector_id_set: set[int] | None
+    ) -> tuple[tuple[str, str], ...]:
+        modes_queue: collections.deque[dict[str, Any]] | None = (
+            self.modes_map.get(card_name)
+        )
+        if not modes_queue:
+            self.stats.diverge(f"extra mode list read for '{card_name}'")
+            return ()
+        return tuple(
+            (str(x[0]), str(x[1])) for x in modes_queue.popleft()["snapshot"]
+        )
+
+
+class ReplayBackend(watcher.CompositorBackend):
+    """
+    Compositor backend that answers with the compositor states of the
+    recorded run, and compares every display change with the recorded one.
+    """
+
+    def __init__(
+        self,
+        stats: ReplayStats,
+        compositor_queue: collections.deque[dict[str, Any]],
+        apply_queue: collections.deque[dict[str, Any]],
+    ) -> None:
+        self.stats: ReplayStats = stats
+        self.compositor_queue: collections.deque[dict[str, Any]] = (
+            compositor_queue
+        )
+        self.apply_queue: collections.deque[dict[str, Any]] = apply_queue
+
+    def get_disp_list(self) -> list[watcher.DisplayInfo] | None:
+        if not self.compositor_queue:
+            self.stats.diverge("extra compositor query")
+            return None
+        return watcher.disp_list_from_json(
+            self.compositor_queue.popleft()["disp_list"]
+        )
+
+    def apply_layout(
+        self, target_list: list[watcher.DisplayTarget], test_only: bool
+    ) -> bool:
+        target_json_list: list[dict[str, Any]] = watcher.target_list_to_json(
+            target_list
+        )
+        if not test_only:
+            self.stats.replayed_apply_count += 1
+        if not self.apply_queue:
+            self.stats.diverge(f"extra display change {target_json_list!r}")
+            return True
+        record: dict[str, Any] = self.apply_queue.popleft()
+        if (
+            record["target_list"] != target_json_list
+            or record["test_only"] != test_only
+        ):
+            self.stats.diverge(
+                f"display change {target_json_list!r} "
+                f"(test_only={test_only}), recorded "
+                f"{record['target_list']!r} "
+                f"(test_only={record['test_only']})"
+            )
+        return bool(record["success"])
+
+
+def apply_recorded_config(config_dict: dict[str, Any]) -> None:
+    """
+    Applies a recorded configuration, without the parts that would touch
+    the system. Options added after the trace was recorded get their
+    defaults.
+    """
+
+    watcher.apply_config(
+        {
+            **watcher.GlobalData.conf_defaults,
+            **config_dict,
+            "enable_warm_start": False,
+            "enable_metrics": False,
+        }
+    )
+    if watcher.GlobalData.resize_scheduler is not None:
+        watcher.GlobalData.resize_scheduler.settle_time = (
+            watcher.GlobalData.resize_settle_time_ms / 1000
+        )
+        watcher.GlobalData.resize_scheduler.max_delay = (
+            watcher.GlobalData.resize_max_delay_ms / 1000
+        )
+
+
+def apply_recorded_environment(record: dict[str, Any]) -> None:
+    """
+    Restores what was detected about the system in the recorded run.
+    """
+
+    watcher.GlobalData.virtualizer_str = record["virtualizer"]
+    watcher.GlobalData.resize_helper_present = record["resize_helper_present"]
+    watcher.GlobalData.in_sysmaint_mode = record["in_sysmaint_mode"]
+
+
+def apply_recorded_helper_state(record: dict[str, Any]) -> None:
+    """
+    Restores whether the resize helper runs, after the recorded run saw it
+    start or stop. The displays are synced by the sync_all record that
+    follows.
+    """
+
+    watcher.GlobalData.resize_helper_present = record["resize_helper_present"]
+
+
+def make_event_callback(record: dict[str, Any]) -> Callable[[], None]:
+    """
+    Returns the timer callback that feeds a recorded input to the daemon.
+    """
+
+    kind: str = record["kind"]
+    if kind == "config":
+        return lambda: apply_recorded_config(record["config"])
+    if kind == "environment":
+        return lambda: apply_recorded_environment(record)
+    if kind == "sync_all":
+        return watcher.sync_all_displays
+    if kind == "helper":
+        return lambda: apply_recorded_helper_state(record)
+    if kind == "compositor_event":
+        return watcher.handle_compositor_events
+    if kind == "broker":
+        return lambda: watcher.sync_hw_resolution_with_compositor(
+            record["card"]
+        )
+    assert kind == "udev"
+
+    def queue_udev_event() -> None:
+        assert watcher.GlobalData.event_loop is not None
+        watcher.queue_card_events(
+            [
+                watcher.CardEvent(
+                    record["card"], record["action"], record["connector_id"]
+                )
+            ],
+            watcher.GlobalData.event_loop.time(),
+        )
+
+    return queue_udev_event
+
+
+# pylint: disable=too-many-locals
+def run_replay(path: Path, fast: bool) -> NoReturn:
+    """
+    Plays back a trace and prints a summary. Exits non-zero if the replayed
+    run did not make the same display changes as the recorded one.
+    """
+
+    try:
+        record_list: list[dict[str, Any]] = trace.read_trace(path)
+    except (OSError, ValueError):
+        print(f"ERROR: Cannot read trace file '{path}'!", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
+
+    stats: ReplayStats = ReplayStats()
+    modes_map: dict[str, collections.deque[dict[str, Any]]] = {}
+    hw_queue: collections.deque[dict[str, Any]] = collections.deque()
+    compositor_queue: collections.deque[dict[str, Any]] = collections.deque()
+    apply_queue: collections.deque[dict[str, Any]] = collections.deque()
+    event_list: list[dict[str, Any]] = []
+    for record in record_list:
+        kind: str = record["kind"]
+        if kind == "modes":
+            modes_map.setdefault(record["card"], collections.deque()).append(
+                record
+            )
+        elif kind == "hw":
+            hw_queue.append(record)
+        elif kind == "compositor":
+            compositor_queue.append(record)
+        elif kind == "apply":
+            apply_queue.append(record)
+            if not record["test_only"]:
+                stats.recorded_apply_count += 1
+        elif kind in (
+            "config",
+            "environment",
+            "sync_all",
+            "helper",
+            "compositor_event",
+            "broker",
+            "udev",
+        ):
+            event_list.append(record)
+        else:
+            print(
+                f"WARNING: Ignoring unknown trace record kind '{kind}'.",
+                file=sys.stderr,
+            )
+
+    topology: ReplayTopology = ReplayTopology(stats, modes_map, hw_queue)
+    event_loop: EventLoop = VirtualClockEventLoop() if fast else EventLoop()
+    watcher.GlobalData.event_loop = event_loop
+    watcher.GlobalData.drm_topology = topology
+    watcher.GlobalData.active_backend = ReplayBackend(
+        stats, compositor_queue, apply_queue
+    )
+    watcher.GlobalData.reconciler = watcher.Reconciler()
+    watcher.GlobalData.output_index = watcher.OutputIndex()
+    watcher.GlobalData.resize_scheduler = watcher.ResizeScheduler(
+        topology,
+        watcher.GlobalData.resize_settle_time_ms / 1000,
+        watcher.GlobalData.resize_max_delay_ms / 1000,
+    )
+    for record in event_list:
+        event_loop.call_later(record["t"], make_event_callback(record))
+
+    start_time: float = time.monotonic()
+    while event_loop.has_timers():
+        event_loop.run_once()
+    elapsed: float = time.monotonic() - start_time
+
+    for name, queue in (
+        ("mode list reads", [x for y in modes_map.values() for x in y]),
+        ("display reads", hw_queue),
+        ("compositor queries", compositor_queue),
+        ("display changes", apply_queue),
+    ):
+        if queue:
+            stats.diverge(f"{len(queue)} recorded {name} never happened")
+
+    trace_length: float = max((x["t"] for x in record_list), default=0.0)
+    print(
+        f"Replayed {len(event_list)} events from a {trace_length:.3f} s "
+        f"trace in {elapsed:.3f} s."
+    )
+    print(
+        f"Display changes: {stats.recorded_apply_count} recorded, "
+        f"{stats.replayed_apply_count} replayed."
+    )
+    print(f"Divergences: {stats.divergence_count}")
+    sys.exit(1 if stats.divergence_count else 0)
@@ -0,0 +1,78 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+sd_notify.py - Minimal implementation of systemd's service notification
+protocol, used to report readiness and keep the service watchdog happy, and
+of socket activation.
+"""
+
+import os
+import socket
+
+
+def notify(state: str) -> bool:
+    """
+    Sends a state string (e.g. "READY=1") to the service manager. Returns
+    False if not running under systemd or if sending failed.
+    """
+
+    notify_socket: str | None = os.environ.get("NOTIFY_SOCKET")
+    if not notify_socket:
+        return False
+    if notify_socket.startswith("@"):
+        ## Abstract namespace socket.
+        notify_socket = "\0" + notify_socket[1:]
+    try:
+        with socket.socket(
+            socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC
+        ) as sock:
+            sock.sendto(state.encode("utf-8"), notify_socket)
+    except OSError:
+        return False
+    return True
+
+
+def watchdog_interval() -> float | None:
+    """
+    Returns how often the watchdog should be pinged, in seconds, or None if
+    the watchdog is not enabled for this process.
+    """
+
+    watchdog_usec: str | None = os.environ.get("WATCHDOG_USEC")
+    if watchdog_usec is None:
+        return None
+    watchdog_pid: str | None = os.environ.get("WATCHDOG_PID")
+    if watchdog_pid is not None and watchdog_pid != str(os.getpid()):
+        return None
+    try:
+        ## Ping at twice the required rate, like sd_watchdog_enabled()
+        ## callers are advised to.
+        return int(watchdog_usec) / 1_000_000 / 2
+    except ValueError:
+        return None
+
+
+def listen_fds() -> list[int]:
+    """
+    Returns the file descriptors passed to this process through socket
+    activation, like sd_listen_fds(). The environment variables describing
+    them are removed, so they are not passed on to child processes.
+    """
+
+    listen_pid: str | None = os.environ.pop("LISTEN_PID", None)
+    listen_fds_str: str | None = os.environ.pop("LISTEN_FDS", None)
+    os.environ.pop("LISTEN_FDNAMES", None)
+    if listen_pid != str(os.getpid()) or listen_fds_str is None:
+        return []
+    try:
+        fd_count: int = int(listen_fds_str)
+    except ValueError:
+        return []
+    ## Passed file descriptors start right after stderr.
+    fd_list: list[int] = list(range(3, 3 + fd_count))
+    for fd in fd_list:
+        os.set_inheritable(fd, False)
+    return fd_list
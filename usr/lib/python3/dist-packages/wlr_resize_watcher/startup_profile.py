@@ -0,0 +1,153 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+startup_profile.py - Records how long each startup phase of
+wlr_resize_watcher takes, and how much memory it leaves behind, for the
+--profile-startup option.
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+PAGE_SIZE: int = os.sysconf("SC_PAGE_SIZE")
+
+
+def process_age() -> float | None:
+    """
+    Returns the time elapsed since this process was started, in seconds, or
+    None if it cannot be determined. The resolution is one clock tick
+    (usually 10 ms).
+    """
+
+    try:
+        with open("/proc/self/stat", "r", encoding="utf-8") as stat_file:
+            ## The command name may contain spaces, skip past it.
+            stat_list: list[str] = stat_file.read().rpartition(")")[2].split()
+        start_ticks: int = int(stat_list[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / (
+            os.sysconf("SC_CLK_TCK")
+        )
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_rss() -> int | None:
+    """
+    Returns the resident set size of this process in bytes, or None if it
+    cannot be determined.
+    """
+
+    try:
+        with open("/proc/self/statm", "rb") as statm_file:
+            return int(statm_file.read().split(maxsplit=2)[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_size(size: int | None) -> str:
+    """
+    Formats a size in bytes for log messages.
+    """
+
+    if size is None:
+        return "unknown"
+    if size < 1048576:
+        return f"{size / 1024:.0f} KiB"
+    return f"{size / 1048576:.1f} MiB"
+
+
+class StartupProfiler:
+    """
+    Collects phase timings, the resident set size after each phase, and the
+    peak Python heap usage during each phase (through tracemalloc). Does
+    nothing unless enabled.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        ## (name, duration, RSS afterwards, heap peak during the phase)
+        self.phase_list: list[tuple[str, float, int | None, int]] = []
+        self.start_time: float = time.monotonic()
+        self.pre_main_time: float | None = None
+
+    def enable(self) -> None:
+        """
+        Starts recording. The time spent before this call (interpreter
+        startup and module-level imports) is recorded as well, but only in
+        total: the modules imported at module level cannot be timed one by
+        one, as profiling is only enabled after they were imported.
+        """
+
+        # pylint: disable=import-outside-toplevel
+        import tracemalloc
+
+        self.enabled = True
+        self.start_time = time.monotonic()
+        self.pre_main_time = process_age()
+        tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Context manager that records the time spent in its body under the
+        given name.
+        """
+
+        if not self.enabled:
+            yield
+            return
+        # pylint: disable=import-outside-toplevel
+        import tracemalloc
+
+        tracemalloc.reset_peak()
+        phase_start: float = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phase_list.append(
+                (
+                    name,
+                    time.monotonic() - phase_start,
+                    read_rss(),
+                    tracemalloc.get_traced_memory()[1],
+                )
+            )
+
+    def report(self) -> None:
+        """
+        Prints all recorded timings and stops recording.
+        """
+
+        if not self.enabled:
+            return
+        # pylint: disable=import-outside-toplevel
+        import tracemalloc
+
+        if self.pre_main_time is not None:
+            print(
+                "INFO: startup: interpreter and module imports: "
+                f"{self.pre_main_time * 1000:.0f} ms (not broken down, see "
+                "python3 -X importtime)",
+                file=sys.stderr,
+            )
+        for name, duration, rss, heap_peak in self.phase_list:
+            print(
+                f"INFO: startup: {name}: {duration * 1000:.1f} ms, RSS "
+                f"{format_size(rss)}, heap peak {format_size(heap_peak)}",
+                file=sys.stderr,
+            )
+        print(
+            "INFO: startup: total since main(): "
+            f"{(time.monotonic() - self.start_time) * 1000:.1f} ms, heap "
+            f"{format_size(tracemalloc.get_traced_memory()[0])}",
+            file=sys.stderr,
+        )
+        tracemalloc.stop()
+        self.enabled = False
+        self.phase_list = []
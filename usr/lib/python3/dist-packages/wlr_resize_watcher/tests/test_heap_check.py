@@ -0,0 +1,49 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+test_heap_check.py - Runs the benchmark's heap check, which feeds hotplug
+events through the daemon's event handling code, and fails if the Python
+heap grows.
+"""
+
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any
+
+from wlr_resize_watcher import benchmark
+from wlr_resize_watcher import wlr_resize_watcher as watcher
+
+
+class HeapCheckTest(unittest.TestCase):
+    """
+    Tests that handling events does not leak memory.
+    """
+
+    def test_heap_bounded(self) -> None:
+        args = benchmark.parse_args(["--heap-check", "--heap-events", "10000"])
+        with tempfile.TemporaryDirectory(
+            prefix="wlr-resize-watcher-test."
+        ) as work_dir:
+            with contextlib.redirect_stderr(io.StringIO()):
+                heap_result: dict[str, Any] = benchmark.run_heap_check(
+                    args, Path(work_dir)
+                )
+                ## Don't report the suppressed messages at exit.
+                watcher.GlobalData.log.flush_suppressed(True)
+        self.assertEqual(heap_result["events"], 10000)
+        ## The last event switches to the last mode of the cycle.
+        self.assertEqual(heap_result["final_mode"], "1024x768")
+        self.assertLessEqual(
+            heap_result["heap_growth_bytes"],
+            args.heap_growth_limit_kib * 1024,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+test_wlr_randr_json.py - Tests for parse_wlr_randr_json, against the
+'wlr-randr --json' output of labwc, sway and wayfire in data/ and against
+hand-made edge cases.
+"""
+
+import contextlib
+import io
+import json
+import unittest
+from pathlib import Path
+from typing import Any
+
+from wlr_resize_watcher.wlr_resize_watcher import (
+    CompositorDisplayInfo,
+    parse_wlr_randr_json,
+)
+
+DATA_DIR: Path = Path(__file__).parent / "data"
+
+
+def read_fixture(name: str) -> str:
+    """
+    Returns the contents of a file in data/.
+    """
+
+    return (DATA_DIR / name).read_text(encoding="utf-8")
+
+
+def make_output(**override_map: Any) -> dict[str, Any]:
+    """
+    Returns a single enabled output with one current mode, with fields
+    replaced by override_map.
+    """
+
+    output: dict[str, Any] = {
+        "name": "Virtual-1",
+        "enabled": True,
+        "modes": [
+            {
+                "width": 1024,
+                "height": 768,
+                "refresh": 60.004002,
+                "preferred": True,
+                "current": True,
+            }
+        ],
+        "position": {"x": 0, "y": 0},
+        "transform": "normal",
+        "scale": 1.0,
+    }
+    output.update(override_map)
+    return output
+
+
+class ParseWlrRandrJsonTest(unittest.TestCase):
+    """
+    Tests for parse_wlr_randr_json.
+    """
+
+    def parse_quiet(self, json_str: str) -> Any:
+        """
+        Parses json_str, discarding the errors logged on the way.
+        """
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            return parse_wlr_randr_json(json_str)
+
+    def test_labwc(self) -> None:
+        disp_list = parse_wlr_randr_json(read_fixture("wlr_randr_labwc.json"))
+        assert disp_list is not None
+        ## Virtual-2 is disabled.
+        self.assertEqual([x.disp_name for x in disp_list], ["Virtual-1"])
+        disp = disp_list[0]
+        assert isinstance(disp, CompositorDisplayInfo)
+        ## The current mode is not the preferred one.
+        self.assertEqual(disp.disp_mode, "1920x1080")
+        self.assertEqual(disp.refresh, 60000)
+        self.assertEqual(disp.make, "Red Hat, Inc.")
+        self.assertEqual(disp.model, "QEMU Monitor")
+        self.assertEqual(len(disp.mode_list), 5)
+        self.assertEqual(
+            [
+                (x.width, x.height, x.refresh)
+                for x in disp.mode_list
+                if x.preferred
+            ],
+            [(1280, 800, 74995)],
+        )
+
+    def test_sway(self) -> None:
+        disp_list = parse_wlr_randr_json(read_fixture("wlr_randr_sway.json"))
+        assert disp_list is not None
+        self.assertEqual(
+            [(x.disp_name, x.disp_mode) for x in disp_list],
+            [("Virtual-1", "1024x768"), ("Virtual-2", "1280x720")],
+        )
+        disp = disp_list[1]
+        assert isinstance(disp, CompositorDisplayInfo)
+        self.assertEqual(disp.refresh, 59855)
+        self.assertEqual((disp.pos_x, disp.pos_y), (1024, 0))
+        self.assertEqual(disp.scale, 1.5)
+        self.assertEqual(disp.transform, "90")
+
+    def test_wayfire(self) -> None:
+        disp_list = parse_wlr_randr_json(
+            read_fixture("wlr_randr_wayfire.json")
+        )
+        assert disp_list is not None
+        disp = disp_list[0]
+        assert isinstance(disp, CompositorDisplayInfo)
+        self.assertEqual(disp.disp_mode, "1280x800")
+        self.assertEqual(disp.refresh, 59810)
+        self.assertEqual(disp.mode_list[0].refresh, 0)
+
+    def test_missing_refresh_and_preferred(self) -> None:
+        output: dict[str, Any] = make_output(
+            modes=[
+                {"width": 1024, "height": 768, "current": True},
+                {"width": 800, "height": 600, "refresh": 60.317001},
+            ]
+        )
+        disp_list = parse_wlr_randr_json(json.dumps([output]))
+        assert disp_list is not None
+        disp = disp_list[0]
+        assert isinstance(disp, CompositorDisplayInfo)
+        self.assertEqual(disp.disp_mode, "1024x768")
+        self.assertEqual(disp.refresh, 0)
+        self.assertEqual(
+            [(x.refresh, x.preferred) for x in disp.mode_list],
+            [(0, False), (60317, False)],
+        )
+
+    def test_missing_optional_fields(self) -> None:
+        output: dict[str, Any] = make_output()
+        for name in ("position", "transform", "scale"):
+            del output[name]
+        disp_list = parse_wlr_randr_json(json.dumps([output]))
+        assert disp_list is not None
+        disp = disp_list[0]
+        assert isinstance(disp, CompositorDisplayInfo)
+        self.assertEqual((disp.pos_x, disp.pos_y), (0, 0))
+        self.assertEqual(disp.scale, 1.0)
+        self.assertEqual(disp.transform, "normal")
+        self.assertEqual((disp.make, disp.model, disp.serial), ("", "", ""))
+
+    def test_all_disabled(self) -> None:
+        output: dict[str, Any] = make_output(enabled=False)
+        self.assertIsNone(parse_wlr_randr_json(json.dumps([output])))
+        self.assertIsNone(parse_wlr_randr_json("[]"))
+
+    def test_no_current_mode(self) -> None:
+        output: dict[str, Any] = make_output()
+        output["modes"][0]["current"] = False
+        self.assertIsNone(self.parse_quiet(json.dumps([output])))
+
+    def test_malformed(self) -> None:
+        for json_str in (
+            "",
+            "not json",
+            '[{"name": "Virtual-1", "enabled": true',
+            "{}",
+            "[1]",
+            '[{"enabled": true}]',
+            json.dumps([make_output(modes=[{"width": "wide"}])]),
+            json.dumps([make_output(modes=None)]),
+            json.dumps([make_output(position=[0, 0])]),
+        ):
+            with self.subTest(json_str=json_str):
+                self.assertIsNone(self.parse_quiet(json_str))
+
+
+if __name__ == "__main__":
+    unittest.main()
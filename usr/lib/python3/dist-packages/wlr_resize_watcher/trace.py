@@ -0,0 +1,87 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+trace.py - Trace files of wlr_resize_watcher sessions, written with
+--record and played back with --replay. A trace is a JSON object per line:
+a header, then one record per input the daemon read or action it took,
+each with its kind and the time in seconds since recording started.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, TextIO
+
+TRACE_VERSION: int = 1
+
+
+class TraceWriter:
+    """
+    Appends records to a trace file. Every record is flushed right away, so
+    the trace is complete up to the moment the daemon is stopped.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Creates the trace file. Raises OSError on failure.
+        """
+
+        self.trace_file: TextIO = open(path, "w", encoding="utf-8")
+        self.start_time: float = time.monotonic()
+        self.trace_file.write(
+            json.dumps({"kind": "header", "version": TRACE_VERSION}) + "\n"
+        )
+        self.trace_file.flush()
+
+    def write(self, kind: str, **field_map: Any) -> None:
+        """
+        Appends a record of the given kind.
+        """
+
+        record: dict[str, Any] = {
+            "t": round(time.monotonic() - self.start_time, 6),
+            "kind": kind,
+        }
+        record.update(field_map)
+        self.trace_file.write(json.dumps(record) + "\n")
+        self.trace_file.flush()
+
+
+def read_trace(path: Path) -> list[dict[str, Any]]:
+    """
+    Reads all records of a trace file, without the header. Raises OSError
+    if the file cannot be read and ValueError if it is not a trace of this
+    version. A truncated last line, as left by a killed recording, is
+    ignored.
+    """
+
+    with open(path, "r", encoding="utf-8") as trace_file:
+        line_list: list[str] = trace_file.readlines()
+    if not line_list:
+        raise ValueError(f"'{path}' is empty!")
+    header: Any = json.loads(line_list[0])
+    if (
+        not isinstance(header, dict)
+        or header.get("kind") != "header"
+        or header.get("version") != TRACE_VERSION
+    ):
+        raise ValueError(f"'{path}' is not a version {TRACE_VERSION} trace!")
+    record_list: list[dict[str, Any]] = []
+    for idx, line in enumerate(line_list[1:], start=2):
+        try:
+            record: Any = json.loads(line)
+        except ValueError:
+            if idx == len(line_list) and not line.endswith("\n"):
+                break
+            raise
+        if (
+            not isinstance(record, dict)
+            or not isinstance(record.get("t"), (int, float))
+            or not isinstance(record.get("kind"), str)
+        ):
+            raise ValueError(f"Malformed record on line {idx} of '{path}'!")
+        record_list.append(record)
+    return record_list
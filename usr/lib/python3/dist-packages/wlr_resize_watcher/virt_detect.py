@@ -0,0 +1,181 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+"""
+virt_detect.py - Virtualizer detection for wlr_resize_watcher. Reads the
+same firmware and kernel information systemd-detect-virt uses, but without
+spawning a process. The returned names match systemd-detect-virt's output.
+
+If vm-config-dist's probe-environment has already run systemd-detect-virt
+this boot, its result is used instead.
+"""
+
+import os
+from pathlib import Path
+
+## Written once per boot by /usr/libexec/vm-config-dist/probe-environment.
+PROBED_ENVIRONMENT_PATH: Path = Path("/run/vm-config-dist/environment")
+
+## Checked in order, the first match wins. Matching is done against the
+## start of the DMI field, like systemd does.
+DMI_VENDOR_TABLE: list[tuple[str, str]] = [
+    ("KVM", "kvm"),
+    ("OpenStack", "kvm"),
+    ("KubeVirt", "kvm"),
+    ("Amazon EC2", "amazon"),
+    ("QEMU", "qemu"),
+    ("VMware", "vmware"),
+    ("VMW", "vmware"),
+    ("innotek GmbH", "oracle"),
+    ("VirtualBox", "oracle"),
+    ("Oracle Corporation", "oracle"),
+    ("Xen", "xen"),
+    ("Bochs", "bochs"),
+    ("Parallels", "parallels"),
+    ("BHYVE", "bhyve"),
+    ("Hyper-V", "microsoft"),
+    ("Apple Virtualization", "apple"),
+]
+DMI_FIELD_LIST: list[str] = [
+    "product_name",
+    "sys_vendor",
+    "board_vendor",
+    "bios_vendor",
+    "product_version",
+]
+
+
+def read_sysfs_str(path: Path) -> str | None:
+    """
+    Returns the stripped contents of a small text file, or None if it cannot
+    be read.
+    """
+
+    try:
+        return path.read_text(encoding="utf-8", errors="replace").strip()
+    except OSError:
+        return None
+
+
+def detect_dmi_vendor(dmi_path: Path) -> str | None:
+    """
+    Identifies the virtualizer from the DMI tables, or returns None if they
+    don't name a known one.
+    """
+
+    ## Hyper-V only names Microsoft, which makes physical hardware as well
+    ## (e.g. Surface devices), so the product name has to be checked too.
+    sys_vendor: str | None = read_sysfs_str(dmi_path / "sys_vendor")
+    if sys_vendor is not None and sys_vendor.startswith(
+        "Microsoft Corporation"
+    ):
+        if read_sysfs_str(dmi_path / "product_name") == "Virtual Machine":
+            return "microsoft"
+    for field in DMI_FIELD_LIST:
+        value: str | None = read_sysfs_str(dmi_path / field)
+        if not value:
+            continue
+        for prefix, virt_name in DMI_VENDOR_TABLE:
+            if value.startswith(prefix):
+                return virt_name
+    return None
+
+
+def read_cpu_flag_set(cpuinfo_path: Path) -> set[str] | None:
+    """
+    Returns the CPU feature flags of the first CPU, or None if the kernel
+    does not report any (e.g. on non-x86 architectures).
+    """
+
+    try:
+        with open(cpuinfo_path, "r", encoding="utf-8") as cpuinfo_file:
+            for line in cpuinfo_file:
+                if line.startswith("flags"):
+                    return set(line.partition(":")[2].split())
+    except OSError:
+        return None
+    return None
+
+
+def detect_virtualizer(root: Path = Path("/")) -> str | None:
+    """
+    Returns the name of the virtualizer in use, "none" on physical hardware,
+    or None if this cannot be determined without systemd-detect-virt.
+    """
+
+    dmi_virt: str | None = detect_dmi_vendor(root / "sys/class/dmi/id")
+    ## VirtualBox may expose KVM's paravirtualization interface, it is still
+    ## VirtualBox.
+    if dmi_virt == "oracle":
+        return dmi_virt
+
+    if (root / "proc/xen").is_dir() or read_sysfs_str(
+        root / "sys/hypervisor/type"
+    ) == "xen":
+        ## Like systemd-detect-virt, dom0 is not considered a VM, it drives
+        ## the hardware.
+        capabilities_str: str | None = read_sysfs_str(
+            root / "proc/xen/capabilities"
+        )
+        if capabilities_str is not None and "control_d" in capabilities_str:
+            return "none"
+        return "xen"
+
+    ## systemd asks the CPU (CPUID) which hypervisor is in use, which tells
+    ## KVM apart from QEMU's emulation. The KVM clock source is only offered
+    ## to KVM guests and gives the same answer, unless it was turned off
+    ## (e.g. with no-kvmclock on the kernel command line).
+    clocksource_str: str | None = read_sysfs_str(
+        root
+        / "sys/devices/system/clocksource/clocksource0/available_clocksource"
+    )
+    if clocksource_str is not None and "kvm-clock" in clocksource_str.split():
+        return "kvm"
+
+    cpu_flag_set: set[str] | None = read_cpu_flag_set(root / "proc/cpuinfo")
+    ## Without the KVM clock source, QEMU's firmware on a CPU that reports a
+    ## hypervisor is still taken to be KVM, as QEMU is nearly always run
+    ## with it. A guest of QEMU's emulation alone is taken to be KVM as
+    ## well this way.
+    if (
+        dmi_virt == "qemu"
+        and cpu_flag_set is not None
+        and "hypervisor" in cpu_flag_set
+    ):
+        return "kvm"
+
+    if dmi_virt is not None:
+        return dmi_virt
+
+    if cpu_flag_set is None:
+        return None
+    if "hypervisor" in cpu_flag_set:
+        return "vm-other"
+    return "none"
+
+
+def read_probed_environment(
+    path: Path = PROBED_ENVIRONMENT_PATH,
+) -> dict[str, str]:
+    """
+    Returns what probe-environment recorded about the system this boot,
+    keyed like its file (virtualizer, qubes, gl_renderer). Returns an empty
+    dict if it has not run, or if the file is not owned by root or is
+    writable by others.
+    """
+
+    probed_map: dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as probed_file:
+            stat_result: os.stat_result = os.fstat(probed_file.fileno())
+            if stat_result.st_uid != 0 or stat_result.st_mode & 0o022:
+                return {}
+            for line in probed_file:
+                key, sep, value = line.rstrip("\n").partition("=")
+                if sep:
+                    probed_map[key] = value
+    except (OSError, ValueError):
+        return {}
+    return probed_map
@@ -0,0 +1,135 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+warm_start.py - Keeps a snapshot of the display modes wlr_resize_watcher
+last applied, so they can be restored right at the start of the next
+session, before the resize helper and the desktop are up.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+SNAPSHOT_VERSION: int = 1
+
+
+class OutputSnapshot:
+    """
+    The last applied mode of one display, identified by its card, connector
+    name and connector object ID (None if the kernel does not report it).
+    """
+
+    __slots__ = (
+        "card_name",
+        "disp_name",
+        "connector_id",
+        "disp_mode",
+        "refresh",
+    )
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        card_name: str,
+        disp_name: str,
+        connector_id: int | None,
+        disp_mode: str,
+        refresh: int,
+    ) -> None:
+        self.card_name: str = card_name
+        self.disp_name: str = disp_name
+        self.connector_id: int | None = connector_id
+        self.disp_mode: str = disp_mode
+        self.refresh: int = refresh
+
+    def identity(self) -> tuple[str, str, int | None]:
+        """
+        Returns what identifies the display this snapshot is about.
+        """
+
+        return (self.card_name, self.disp_name, self.connector_id)
+
+
+def get_snapshot_path() -> Path | None:
+    """
+    Returns the path of the snapshot file in $XDG_STATE_HOME (by default
+    ~/.local/state), or None if neither it nor $HOME is set.
+    """
+
+    state_dir: str | None = os.environ.get("XDG_STATE_HOME")
+    if not state_dir:
+        home_dir: str | None = os.environ.get("HOME")
+        if not home_dir:
+            return None
+        state_dir = os.path.join(home_dir, ".local", "state")
+    return Path(state_dir) / "wlr-resize-watcher" / "display-snapshot.json"
+
+
+def load_snapshot(
+    path: Path, virtualizer_str: str | None
+) -> list[OutputSnapshot] | None:
+    """
+    Reads a snapshot. Returns None if there is none, if it cannot be read,
+    or if it was taken under a different virtualizer.
+    """
+
+    try:
+        with open(path, "r", encoding="utf-8") as snapshot_file:
+            snapshot: Any = json.load(snapshot_file)
+        if (
+            snapshot["version"] != SNAPSHOT_VERSION
+            or snapshot["virtualizer"] != virtualizer_str
+        ):
+            return None
+        return [
+            OutputSnapshot(
+                str(x["card"]),
+                str(x["connector"]),
+                None if x["connector_id"] is None else int(x["connector_id"]),
+                str(x["mode"]),
+                int(x["refresh"]),
+            )
+            for x in snapshot["output_list"]
+        ]
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def save_snapshot(
+    path: Path,
+    virtualizer_str: str | None,
+    output_list: list[OutputSnapshot],
+) -> None:
+    """
+    Atomically replaces the snapshot file. Raises OSError on failure.
+    """
+
+    snapshot: dict[str, Any] = {
+        "version": SNAPSHOT_VERSION,
+        "virtualizer": virtualizer_str,
+        "output_list": [
+            {
+                "card": x.card_name,
+                "connector": x.disp_name,
+                "connector_id": x.connector_id,
+                "mode": x.disp_mode,
+                "refresh": x.refresh,
+            }
+            for x in output_list
+        ],
+    }
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    ## Several sessions of the same user may save at the same time.
+    tmp_path: Path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_text(json.dumps(snapshot), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
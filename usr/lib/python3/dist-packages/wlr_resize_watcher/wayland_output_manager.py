@@ -0,0 +1,542 @@
+#!/usr/bin/python3 -su
+
+# Copyright (C) 2025 - 2025 ENCRYPTED SUPPORT LLC <adrelanos@whonix.org>
+# See the file COPYING for copying conditions.
+
+# pylint: disable=too-few-public-methods
+
+"""
+wayland_output_manager.py - Minimal Wayland client implementing the
+wlr-output-management-unstable-v1 protocol. Keeps a single connection to the
+compositor open, mirrors the compositor's output heads and modes in memory,
+and applies mode changes through output configuration objects. Only the
+parts of the Wayland wire protocol needed for this are implemented, no file
+descriptors are ever passed.
+"""
+
+import os
+import socket
+import struct
+from typing import Any
+
+WL_DISPLAY_ID: int = 1
+SERVER_ID_START: int = 0xFF000000
+MAX_BIND_VERSION: int = 4
+
+## Opcodes, see wayland.xml and wlr-output-management-unstable-v1.xml.
+WL_DISPLAY_SYNC: int = 0
+WL_DISPLAY_GET_REGISTRY: int = 1
+WL_REGISTRY_BIND: int = 0
+MANAGER_CREATE_CONFIGURATION: int = 0
+HEAD_RELEASE: int = 0
+MODE_RELEASE: int = 0
+CONFIGURATION_ENABLE_HEAD: int = 0
+CONFIGURATION_DISABLE_HEAD: int = 1
+CONFIGURATION_APPLY: int = 2
+CONFIGURATION_TEST: int = 3
+CONFIGURATION_DESTROY: int = 4
+CONFIGURATION_HEAD_SET_MODE: int = 0
+CONFIGURATION_HEAD_SET_CUSTOM_MODE: int = 1
+CONFIGURATION_HEAD_SET_POSITION: int = 2
+
+
+class WaylandError(Exception):
+    """
+    Raised when the compositor connection fails, the compositor reports a
+    protocol error, or a required global is missing.
+    """
+
+
+class OutputMode:
+    """
+    A mode advertised by the compositor for an output head.
+    """
+
+    __slots__ = ("obj_id", "width", "height", "refresh", "preferred")
+
+    def __init__(self, obj_id: int) -> None:
+        self.obj_id: int = obj_id
+        self.width: int = 0
+        self.height: int = 0
+        self.refresh: int = 0
+        self.preferred: bool = False
+
+
+# pylint: disable=too-many-instance-attributes
+class OutputHead:
+    """
+    An output head as seen by the compositor, with the state most recently
+    reported by the protocol.
+    """
+
+    __slots__ = (
+        "obj_id",
+        "name",
+        "description",
+        "enabled",
+        "current_mode",
+        "mode_list",
+        "pos_x",
+        "pos_y",
+        "transform",
+        "scale",
+        "make",
+        "model",
+        "serial_number",
+    )
+
+    def __init__(self, obj_id: int) -> None:
+        self.obj_id: int = obj_id
+        self.name: str = ""
+        self.description: str = ""
+        self.enabled: bool = False
+        self.current_mode: OutputMode | None = None
+        self.mode_list: list[OutputMode] = []
+        self.pos_x: int = 0
+        self.pos_y: int = 0
+        self.transform: int = 0
+        self.scale: float = 1.0
+        self.make: str = ""
+        self.model: str = ""
+        self.serial_number: str = ""
+
+
+class HeadConfig:
+    """
+    Requested state for one head in an output configuration. The refresh
+    rate is in mHz. A width of 0 keeps the current mode, a position of None
+    keeps the current position.
+    """
+
+    __slots__ = ("head", "width", "height", "refresh", "pos")
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        head: OutputHead,
+        width: int,
+        height: int,
+        refresh: int,
+        pos: tuple[int, int] | None = None,
+    ) -> None:
+        self.head: OutputHead = head
+        self.width: int = width
+        self.height: int = height
+        self.refresh: int = refresh
+        self.pos: tuple[int, int] | None = pos
+
+
+def _pad4(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _encode_string(value: str) -> bytes:
+    raw: bytes = value.encode("utf-8") + b"\0"
+    return struct.pack("=I", len(raw)) + raw.ljust(_pad4(len(raw)), b"\0")
+
+
+# pylint: disable=too-many-instance-attributes
+class OutputManagerClient:
+    """
+    Persistent connection to the compositor bound to zwlr_output_manager_v1.
+    """
+
+    def __init__(self) -> None:
+        self.sock: socket.socket | None = None
+        self.recv_buf: bytearray = bytearray()
+        self.next_id: int = 2
+        self.free_id_list: list[int] = []
+        self.obj_map: dict[int, tuple[str, Any]] = {}
+        self.manager_id: int | None = None
+        self.manager_version: int = 0
+        self.head_map: dict[int, OutputHead] = {}
+        self.mode_map: dict[int, OutputMode] = {}
+        self.serial: int | None = None
+        self.callback_done_set: set[int] = set()
+        self.config_result_map: dict[int, str] = {}
+
+    def connect(self) -> None:
+        """
+        Connects to the compositor, binds the output manager and waits for the
+        initial output state.
+        """
+
+        self.sock = self._open_socket()
+        registry_id: int = self._new_id("wl_registry", None)
+        self._send(
+            WL_DISPLAY_ID,
+            WL_DISPLAY_GET_REGISTRY,
+            struct.pack("=I", registry_id),
+        )
+        self.roundtrip()
+        if self.manager_id is None:
+            raise WaylandError(
+                "Compositor does not support zwlr_output_manager_v1"
+            )
+        ## The manager sends its initial heads and a done event in response
+        ## to the bind, which the second roundtrip collects.
+        self.roundtrip()
+        if self.serial is None:
+            raise WaylandError("Compositor did not send output state")
+
+    def fileno(self) -> int:
+        """
+        Returns the connection's file descriptor, for use with poll/select.
+        """
+
+        assert self.sock is not None
+        return self.sock.fileno()
+
+    def roundtrip(self) -> None:
+        """
+        Sends a wl_display.sync request and dispatches events until the
+        compositor answers it, ensuring all previously sent requests have been
+        processed and all resulting events have been handled.
+        """
+
+        callback_id: int = self._new_id("wl_callback", None)
+        self._send(
+            WL_DISPLAY_ID, WL_DISPLAY_SYNC, struct.pack("=I", callback_id)
+        )
+        while callback_id not in self.callback_done_set:
+            self.dispatch(block=True)
+        self.callback_done_set.discard(callback_id)
+
+    def dispatch(self, block: bool = False) -> None:
+        """
+        Reads and handles all events currently available on the connection.
+        If block is True, waits for at least one read to complete.
+        """
+
+        assert self.sock is not None
+        try:
+            data: bytes = self.sock.recv(
+                65536, 0 if block else socket.MSG_DONTWAIT
+            )
+        except BlockingIOError:
+            return
+        except OSError as e:
+            raise WaylandError("Lost connection to compositor") from e
+        if not data:
+            raise WaylandError("Compositor closed the connection")
+        self.recv_buf += data
+
+        while len(self.recv_buf) >= 8:
+            obj_id, size_opcode = struct.unpack_from("=II", self.recv_buf, 0)
+            size: int = size_opcode >> 16
+            opcode: int = size_opcode & 0xFFFF
+            if size < 8:
+                raise WaylandError("Malformed message from compositor")
+            if len(self.recv_buf) < size:
+                break
+            payload: bytes = bytes(self.recv_buf[8:size])
+            del self.recv_buf[:size]
+            self._handle_event(obj_id, opcode, payload)
+
+    def apply(
+        self, config_list: list[HeadConfig], test_only: bool = False
+    ) -> str:
+        """
+        Applies the state in config_list in one output configuration, so the
+        compositor changes all heads at once or none of them. Heads not in
+        config_list keep their current state. With test_only, the compositor
+        only checks whether it could apply the configuration. Returns
+        "succeeded", "failed" or "cancelled".
+        """
+
+        assert self.manager_id is not None
+        assert self.serial is not None
+        config_id: int = self._new_id("zwlr_output_configuration_v1", None)
+        self._send(
+            self.manager_id,
+            MANAGER_CREATE_CONFIGURATION,
+            struct.pack("=II", config_id, self.serial),
+        )
+
+        config_map: dict[int, HeadConfig] = {
+            x.head.obj_id: x for x in config_list
+        }
+        ## Every head has to be part of the configuration, otherwise the
+        ## compositor raises an unconfigured_head protocol error.
+        for head in self.head_map.values():
+            if not head.enabled:
+                self._send(
+                    config_id,
+                    CONFIGURATION_DISABLE_HEAD,
+                    struct.pack("=I", head.obj_id),
+                )
+                continue
+            config_head_id: int = self._new_id(
+                "zwlr_output_configuration_head_v1", None
+            )
+            self._send(
+                config_id,
+                CONFIGURATION_ENABLE_HEAD,
+                struct.pack("=II", config_head_id, head.obj_id),
+            )
+            head_config: HeadConfig | None = config_map.get(head.obj_id)
+            if head_config is not None:
+                self._configure_head(config_head_id, head_config)
+            ## Configuration heads have no destructor, they become inert once
+            ## the configuration is applied and their id is released via
+            ## wl_display.delete_id.
+
+        self._send(
+            config_id,
+            CONFIGURATION_TEST if test_only else CONFIGURATION_APPLY,
+            b"",
+        )
+        while config_id not in self.config_result_map:
+            self.dispatch(block=True)
+        result: str = self.config_result_map.pop(config_id)
+        self._send(config_id, CONFIGURATION_DESTROY, b"")
+        return result
+
+    def close(self) -> None:
+        """
+        Closes the compositor connection.
+        """
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _configure_head(
+        self, config_head_id: int, head_config: HeadConfig
+    ) -> None:
+        if head_config.pos is not None:
+            self._send(
+                config_head_id,
+                CONFIGURATION_HEAD_SET_POSITION,
+                struct.pack("=ii", *head_config.pos),
+            )
+        if head_config.width == 0:
+            return
+        mode: OutputMode | None = self._find_mode(head_config)
+        if mode is not None:
+            self._send(
+                config_head_id,
+                CONFIGURATION_HEAD_SET_MODE,
+                struct.pack("=I", mode.obj_id),
+            )
+            return
+        self._send(
+            config_head_id,
+            CONFIGURATION_HEAD_SET_CUSTOM_MODE,
+            struct.pack(
+                "=iii",
+                head_config.width,
+                head_config.height,
+                head_config.refresh,
+            ),
+        )
+
+    @staticmethod
+    def _find_mode(head_config: HeadConfig) -> OutputMode | None:
+        ## Only an exact size and refresh match is used as an advertised mode,
+        ## everything else goes through set_custom_mode just like
+        ## 'wlr-randr --custom-mode' does.
+        for mode in head_config.head.mode_list:
+            if (
+                mode.width == head_config.width
+                and mode.height == head_config.height
+                and mode.refresh == head_config.refresh
+            ):
+                return mode
+        return None
+
+    @staticmethod
+    def _open_socket() -> socket.socket:
+        wayland_socket_fd: str | None = os.environ.get("WAYLAND_SOCKET")
+        if wayland_socket_fd is not None:
+            return socket.socket(fileno=int(wayland_socket_fd))
+
+        wayland_display: str = os.environ.get("WAYLAND_DISPLAY", "wayland-0")
+        if not wayland_display.startswith("/"):
+            runtime_dir: str | None = os.environ.get("XDG_RUNTIME_DIR")
+            if runtime_dir is None:
+                raise WaylandError("XDG_RUNTIME_DIR is not set")
+            wayland_display = os.path.join(runtime_dir, wayland_display)
+
+        sock: socket.socket = socket.socket(
+            socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC
+        )
+        try:
+            sock.connect(wayland_display)
+        except OSError as e:
+            sock.close()
+            raise WaylandError(
+                f"Cannot connect to Wayland display '{wayland_display}'"
+            ) from e
+        return sock
+
+    def _new_id(self, interface: str, obj: Any) -> int:
+        obj_id: int
+        if self.free_id_list:
+            obj_id = self.free_id_list.pop()
+        else:
+            obj_id = self.next_id
+            self.next_id += 1
+        self.obj_map[obj_id] = (interface, obj)
+        return obj_id
+
+    def _send(self, obj_id: int, opcode: int, payload: bytes) -> None:
+        assert self.sock is not None
+        header: bytes = struct.pack(
+            "=II", obj_id, ((8 + len(payload)) << 16) | opcode
+        )
+        try:
+            self.sock.sendall(header + payload)
+        except OSError as e:
+            raise WaylandError("Lost connection to compositor") from e
+
+    # pylint: disable=too-many-branches,too-many-statements
+    def _handle_event(self, obj_id: int, opcode: int, payload: bytes) -> None:
+        if obj_id == WL_DISPLAY_ID:
+            if opcode == 0:
+                err_obj, err_code = struct.unpack_from("=II", payload, 0)
+                err_msg: str = _decode_string(payload, 8)[0]
+                raise WaylandError(
+                    f"Protocol error on object {err_obj} "
+                    f"(code {err_code}): {err_msg}"
+                )
+            if opcode == 1:
+                deleted_id: int = struct.unpack_from("=I", payload, 0)[0]
+                self.obj_map.pop(deleted_id, None)
+                if deleted_id < SERVER_ID_START:
+                    self.free_id_list.append(deleted_id)
+            return
+
+        obj_entry: tuple[str, Any] | None = self.obj_map.get(obj_id)
+        if obj_entry is None:
+            ## Event for an object we already destroyed, ignore it.
+            return
+        interface: str = obj_entry[0]
+        obj: Any = obj_entry[1]
+
+        if interface == "wl_registry":
+            if opcode == 0:
+                name: int = struct.unpack_from("=I", payload, 0)[0]
+                iface_name, offset = _decode_string(payload, 4)
+                version: int = struct.unpack_from("=I", payload, offset)[0]
+                if (
+                    iface_name == "zwlr_output_manager_v1"
+                    and self.manager_id is None
+                ):
+                    self._bind_manager(
+                        obj_id, name, min(version, MAX_BIND_VERSION)
+                    )
+        elif interface == "wl_callback":
+            if opcode == 0:
+                self.callback_done_set.add(obj_id)
+                ## Callbacks are destroyed by the compositor after done.
+        elif interface == "zwlr_output_manager_v1":
+            self._handle_manager_event(opcode, payload)
+        elif interface == "zwlr_output_head_v1":
+            self._handle_head_event(obj, opcode, payload)
+        elif interface == "zwlr_output_mode_v1":
+            self._handle_mode_event(obj, opcode, payload)
+        elif interface == "zwlr_output_configuration_v1":
+            if opcode == 0:
+                self.config_result_map[obj_id] = "succeeded"
+            elif opcode == 1:
+                self.config_result_map[obj_id] = "failed"
+            elif opcode == 2:
+                self.config_result_map[obj_id] = "cancelled"
+
+    def _bind_manager(self, registry_id: int, name: int, version: int) -> None:
+        self.manager_id = self._new_id("zwlr_output_manager_v1", None)
+        self.manager_version = version
+        self._send(
+            registry_id,
+            WL_REGISTRY_BIND,
+            struct.pack("=I", name)
+            + _encode_string("zwlr_output_manager_v1")
+            + struct.pack("=II", version, self.manager_id),
+        )
+
+    def _handle_manager_event(self, opcode: int, payload: bytes) -> None:
+        if opcode == 0:
+            head_id: int = struct.unpack_from("=I", payload, 0)[0]
+            head: OutputHead = OutputHead(head_id)
+            self.head_map[head_id] = head
+            self.obj_map[head_id] = ("zwlr_output_head_v1", head)
+        elif opcode == 1:
+            self.serial = struct.unpack_from("=I", payload, 0)[0]
+        elif opcode == 2:
+            raise WaylandError("Compositor finished the output manager")
+
+    # pylint: disable=too-many-branches
+    def _handle_head_event(
+        self, head: OutputHead, opcode: int, payload: bytes
+    ) -> None:
+        if opcode == 0:
+            head.name = _decode_string(payload, 0)[0]
+        elif opcode == 1:
+            head.description = _decode_string(payload, 0)[0]
+        elif opcode == 3:
+            mode_id: int = struct.unpack_from("=I", payload, 0)[0]
+            mode: OutputMode = OutputMode(mode_id)
+            head.mode_list.append(mode)
+            self.mode_map[mode_id] = mode
+            self.obj_map[mode_id] = ("zwlr_output_mode_v1", (head, mode))
+        elif opcode == 4:
+            head.enabled = struct.unpack_from("=i", payload, 0)[0] != 0
+            if not head.enabled:
+                head.current_mode = None
+        elif opcode == 5:
+            current_id: int = struct.unpack_from("=I", payload, 0)[0]
+            head.current_mode = self.mode_map.get(current_id)
+        elif opcode == 6:
+            head.pos_x, head.pos_y = struct.unpack_from("=ii", payload, 0)
+        elif opcode == 7:
+            head.transform = struct.unpack_from("=i", payload, 0)[0]
+        elif opcode == 8:
+            head.scale = struct.unpack_from("=i", payload, 0)[0] / 256.0
+        elif opcode == 9:
+            self.head_map.pop(head.obj_id, None)
+            for mode in head.mode_list:
+                self.mode_map.pop(mode.obj_id, None)
+            if self.manager_version >= 3:
+                self._send(head.obj_id, HEAD_RELEASE, b"")
+            self.obj_map.pop(head.obj_id, None)
+        elif opcode == 10:
+            head.make = _decode_string(payload, 0)[0]
+        elif opcode == 11:
+            head.model = _decode_string(payload, 0)[0]
+        elif opcode == 12:
+            head.serial_number = _decode_string(payload, 0)[0]
+
+    def _handle_mode_event(
+        self,
+        head_mode: tuple[OutputHead, OutputMode],
+        opcode: int,
+        payload: bytes,
+    ) -> None:
+        head, mode = head_mode
+        if opcode == 0:
+            mode.width, mode.height = struct.unpack_from("=ii", payload, 0)
+        elif opcode == 1:
+            mode.refresh = struct.unpack_from("=i", payload, 0)[0]
+        elif opcode == 2:
+            mode.preferred = True
+        elif opcode == 3:
+            if mode in head.mode_list:
+                head.mode_list.remove(mode)
+            if head.current_mode is mode:
+                head.current_mode = None
+            self.mode_map.pop(mode.obj_id, None)
+            if self.manager_version >= 3:
+                self._send(mode.obj_id, MODE_RELEASE, b"")
+            self.obj_map.pop(mode.obj_id, None)
+
+
+def _decode_string(payload: bytes, offset: int) -> tuple[str, int]:
+    length: int = struct.unpack_from("=I", payload, offset)[0]
+    start: int = offset + 4
+    if length == 0:
+        return "", start
+    value: str = payload[start : start + length - 1].decode(
+        "utf-8", errors="replace"
+    )
+    return value, start + _pad4(length)
@@ -13,17 +13,68 @@ match. This allows dynamic resolution changes to work in VirtualBox and KVM.
 """
 
 import sys
+import gc
 import re
+import json
 import time
 import os
-import subprocess
-import traceback
+import select
+import signal
 from pathlib import Path
-from typing import Pattern, NoReturn, Any
+from typing import Pattern, NoReturn, Any, TYPE_CHECKING
 
-import pyudev  # type: ignore
-import schema  # type: ignore
-from strict_config_parser import strict_config_parser
+from wlr_resize_watcher import (
+    broker,
+    config_cache,
+    edid,
+    logger,
+    sd_notify,
+    trace,
+)
+from wlr_resize_watcher.card_limits import (
+    CardLimits,
+    pick_fitting_mode,
+    read_vram_size,
+)
+from wlr_resize_watcher.event_loop import EventLoop, Timer
+from wlr_resize_watcher.metrics import Metrics
+from wlr_resize_watcher.proc_watch import (
+    PROC_EVENT_EXIT,
+    HelperWatcher,
+    ProcConnector,
+    read_proc_comm,
+    scan_proc_comm,
+)
+from wlr_resize_watcher.wayland_output_manager import (
+    HeadConfig,
+    OutputHead,
+    OutputManagerClient,
+    WaylandError,
+)
+from wlr_resize_watcher.startup_profile import (
+    StartupProfiler,
+    format_size,
+    read_rss,
+)
+from wlr_resize_watcher.virt_detect import (
+    detect_virtualizer,
+    read_probed_environment,
+)
+from wlr_resize_watcher import warm_start
+from wlr_resize_watcher.warm_start import OutputSnapshot
+from wlr_resize_watcher.edid import EdidInfo
+
+## Modules that are not needed to get the displays resized after login are
+## imported where they are used, to keep startup fast. pyudev, schema and
+## strict_config_parser are only imported once needed as well, so
+## --profile-startup can account for them.
+if TYPE_CHECKING:
+    import socket
+    import pyudev  # type: ignore
+    import schema  # type: ignore
+    from wlr_resize_watcher import drm_kms
+    from wlr_resize_watcher.inotify import DirWatcher
+    from wlr_resize_watcher.once_report import OnceReport
 
 
 # pylint: disable=too-few-public-methods
@@ -35,13 +86,87 @@ class GlobalData:
     drm_match_re: Pattern[str] = re.compile(r".*/drm/card\d+$")
     card_match_re: Pattern[str] = re.compile(r"^card\d+$")
     disp_match_re: Pattern[str] = re.compile(r"^card\d+-.*$")
-    whitespace_start_re: Pattern[str] = re.compile(r"^\s+")
-    enabled_re: Pattern[str] = re.compile(r"\s+Enabled:")
-    modes_re: Pattern[str] = re.compile(r"\s+Modes:$")
-    current_mode_re: Pattern[str] = re.compile(r".*[( ]current[,)].*")
+    mode_size_re: Pattern[str] = re.compile(r"^(\d+)x(\d+)")
+    ## Output transforms in the order of wl_output.transform, named like
+    ## wlr-randr names them.
+    transform_name_list: list[str] = [
+        "normal",
+        "90",
+        "180",
+        "270",
+        "flipped",
+        "flipped-90",
+        "flipped-180",
+        "flipped-270",
+    ]
+    drm_path: Path = Path("/sys/class/drm")
+    dri_path: Path = Path("/dev/dri")
+    wlr_randr_path: str = "/usr/bin/wlr-randr"
     virtualizer_str: str | None = ""
+    ## What vm-config-dist's probe-environment recorded this boot, if it has
+    ## run. See read_probed_environment().
+    probed_environment: dict[str, str] = {}
     resize_helper_present: bool = False
+    ## The program that resizes the displays for each virtualizer that has
+    ## one.
+    resize_helper_map: dict[str, str] = {
+        "oracle": "/usr/bin/VBoxDRMClient",
+        "kvm": "/usr/sbin/spice-vdagentd",
+    }
+    helper_watcher: HelperWatcher | None = None
+    helper_recheck_timer: Timer | None = None
+    ## How long to wait for an exec to complete after the resize helper's
+    ## executable has been opened, when starts are watched with inotify.
+    helper_recheck_delay: float = 0.1
+    helper_grace_timer: Timer | None = None
+    ## How long the resize helper may be gone before the displays are set to
+    ## the default resolution, so a restart does not make them flicker.
+    helper_grace_time: float = 2.0
     in_sysmaint_mode: bool = False
+    active_backend: "CompositorBackend | None" = None
+    drm_topology: "DrmTopology | None" = None
+    output_index: "OutputIndex | None" = None
+    event_loop: EventLoop | None = None
+    udev_monitor: "pyudev.Monitor | None" = None
+    resize_scheduler: "ResizeScheduler | None" = None
+    resize_check_timer: Timer | None = None
+    reconciler: "Reconciler | None" = None
+    ## Set in the resize broker (--broker).
+    broker_server: "broker.BrokerServer | None" = None
+    ## Set in per-session watchers that get their state from the broker.
+    broker_client: "broker.BrokerClient | None" = None
+    broker_connect_timeout: float = 5.0
+    ## Set with --record.
+    trace_writer: trace.TraceWriter | None = None
+    ## Set with --once.
+    once_report: "OnceReport | None" = None
+    config_watcher: "DirWatcher | None" = None
+    config_reload_timer: Timer | None = None
+    config_reload_delay: float = 0.2
+    ## Set if SIGHUP arrived before the event loop could handle it.
+    reload_pending: bool = False
+    loaded_config: dict[str, Any] = {}
+    resync_conf_key_list: list[str] = [
+        "enable_dynamic_resolution",
+        "standard_default_resolution",
+        "small_default_resolution",
+        "compositor_backend",
+        "drm_backend",
+        "vram_buffers_per_output",
+    ]
+    startup_profiler: StartupProfiler = StartupProfiler()
+    metrics: Metrics = Metrics("wlr_resize_watcher")
+    log: logger.Logger = logger.Logger("wlr-resize-watcher")
+    metrics_timer: Timer | None = None
+    watchdog_interval: float | None = None
+    ## Top-level packages only needed until the first sync. They are
+    ## imported again if a configuration reload needs them.
+    startup_module_list: list[str] = [
+        "argparse",
+        "schema",
+        "strict_config_parser",
+    ]
+    over_memory_budget: bool = False
 
     enable_dynamic_resolution: bool = False
     warn_on_dynamic_resolution_refuse: bool = False
@@ -50,34 +175,37 @@ class GlobalData:
     normal_wait_proc_list: list[str] = []
     sysmaint_wait_proc_list: list[str] = []
     wait_proc_timeout: int = 0
+    wait_proc_post_start_delay_ms: int = 0
+    compositor_backend: str = ""
+    drm_backend: str = ""
+    resize_settle_time_ms: int = 0
+    resize_max_delay_ms: int = 0
+    enable_metrics: bool = False
+    metrics_interval_ms: int = 0
+    apply_retry_initial_delay_ms: int = 0
+    apply_retry_max_delay_ms: int = 0
+    apply_retry_limit: int = 0
+    enable_warm_start: bool = False
+    use_resize_broker: bool = False
+    memory_budget_mib: int = 0
+    vram_buffers_per_output: int = 0
+    log_level: str = ""
+    log_rate_limit_interval_ms: int = 0
+    log_rate_limit_burst: int = 0
+    ## The snapshot last written, to avoid rewriting an unchanged one.
+    saved_snapshot_key: tuple[tuple[Any, ...], ...] | None = None
 
     conf_dir_list: list[str] = [
         "/etc/wlr-resize-watcher.d",
         "/usr/local/etc/wlr-resize-watcher.d",
     ]
-    conf_schema: schema.Schema = schema.Schema(
-        {
-            "enable_dynamic_resolution": bool,
-            "warn_on_dynamic_resolution_refuse": bool,
-            "standard_default_resolution": schema.And(
-                str,
-                lambda s: re.match(r"\d+x\d+", s),
-            ),
-            "small_default_resolution": schema.And(
-                str,
-                lambda s: re.match(r"\d+x\d+", s),
-            ),
-            "normal_wait_proc_list": [str],
-            "sysmaint_wait_proc_list": [str],
-            "wait_proc_timeout": int,
-        },
-    )
     conf_defaults: dict[str, Any] = {
         "enable_dynamic_resolution": True,
         "warn_on_dynamic_resolution_refuse": True,
         "standard_default_resolution": "1920x1080",
         ## labwc encounters memory allocation issues when running at 1920x1080
-        ## resolution under Xen's default VGA emulation. It works well at
+        ## resolution under Xen's default VGA emulation, or on other emulated
+        ## graphics cards with little video memory. It works well at
         ## 1024x768.
         "small_default_resolution": "1024x768",
         ## No defaults are specified for 'normal_wait_proc_list' and
@@ -85,655 +213,4055 @@ class GlobalData:
         ## the start of the respective lists before configured process names,
         ## rather than being overridden.
         "wait_proc_timeout": 10,
+        "wait_proc_post_start_delay_ms": 1000,
+        "compositor_backend": "auto",
+        "drm_backend": "sysfs",
+        "resize_settle_time_ms": 100,
+        "resize_max_delay_ms": 1000,
+        "enable_metrics": False,
+        "metrics_interval_ms": 10000,
+        "apply_retry_initial_delay_ms": 500,
+        "apply_retry_max_delay_ms": 30000,
+        "apply_retry_limit": 5,
+        "enable_warm_start": True,
+        "use_resize_broker": False,
+        "memory_budget_mib": 48,
+        ## wlroots keeps up to three framebuffers per display in flight.
+        "vram_buffers_per_output": 3,
+        "log_level": "info",
+        "log_rate_limit_interval_ms": 5000,
+        "log_rate_limit_burst": 10,
     }
 
 
 # pylint: disable=too-few-public-methods
 class DisplayInfo:
     """
-    Stores the name and resolution associated with a display.
+    Stores the name and resolution associated with a display. The refresh
+    rate is in mHz, 0 if unknown.
     """
 
-    def __init__(self, disp_name: str, disp_mode: str) -> None:
+    __slots__ = ("disp_name", "disp_mode", "refresh")
+
+    def __init__(
+        self, disp_name: str, disp_mode: str, refresh: int = 0
+    ) -> None:
         self.disp_name = disp_name
         self.disp_mode = disp_mode
+        self.refresh = refresh
 
 
-def get_udev_card_event(udev_mon: pyudev.Monitor) -> str:
+# pylint: disable=too-few-public-methods
+class HwDisplayInfo(DisplayInfo):
     """
-    Listens for udev events affecting a drm/card* device, and outputs the list
-    of affected cards.
+    A connected display as seen by the kernel, along with what identifies
+    it: its card, its connector's object ID (None if the kernel does not
+    report it) and its EDID (None if it has none).
     """
 
-    card_name: str | None = None
-    for udev_dev in iter(udev_mon.poll, None):
-        dev_name: str = udev_dev.sys_path
-        if GlobalData.drm_match_re.match(dev_name):
-            dev_name_parts: list[str] = dev_name.split("/")
-            card_name = dev_name_parts[len(dev_name_parts) - 1]
-            break
-    assert card_name is not None
-    return card_name
+    __slots__ = ("card_name", "connector_id", "edid")
 
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        disp_name: str,
+        disp_mode: str,
+        refresh: int,
+        card_name: str,
+        connector_id: int | None,
+        edid_info: EdidInfo | None,
+    ) -> None:
+        super().__init__(disp_name, disp_mode, refresh)
+        self.card_name: str = card_name
+        self.connector_id: int | None = connector_id
+        self.edid: EdidInfo | None = edid_info
 
-# pylint: disable=too-many-branches
-def get_compositor_disp_list() -> list[DisplayInfo] | None:
+
+# pylint: disable=too-few-public-methods
+class DisplayMode:
     """
-    Gets all enabled displays that the compositor currently sees, along with
-    their current resolution.
+    A display mode offered by the compositor. The refresh rate is in mHz, 0
+    if unknown.
     """
 
-    try:
-        wlr_randr_env: dict[str, str] = os.environ.copy()
-        wlr_randr_env["LC_ALL"] = "C"
-        wlr_randr_lines: list[str] = subprocess.run(
-            ["/usr/bin/wlr-randr"],
-            env=wlr_randr_env,
-            check=True,
-            capture_output=True,
-            encoding="utf-8",
-        ).stdout.split("\n")
-    except Exception:
-        print(
-            "ERROR: Could not get list of displays from compositor!",
-            file=sys.stderr,
-        )
-        traceback.print_exc(file=sys.stderr)
-        sys.exit(1)
+    __slots__ = ("width", "height", "refresh", "preferred")
 
-    if len(wlr_randr_lines) == 1 and wlr_randr_lines[0].strip() == "":
-        ## Empty wlr-randr output, the compositor most likely doesn't see any
-        ## displays
-        return None
+    def __init__(
+        self, width: int, height: int, refresh: int, preferred: bool
+    ) -> None:
+        self.width: int = width
+        self.height: int = height
+        self.refresh: int = refresh
+        self.preferred: bool = preferred
 
-    out_list: list[DisplayInfo] = []
-    disp_name: str | None = None
-    disp_mode: str | None = None
-    in_modes_zone: bool = False
-    display_enabled: bool = True
-    modes_zone_indent: int = 0
-
-    for idx, line in enumerate(wlr_randr_lines):
-        if idx == 0:
-            if GlobalData.whitespace_start_re.match(line):
-                print(
-                    "ERROR: Unexpected whitespace on first line of "
-                    "wlr-randr output! wlr-randr output:",
-                    file=sys.stderr,
-                )
-                print("\n".join(wlr_randr_lines), file=sys.stderr)
-                sys.exit(1)
-            disp_name = line.split(" ")[0]
-            continue
 
-        if not GlobalData.whitespace_start_re.match(line):
-            if display_enabled:
-                if disp_name is None or disp_mode is None:
-                    print(
-                        "ERROR: Unable to find active display mode for "
-                        "a screen in wlr-randr output! wlr-randr output:",
-                        file=sys.stderr,
-                    )
-                    print("\n".join(wlr_randr_lines), file=sys.stderr)
-                    sys.exit(1)
-                out_list.append(DisplayInfo(disp_name, disp_mode))
-            disp_name = line.split(" ")[0]
-            disp_mode = None
-            in_modes_zone = False
-            display_enabled = True
-            continue
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+class CompositorDisplayInfo(DisplayInfo):
+    """
+    The full state of an enabled display as seen by the compositor.
+    disp_mode is the size of the current mode, refresh its refresh rate in
+    mHz. transform is one of GlobalData.transform_name_list.
+    """
 
-        if GlobalData.enabled_re.match(line):
-            enabled_parts: list[str] = line.split(":")
-            if len(enabled_parts) < 2:
-                continue
-            enabled_status: str = enabled_parts[1].strip()
-            if enabled_status == "no":
-                display_enabled = False
-            continue
+    __slots__ = (
+        "pos_x",
+        "pos_y",
+        "scale",
+        "transform",
+        "make",
+        "model",
+        "serial",
+        "mode_list",
+    )
 
-        if GlobalData.modes_re.match(line):
-            in_modes_zone = True
-            continue
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        disp_name: str,
+        disp_mode: str,
+        refresh: int,
+        pos_x: int,
+        pos_y: int,
+        scale: float,
+        transform: str,
+        make: str,
+        model: str,
+        serial: str,
+        mode_list: list[DisplayMode],
+    ) -> None:
+        super().__init__(disp_name, disp_mode, refresh)
+        self.pos_x: int = pos_x
+        self.pos_y: int = pos_y
+        self.scale: float = scale
+        self.transform: str = transform
+        self.make: str = make
+        self.model: str = model
+        self.serial: str = serial
+        self.mode_list: list[DisplayMode] = mode_list
 
-        if in_modes_zone and modes_zone_indent == 0:
-            modes_zone_indent = len(line) - len(line.lstrip(" "))
 
-        if (
-            in_modes_zone
-            and (len(line) - len(line.lstrip(" "))) < modes_zone_indent
-        ):
-            in_modes_zone = False
-            modes_zone_indent = 0
-            continue
+# pylint: disable=too-few-public-methods
+class DisplayTarget:
+    """
+    The state a display should be changed to. disp_mode is None if the mode
+    stays the same, pos is None if the position stays the same. refresh is
+    the refresh rate of the new mode in mHz, 0 if unknown. advertised is
+    True if the compositor offers a mode with exactly this size and refresh
+    rate, which can then be used instead of a custom mode.
+    """
 
-        if not in_modes_zone:
-            continue
+    __slots__ = ("disp_name", "disp_mode", "pos", "refresh", "advertised")
 
-        line_parts: list[str] = line.strip().split(" ", maxsplit=4)
-        if len(line_parts) < 4:
-            print(
-                "ERROR: Too few fields in wlr-randr mode "
-                "specification! wlr-randr output:",
-                file=sys.stderr,
-            )
-            print("\n".join(wlr_randr_lines), file=sys.stderr)
-            sys.exit(1)
-        if len(line_parts) == 4:
-            ## This mode specification is not the active one for the
-            ## current display, skip it
-            continue
-        if GlobalData.current_mode_re.match(line_parts[4]):
-            disp_mode = line_parts[0]
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        disp_name: str,
+        disp_mode: str | None,
+        pos: tuple[int, int] | None,
+        refresh: int = 0,
+        advertised: bool = False,
+    ) -> None:
+        self.disp_name: str = disp_name
+        self.disp_mode: str | None = disp_mode
+        self.pos: tuple[int, int] | None = pos
+        self.refresh: int = refresh
+        self.advertised: bool = advertised
 
-    if len(out_list) == 0:
-        return None
-    return out_list
+    def get_refresh_hz(self) -> str:
+        """
+        Returns the refresh rate of the new mode in Hz, formatted for
+        wlr-randr. 60 Hz is used if the refresh rate is unknown.
+        """
 
+        if self.refresh == 0:
+            return "60"
+        ## Integer arithmetic, so that the mHz value is passed on exactly.
+        return f"{self.refresh // 1000}.{self.refresh % 1000:03d}"
 
-def get_hw_disp_list(card_list: list[str]) -> list[DisplayInfo] | None:
+    def describe(self) -> str:
+        """
+        Returns a description of the change for log messages.
+        """
+
+        out_str: str = f"'{self.disp_name}'"
+        if self.disp_mode is not None:
+            out_str += f" to mode '{self.disp_mode}@{self.get_refresh_hz()}'"
+        if self.pos is not None:
+            out_str += f" to position {self.pos[0]},{self.pos[1]}"
+        return out_str
+
+
+# pylint: disable=too-few-public-methods
+class CardEvent:
     """
-    Gets all recognized displays present on the specified list of graphics
-    cards, and their native resolution.
+    A udev event for a DRM card. connector_id is the kernel's object ID of
+    the connector the event is about, if the kernel named one.
     """
 
-    out_list: list[DisplayInfo] = []
+    __slots__ = ("card_name", "action", "connector_id")
+
+    def __init__(
+        self, card_name: str, action: str, connector_id: int | None
+    ) -> None:
+        self.card_name: str = card_name
+        self.action: str = action
+        self.connector_id: int | None = connector_id
+
+
+# pylint: disable=too-few-public-methods
+class ConnectorInfo:
+    """
+    Cached state of a single DRM connector. disp_mode is the connector's
+    native resolution, or None if nothing is connected to it. refresh is the
+    native mode's refresh rate in mHz, 0 if unknown. edid identifies the
+    connected display, None if it has no EDID.
+
+    On cards with limits (see CardLimits), mode_list holds the connector's
+    modes as (width, height, refresh), native mode first, and disp_mode and
+    refresh are those of the largest mode that fits instead. mode_list is
+    empty on other cards.
+    """
+
+    __slots__ = (
+        "dir_name",
+        "disp_name",
+        "connector_id",
+        "status",
+        "disp_mode",
+        "refresh",
+        "edid",
+        "mode_list",
+    )
+
+    def __init__(
+        self, dir_name: str, disp_name: str, connector_id: int | None
+    ) -> None:
+        self.dir_name: str = dir_name
+        self.disp_name: str = disp_name
+        self.connector_id: int | None = connector_id
+        self.status: str = "unknown"
+        self.disp_mode: str | None = None
+        self.refresh: int = 0
+        self.edid: EdidInfo | None = None
+        self.mode_list: list[tuple[int, int, int]] = []
+
+
+class DrmTopology:
+    """
+    In-memory index of all DRM cards, their connectors, and each connector's
+    connection status and native resolution. Built once at startup, and
+    afterwards only updated for the connectors udev events name. A card is
+    only rescanned as a whole when it is added or removed, or when an event
+    does not name a connector.
+
+    Connectors are read from the text files in drm_path, or, if dri_path is
+    set, from the card device nodes in dri_path through KMS ioctls. KMS
+    also provides the refresh rate of the native mode. Cards that cannot be
+    queried through KMS are read from sysfs instead.
+
+    Native modes that do not fit into a card's video memory or maximum
+    framebuffer size are replaced with the largest mode that does.
+    """
+
+    def __init__(self, drm_path: Path, dri_path: Path | None = None) -> None:
+        self.drm_path: Path = drm_path
+        self.dri_path: Path | None = dri_path
+        self.card_map: dict[str, dict[str, ConnectorInfo]] = {}
+        self.connector_id_map: dict[str, dict[int, ConnectorInfo]] = {}
+        self.sysfs_card_set: set[str] = set()
+        self.limits_map: dict[str, CardLimits] = {}
+
+    def rescan_all(self) -> None:
+        """
+        Rebuilds the index for all cards on the system.
+        """
+
+        if not self.drm_path.is_dir():
+            GlobalData.log.error(
+                "%s does not exist or is not a directory!", self.drm_path
+            )
+            sys.exit(1)
+        self.card_map.clear()
+        self.connector_id_map.clear()
+        for card_path in self.drm_path.iterdir():
+            if GlobalData.card_match_re.match(card_path.name):
+                self.rescan_card(card_path.name)
+
+    def rescan_card(self, card_name: str) -> None:
+        """
+        Rebuilds the index for one card, or drops the card if it no longer
+        exists.
+        """
+
+        if self._use_kms(card_name):
+            card_fd: int | None = self._open_kms_card(card_name)
+            if card_fd is not None:
+                try:
+                    self._rescan_card_kms(card_name, card_fd)
+                finally:
+                    os.close(card_fd)
+                return
+            if card_name not in self.sysfs_card_set:
+                return
 
-    for card in card_list:
         try:
-            card_path: Path = Path(f"/sys/class/drm/{card}")
-            disp_list: list[str] = [
+            card_path: Path = self.drm_path / card_name
+            dir_name_list: list[str] = [
                 x.name
                 for x in card_path.iterdir()
-                if x.is_dir() and GlobalData.disp_match_re.match(x.name)
+                if GlobalData.disp_match_re.match(x.name) and x.is_dir()
             ]
         except FileNotFoundError:
             ## This will happen if the card no longer exists. We don't
             ## explicitly check for existence first to avoid a TOCTOU.
-            continue
+            self.remove_card(card_name)
+            return
         except Exception:
-            print(
-                "ERROR: Cannot enumerate displays from a graphics card!",
-                file=sys.stderr,
+            GlobalData.log.error(
+                "Cannot enumerate displays from a graphics card!",
+                exc_info=True,
             )
-            traceback.print_exc(file=sys.stderr)
             sys.exit(1)
 
-        for display in disp_list:
-            display_name_list: list[str] = display.split("-", maxsplit=1)
-            if len(display_name_list) != 2:
-                print(
-                    f"ERROR: Bug in parsing display ID '{display}'!",
-                    file=sys.stderr,
+        self.limits_map[card_name] = CardLimits(read_vram_size(card_path))
+        conn_map: dict[str, ConnectorInfo] = {}
+        conn_id_map: dict[int, ConnectorInfo] = {}
+        for dir_name in dir_name_list:
+            dir_name_parts: list[str] = dir_name.split("-", maxsplit=1)
+            if len(dir_name_parts) != 2:
+                GlobalData.log.error(
+                    "Bug in parsing display ID '%s'!", dir_name
                 )
                 sys.exit(1)
-            display_name = display_name_list[1]
-
-            try:
-                display_modes_path: Path = Path(
-                    f"/sys/class/drm/{card}/{display}/modes"
-                )
-                display_modes_lines: list[str] = (
-                    display_modes_path.read_text(encoding="utf-8")
-                    .strip()
-                    .split("\n")
-                )
-                if (
-                    len(display_modes_lines) == 1
-                    and display_modes_lines[0] == ""
-                ):
-                    ## Display isn't connected, skip it
-                    continue
-                display_mode: str = display_modes_lines[0]
-                out_list.append(DisplayInfo(display_name, display_mode))
-            except FileNotFoundError:
-                ## Same rationale as for card enumeration, see above
+            conn: ConnectorInfo = ConnectorInfo(
+                dir_name,
+                dir_name_parts[1],
+                self._read_connector_id(card_name, dir_name),
+            )
+            if not self._read_connector_state(card_name, conn):
                 continue
-            except Exception:
-                print(
-                    "ERROR: Cannot read mode information for a display!",
-                    file=sys.stderr,
-                )
-                traceback.print_exc(file=sys.stderr)
-                sys.exit(1)
-
-    if len(out_list) == 0:
-        return None
-    return out_list
-
-
-def sync_hw_resolution_with_compositor(card_name: str | None) -> None:
-    """
-    Sets the compositor's display resolution for all displays on all specified
-    graphics cards to the native resolution.
-    """
+            conn_map[dir_name] = conn
+            if conn.connector_id is not None:
+                conn_id_map[conn.connector_id] = conn
+        self.card_map[card_name] = conn_map
+        self.connector_id_map[card_name] = conn_id_map
+        self._fit_card_modes(card_name)
 
-    print(f"INFO: sync_hw_resolution_with_compositor start (card_name={card_name!r})", file=sys.stderr)
+    def remove_card(self, card_name: str) -> None:
+        """
+        Drops a card from the index.
+        """
 
-    not_resizing_display_message = '''
-Not changing screen resolution!
+        self.card_map.pop(card_name, None)
+        self.connector_id_map.pop(card_name, None)
+        self.sysfs_card_set.discard(card_name)
+        self.limits_map.pop(card_name, None)
 
-Automatic screen resizing is turned off by default inside the workstation to improve privacy (it can reduce fingerprinting). If you want to turn it on, open the System Maintenance Panel and click 'Configure Dynamic Resolution'.
+    def refresh(
+        self, card_name: str, connector_id_set: set[int] | None
+    ) -> None:
+        """
+        Updates the index after udev events for a card. If connector_id_set
+        is None, or names a connector that is not in the index, the whole
+        card is rescanned.
+        """
 
-Or run: configure-dynamic-resolution
+        if connector_id_set is None or card_name not in self.card_map:
+            self.rescan_card(card_name)
+            return
+        conn_id_map: dict[int, ConnectorInfo] = self.connector_id_map[
+            card_name
+        ]
+        card_fd: int | None = None
+        if self._use_kms(card_name):
+            card_fd = self._open_kms_card(card_name)
+            if card_fd is None:
+                self.rescan_card(card_name)
+                return
+        try:
+            for connector_id in connector_id_set:
+                conn: ConnectorInfo | None = conn_id_map.get(connector_id)
+                if conn is None:
+                    self.rescan_card(card_name)
+                    return
+                if card_fd is not None:
+                    if not self._read_connector_state_kms(
+                        card_name, card_fd, conn
+                    ):
+                        self.rescan_card(card_name)
+                        return
+                elif not self._read_connector_state(card_name, conn):
+                    self.rescan_card(card_name)
+                    return
+        finally:
+            if card_fd is not None:
+                os.close(card_fd)
+        ## The refreshed connectors may have changed how much video memory
+        ## is left for the others.
+        self._fit_card_modes(card_name)
 
-See also:
-https://www.whonix.org/wiki/resize
-    '''
+    def get_card_list(self) -> list[str]:
+        """
+        Returns the names of all indexed cards.
+        """
 
-    ## Optionally send a notification and exit if dynamic resolution has
-    ## been disabled.
-    if not GlobalData.enable_dynamic_resolution:
-        print("INFO: Dynamic resolution disabled by config. Skipping sync.", file=sys.stderr)
-        if GlobalData.warn_on_dynamic_resolution_refuse:
-            GlobalData.warn_on_dynamic_resolution_refuse = False
-            print("INFO: warn_on_dynamic_resolution_refuse=1 -> sending notify and disabling further warnings.", file=sys.stderr)
-            one_time_popup_status_file = os.path.expanduser("~/.wlr-resize-watcher_one-time-popup")
-            subprocess.run(
-                [
-                    "/usr/bin/notify-send",
-                    "--app-name=wlr_resize_watcher",
-                    not_resizing_display_message,
-                ],
-                check=False,
-            )
-            subprocess.run(
-                [
-                    "/usr/libexec/msgcollector/one-time-popup",
-                    one_time_popup_status_file,
-                    "wlr-resize-watcher",
-                    not_resizing_display_message,
-                ],
-                check=False,
-            )
-        return
+        return list(self.card_map)
 
-    real_card_list: list[str]
-    if card_name is None:
-        ## Manually discover all available cards from /sys/class/drm.
-        print("INFO: card_name=None -> discovering cards in /sys/class/drm", file=sys.stderr)
-        drm_path: Path = Path("/sys/class/drm")
-        if not drm_path.is_dir():
-            print("ERROR: /sys/class/drm does not exist or is not a directory!", file=sys.stderr)
-            sys.exit(1)
-        real_card_list = [
-            x.name
-            for x in drm_path.iterdir()
-            if x.is_dir() and GlobalData.card_match_re.match(x.name)
-        ]
-        print(f"INFO: discovered cards: {real_card_list!r}", file=sys.stderr)
-    else:
-        real_card_list = [card_name]
-        print(f"INFO: card_name provided -> using cards: {real_card_list!r}", file=sys.stderr)
+    def get_disp_list(self, card_list: list[str]) -> list[DisplayInfo]:
+        """
+        Returns all connected displays on the listed cards, along with their
+        native resolution, as HwDisplayInfo.
+        """
 
-    compositor_disp_list: list[DisplayInfo] | None = get_compositor_disp_list()
-    if compositor_disp_list is None:
-        print("INFO: compositor_disp_list=None (compositor likely sees no displays) -> returning", file=sys.stderr)
-        return
-    print(f"INFO: compositor reports {len(compositor_disp_list)} display(s): {[(d.disp_name, d.disp_mode) for d in compositor_disp_list]!r}", file=sys.stderr)
+        out_list: list[DisplayInfo] = []
+        for card_name in card_list:
+            for conn in self.card_map.get(card_name, {}).values():
+                if conn.disp_mode is not None:
+                    out_list.append(
+                        HwDisplayInfo(
+                            conn.disp_name,
+                            conn.disp_mode,
+                            conn.refresh,
+                            card_name,
+                            conn.connector_id,
+                            conn.edid,
+                        )
+                    )
+        return out_list
 
-    hw_disp_list: list[DisplayInfo] | None = get_hw_disp_list(real_card_list)
-    if hw_disp_list is None:
-        print(f"INFO: hw_disp_list=None (no connected displays found for cards {real_card_list!r}) -> returning", file=sys.stderr)
-        return
-    print(f"INFO: hardware reports {len(hw_disp_list)} display(s): {[(d.disp_name, d.disp_mode) for d in hw_disp_list]!r}", file=sys.stderr)
+    def get_modes_snapshot(
+        self, card_name: str, connector_id_set: set[int] | None
+    ) -> tuple[tuple[str, str], ...]:
+        """
+        Reads the raw mode lists of the listed connectors of a card (or of
+        all of its connectors if connector_id_set is None), for detecting
+        when the hypervisor has finished changing them. The index itself is
+        not updated.
+        """
 
-    for hw_display in hw_disp_list:
-        print(f"INFO: checking hw display '{hw_display.disp_name}' native_mode='{hw_display.disp_mode}'", file=sys.stderr)
-        matched_compositor_display: DisplayInfo | None = None
-        for compositor_display in compositor_disp_list:
-            if compositor_display.disp_name == hw_display.disp_name:
-                matched_compositor_display = compositor_display
-                break
-        if matched_compositor_display is None:
-            print(f"INFO: no compositor match for hw display '{hw_display.disp_name}', skipping", file=sys.stderr)
-            continue
-        print(f"INFO: matched compositor display '{matched_compositor_display.disp_name}' current_mode='{matched_compositor_display.disp_mode}'", file=sys.stderr)
+        conn_list: list[ConnectorInfo]
+        if connector_id_set is None:
+            conn_list = list(self.card_map.get(card_name, {}).values())
+        else:
+            conn_id_map: dict[int, ConnectorInfo] = self.connector_id_map.get(
+                card_name, {}
+            )
+            conn_list = [
+                conn_id_map[x] for x in connector_id_set if x in conn_id_map
+            ]
 
-        if hw_display.disp_mode != matched_compositor_display.disp_mode:
-            print(f"INFO: mode mismatch -> attempting sync: '{hw_display.disp_name}' {matched_compositor_display.disp_mode} -> {hw_display.disp_mode}", file=sys.stderr)
+        out_list: list[tuple[str, str]] = []
+        if self._use_kms(card_name):
+            card_fd: int | None = self._open_kms_card(card_name)
+            if card_fd is not None:
+                try:
+                    for conn in conn_list:
+                        assert conn.connector_id is not None
+                        mode_str: str | None = self._read_kms_mode_list_str(
+                            card_fd, conn.connector_id
+                        )
+                        if mode_str is not None:
+                            out_list.append((conn.dir_name, mode_str))
+                finally:
+                    os.close(card_fd)
+                return tuple(out_list)
+        for conn in conn_list:
             try:
-                subprocess.run(
-                    [
-                        "/usr/bin/wlr-randr",
-                        "--output",
-                        hw_display.disp_name,
-                        "--custom-mode",
-                        f"{hw_display.disp_mode}@60",
-                    ],
-                    check=True,
+                out_list.append(
+                    (
+                        conn.dir_name,
+                        (
+                            self.drm_path / card_name / conn.dir_name / "modes"
+                        ).read_text(encoding="utf-8"),
+                    )
                 )
-                print(f"INFO: synced display '{hw_display.disp_name}' to '{hw_display.disp_mode}@60'", file=sys.stderr)
-            except subprocess.CalledProcessError:
-                print(f"WARNING: Unable to sync display resolution for display '{hw_display.disp_name}'!", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-        else:
-            print(f"INFO: display '{hw_display.disp_name}' already matches native mode '{hw_display.disp_mode}', no action needed", file=sys.stderr)
+            except OSError:
+                continue
+        return tuple(out_list)
 
-    print("INFO: sync_hw_resolution_with_compositor end", file=sys.stderr)
+    def export_card_map(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        Returns the index in a form that can be serialized to JSON, for
+        publishing it to the resize broker's clients.
+        """
 
+        return {
+            card_name: [
+                {
+                    "dir_name": x.dir_name,
+                    "disp_name": x.disp_name,
+                    "connector_id": x.connector_id,
+                    "status": x.status,
+                    "disp_mode": x.disp_mode,
+                    "refresh": x.refresh,
+                    "edid": edid_to_json(x.edid),
+                }
+                for x in conn_map.values()
+            ]
+            for card_name, conn_map in self.card_map.items()
+        }
 
-def executable_exists_and_is_running(exe_name: str) -> int:
-    """
-    Checks if the specified executable exists and is actively running. Note
-    that this will give a false negative if an executable was executed from a
-    relative path when an absolute path was provided, or vice versa. It may
-    also fail if the executable name contains characters that pgrep considers
-    part of a regex, thus it should not be run with untrusted input.
+    def _read_connector_id(self, card_name: str, dir_name: str) -> int | None:
+        ## The connector_id attribute only exists on newer kernels. Without
+        ## it, events naming a connector fall back to rescanning the card.
+        try:
+            return int(
+                (
+                    self.drm_path / card_name / dir_name / "connector_id"
+                ).read_text(encoding="utf-8")
+            )
+        except (OSError, ValueError):
+            return None
 
-    Returns 0 on success, 1 if the executable is missing, 2 if the executable
-    is not running.
-    """
+    def _read_connector_state(
+        self, card_name: str, conn: ConnectorInfo
+    ) -> bool:
+        ## Returns False if the connector has disappeared.
+        conn_path: Path = self.drm_path / card_name / conn.dir_name
+        try:
+            conn.status = (
+                (conn_path / "status").read_text(encoding="utf-8").strip()
+            )
+            modes_str: str = (
+                (conn_path / "modes").read_text(encoding="utf-8").strip()
+            )
+        except FileNotFoundError:
+            ## Same rationale as for card enumeration, see above
+            return False
+        except Exception:
+            GlobalData.log.error(
+                "Cannot read mode information for a display!", exc_info=True
+            )
+            sys.exit(1)
 
-    if not Path(exe_name).is_file():
-        return 1
-    if not subprocess.run(
-        ["/usr/bin/pgrep", "-f", f"^{exe_name}( |$)"],
-        check=False,
-        capture_output=True,
-    ).returncode == 0:
-        return 2
-    return 0
+        ## Only the first mode is needed, unless the card has limits. Don't
+        ## split the whole list otherwise.
+        native_mode: str = modes_str.partition("\n")[0]
+        conn.mode_list = []
+        if native_mode == "":
+            ## Display isn't connected
+            conn.disp_mode = None
+            conn.edid = None
+        else:
+            conn.disp_mode = native_mode
+            conn.edid = edid.read_edid(conn_path)
+            if self._is_limited(card_name):
+                for mode_line in modes_str.split("\n"):
+                    mode_match: re.Match[str] | None = (
+                        GlobalData.mode_size_re.match(mode_line)
+                    )
+                    if mode_match is not None:
+                        conn.mode_list.append(
+                            (
+                                int(mode_match.group(1)),
+                                int(mode_match.group(2)),
+                                0,
+                            )
+                        )
+        return True
 
+    def _is_limited(self, card_name: str) -> bool:
+        limits: CardLimits | None = self.limits_map.get(card_name)
+        return limits is not None and limits.is_limited()
 
-def set_all_displays_resolution_to_default() -> None:
-    """
-    Sets the screen resolution of all displays to a default (hardcoded) value
-    appropriate for the virtualizer.
-    """
+    def _fit_card_modes(self, card_name: str) -> None:
+        ## All connected displays of a card share its video memory, so the
+        ## modes of all of them are picked again.
+        limits: CardLimits | None = self.limits_map.get(card_name)
+        if limits is None or not limits.is_limited():
+            return
+        conn_list: list[ConnectorInfo] = [
+            x for x in self.card_map.get(card_name, {}).values() if x.mode_list
+        ]
+        for conn in conn_list:
+            mode: tuple[int, int, int] = pick_fitting_mode(
+                conn.mode_list,
+                limits,
+                len(conn_list),
+                GlobalData.vram_buffers_per_output,
+            )
+            disp_mode: str = f"{mode[0]}x{mode[1]}"
+            if mode != conn.mode_list[0] and disp_mode != conn.disp_mode:
+                native_mode: tuple[int, int, int] = conn.mode_list[0]
+                GlobalData.log.info(
+                    "Native mode %sx%s of '%s' does not fit into the video "
+                    "memory or maximum framebuffer size of '%s', using %s "
+                    "instead.",
+                    native_mode[0],
+                    native_mode[1],
+                    conn.dir_name,
+                    card_name,
+                    disp_mode,
+                    OUTPUT=conn.disp_name,
+                    CARD=card_name,
+                )
+            conn.disp_mode = disp_mode
+            conn.refresh = mode[2]
 
-    disp_list: list[DisplayInfo] | None = get_compositor_disp_list()
-    selected_res: str
-    if GlobalData.virtualizer_str == "xen":
-        selected_res = GlobalData.small_default_resolution
-    else:
-        selected_res = GlobalData.standard_default_resolution
+    def _use_kms(self, card_name: str) -> bool:
+        return (
+            self.dri_path is not None and card_name not in self.sysfs_card_set
+        )
 
-    if disp_list is None:
-        return
-    for disp in disp_list:
+    def _open_kms_card(self, card_name: str) -> int | None:
+        ## Returns None if the card no longer exists, or if it cannot be
+        ## queried through KMS. In the latter case, the card is read from
+        ## sysfs from now on.
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher import drm_kms
+
+        assert self.dri_path is not None
+        dev_path: Path = self.dri_path / card_name
         try:
-            subprocess.run(
-                [
-                    "/usr/bin/wlr-randr",
-                    "--output",
-                    disp.disp_name,
-                    "--custom-mode",
-                    f"{selected_res}@60",
-                ],
-                check=True,
-            )
-        except subprocess.CalledProcessError:
-            print(
-                "WARNING: Unable to set default display resolution for "
-                f"display '{disp.disp_name}'!",
-                file=sys.stderr,
+            card_fd: int = drm_kms.open_card(str(dev_path))
+        except FileNotFoundError:
+            self.remove_card(card_name)
+            return None
+        except OSError as exc:
+            GlobalData.log.warning(
+                "Cannot open '%s' (%s), reading display modes from sysfs "
+                "instead!",
+                dev_path,
+                exc,
             )
-            traceback.print_exc(file=sys.stderr)
-
+            self.sysfs_card_set.add(card_name)
+            return None
+        return card_fd
 
-# pylint: disable=too-many-return-statements
-def check_virtualizer_type() -> None:
-    """
-    Records the currently-in-use virtualizer in a global variable and checks
-    to see if a display resize helper is present and running.
-    """
+    def _rescan_card_kms(self, card_name: str, card_fd: int) -> None:
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher import drm_kms
 
-    try:
-        GlobalData.virtualizer_str = subprocess.run(
-            ["/usr/bin/systemd-detect-virt"],
-            check=False,
-            capture_output=True,
-            encoding="utf-8",
-        ).stdout.strip()
-        if GlobalData.virtualizer_str == "oracle":
-            found_drm_client: int = executable_exists_and_is_running(
-                "/usr/bin/VBoxDRMClient"
-            )
-            if found_drm_client == 1:
-                print(
-                    "WARNING: VBoxDRMClient is missing!",
-                    file=sys.stderr,
-                )
-                return
-            if found_drm_client == 2:
-                print(
-                    "WARNING: VBoxDRMClient is not running!",
-                    file=sys.stderr,
-                )
-                return
+        try:
+            kms_conn_list: list[drm_kms.KmsConnector | None] = [
+                drm_kms.get_connector(card_fd, x)
+                for x in drm_kms.get_connector_id_list(card_fd)
+            ]
+            max_width, max_height = drm_kms.get_max_framebuffer_size(card_fd)
+        except OSError as exc:
+            ## E.g. a display-less device without KMS support.
+            GlobalData.log.warning(
+                "Cannot query '%s' through KMS (%s), reading display modes "
+                "from sysfs instead!",
+                card_name,
+                exc,
+            )
+            self.sysfs_card_set.add(card_name)
+            self.rescan_card(card_name)
+            return
 
-        elif GlobalData.virtualizer_str == "kvm":
-            found_spice_vdagentd: int = executable_exists_and_is_running(
-                "/usr/sbin/spice-vdagentd"
+        self.limits_map[card_name] = CardLimits(
+            read_vram_size(self.drm_path / card_name), max_width, max_height
+        )
+        conn_map: dict[str, ConnectorInfo] = {}
+        conn_id_map: dict[int, ConnectorInfo] = {}
+        for kms_conn in kms_conn_list:
+            if kms_conn is None:
+                continue
+            conn: ConnectorInfo = ConnectorInfo(
+                f"{card_name}-{kms_conn.name}",
+                kms_conn.name,
+                kms_conn.connector_id,
             )
-            if found_spice_vdagentd == 1:
-                print(
-                    "WARNING: spice-vdagentd is missing!",
-                    file=sys.stderr,
-                )
-                return
-            if found_spice_vdagentd == 2:
-                print(
-                    "WARNING: spice-vdagentd is not running!",
-                    file=sys.stderr,
-                )
-                return
+            self._update_connector_kms(card_name, conn, kms_conn)
+            conn_map[conn.dir_name] = conn
+            conn_id_map[kms_conn.connector_id] = conn
+        self.card_map[card_name] = conn_map
+        self.connector_id_map[card_name] = conn_id_map
+        self._fit_card_modes(card_name)
 
-        elif GlobalData.virtualizer_str == "xen":
-            ## Xen has no virtualizer helper.
-            return
+    def _read_connector_state_kms(
+        self, card_name: str, card_fd: int, conn: ConnectorInfo
+    ) -> bool:
+        ## Returns False if the connector has disappeared.
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher import drm_kms
 
-        elif GlobalData.virtualizer_str == "none":
-            print(
-                "INFO: Running on physical hardware, exiting.",
-                file=sys.stderr,
+        assert conn.connector_id is not None
+        try:
+            kms_conn: drm_kms.KmsConnector | None = drm_kms.get_connector(
+                card_fd, conn.connector_id
             )
-            sys.exit(0)
+        except OSError:
+            GlobalData.log.error(
+                "Cannot read mode information for a display!", exc_info=True
+            )
+            sys.exit(1)
+        if kms_conn is None:
+            return False
+        self._update_connector_kms(card_name, conn, kms_conn)
+        return True
 
+    def _update_connector_kms(
+        self,
+        card_name: str,
+        conn: ConnectorInfo,
+        kms_conn: "drm_kms.KmsConnector",
+    ) -> None:
+        conn.status = kms_conn.status
+        native_mode: drm_kms.KmsMode | None = kms_conn.native_mode()
+        conn.mode_list = []
+        if native_mode is None:
+            ## Display isn't connected
+            conn.disp_mode = None
+            conn.refresh = 0
+            conn.edid = None
         else:
-            print(
-                "WARNING: Running on an unsupported virtualizer!",
-                file=sys.stderr,
+            if self._is_limited(card_name):
+                conn.mode_list = [
+                    (x.width, x.height, x.refresh)
+                    for x in [native_mode]
+                    + [y for y in kms_conn.mode_list if y is not native_mode]
+                ]
+            conn.disp_mode = f"{native_mode.width}x{native_mode.height}"
+            conn.refresh = native_mode.refresh
+            ## The kernel keeps the EDID it last read in sysfs, reading it
+            ## from there is cheaper than through the connector's
+            ## properties.
+            conn.edid = edid.read_edid(
+                self.drm_path / card_name / conn.dir_name
             )
-            return
 
-    except Exception:
-        print(
-            "WARNING: Cannot detect virtualizer in use!",
-            file=sys.stderr,
-        )
-        traceback.print_exc(file=sys.stderr)
-        return
+    @staticmethod
+    def _read_kms_mode_list_str(card_fd: int, connector_id: int) -> str | None:
+        ## The mode list in the same format as the sysfs modes file, with the
+        ## refresh rates added.
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher import drm_kms
 
-    GlobalData.resize_helper_present = True
+        try:
+            kms_conn: drm_kms.KmsConnector | None = drm_kms.get_connector(
+                card_fd, connector_id
+            )
+        except OSError:
+            return None
+        if kms_conn is None:
+            return None
+        return "".join(
+            f"{x.width}x{x.height}@{x.refresh}\n" for x in kms_conn.mode_list
+        )
 
 
-def check_sysmaint_mode() -> None:
+class BrokerTopology(DrmTopology):
     """
-    Detects if the system is running in sysmaint mode or not.
+    DRM topology index of a watcher that gets its state from the resize
+    broker instead of reading it from the system. It is only ever replaced
+    as a whole, with the card map the broker publishes.
     """
 
-    proc_cmdline_file_list: list[Path] = [
-        Path("/proc/cmdline"),
-        Path("/proc/1/cmdline"),
-    ]
-    chosen_proc_cmdline_file: str | None = None
+    def rescan_all(self) -> None:
+        return
 
-    for proc_cmdline_file in proc_cmdline_file_list:
-        if proc_cmdline_file.is_file():
+    def rescan_card(self, card_name: str) -> None:
+        return
+
+    def refresh(
+        self, card_name: str, connector_id_set: set[int] | None
+    ) -> None:
+        return
+
+    def load_card_map(self, card_map: dict[str, Any]) -> None:
+        """
+        Replaces the index with a card map published by the broker. Raises
+        KeyError, TypeError or ValueError if it is malformed, in which case
+        the index is left unchanged.
+        """
+
+        if not isinstance(card_map, dict):
+            raise TypeError("The card map is not a JSON object!")
+        new_card_map: dict[str, dict[str, ConnectorInfo]] = {}
+        new_connector_id_map: dict[str, dict[int, ConnectorInfo]] = {}
+        for card_name, conn_dict_list in card_map.items():
+            conn_map: dict[str, ConnectorInfo] = {}
+            conn_id_map: dict[int, ConnectorInfo] = {}
+            for conn_dict in conn_dict_list:
+                conn: ConnectorInfo = ConnectorInfo(
+                    str(conn_dict["dir_name"]),
+                    str(conn_dict["disp_name"]),
+                    (
+                        None
+                        if conn_dict["connector_id"] is None
+                        else int(conn_dict["connector_id"])
+                    ),
+                )
+                conn.status = str(conn_dict["status"])
+                if conn_dict["disp_mode"] is not None:
+                    conn.disp_mode = str(conn_dict["disp_mode"])
+                conn.refresh = int(conn_dict["refresh"])
+                conn.edid = edid_from_json(conn_dict.get("edid"))
+                conn_map[conn.dir_name] = conn
+                if conn.connector_id is not None:
+                    conn_id_map[conn.connector_id] = conn
+            new_card_map[str(card_name)] = conn_map
+            new_connector_id_map[str(card_name)] = conn_id_map
+        self.card_map = new_card_map
+        self.connector_id_map = new_connector_id_map
+
+
+# pylint: disable=too-few-public-methods
+class PendingCard:
+    """
+    Scheduling state for a card that has received udev events which have not
+    been acted upon yet. connector_id_set holds the connectors named by the
+    events, or is None if the whole card needs to be rescanned.
+    """
+
+    __slots__ = (
+        "card_name",
+        "connector_id_set",
+        "first_event_time",
+        "last_check_time",
+        "modes_snapshot",
+    )
+
+    def __init__(
+        self,
+        card_name: str,
+        connector_id_set: set[int] | None,
+        now: float,
+    ) -> None:
+        self.card_name: str = card_name
+        self.connector_id_set: set[int] | None = connector_id_set
+        self.first_event_time: float = now
+        self.last_check_time: float = now
+        self.modes_snapshot: tuple[tuple[str, str], ...] = ()
+
+
+class ResizeScheduler:
+    """
+    Coalesces udev events per card. Any number of events for a card results
+    in a single sync, which happens once the mode lists of the affected
+    connectors have stopped changing for settle_time seconds, or at the
+    latest max_delay seconds after the first pending event, so that a
+    continuous window resize still gets intermediate updates.
+    """
+
+    def __init__(
+        self, topology: DrmTopology, settle_time: float, max_delay: float
+    ) -> None:
+        self.topology: DrmTopology = topology
+        self.settle_time: float = settle_time
+        self.max_delay: float = max_delay
+        self.pending_map: dict[str, PendingCard] = {}
+
+    def add_event(self, card_event: CardEvent, now: float) -> None:
+        """
+        Records a udev event for a card. Events for a card that is already
+        pending are merged into the pending entry.
+        """
+
+        needs_rescan: bool = (
+            card_event.action != "change" or card_event.connector_id is None
+        )
+        pending: PendingCard | None = self.pending_map.get(
+            card_event.card_name
+        )
+        if pending is not None:
+            if needs_rescan:
+                pending.connector_id_set = None
+            elif pending.connector_id_set is not None:
+                assert card_event.connector_id is not None
+                pending.connector_id_set.add(card_event.connector_id)
+            return
+
+        pending = PendingCard(
+            card_event.card_name,
+            None if needs_rescan else {card_event.connector_id},  # type: ignore
+            now,
+        )
+        pending.modes_snapshot = self.read_modes_snapshot(
+            pending.card_name, pending.connector_id_set
+        )
+        self.pending_map[card_event.card_name] = pending
+
+    def next_timeout(self, now: float) -> float | None:
+        """
+        Returns the number of seconds until a pending card needs to be
+        checked again, or None if nothing is pending.
+        """
+
+        if not self.pending_map:
+            return None
+        deadline: float = min(
+            min(
+                x.last_check_time + self.settle_time,
+                x.first_event_time + self.max_delay,
+            )
+            for x in self.pending_map.values()
+        )
+        return max(0.0, deadline - now)
+
+    def pop_due_cards(self, now: float) -> list[PendingCard]:
+        """
+        Returns all cards whose pending sync is due, and removes them from
+        the pending set.
+        """
+
+        due_list: list[PendingCard] = []
+        for pending in self.pending_map.values():
+            if now >= pending.first_event_time + self.max_delay:
+                due_list.append(pending)
+                continue
+            if now < pending.last_check_time + self.settle_time:
+                continue
+            modes_snapshot: tuple[tuple[str, str], ...] = (
+                self.read_modes_snapshot(
+                    pending.card_name, pending.connector_id_set
+                )
+            )
+            if modes_snapshot == pending.modes_snapshot:
+                due_list.append(pending)
+                continue
+            pending.modes_snapshot = modes_snapshot
+            pending.last_check_time = now
+        for pending in due_list:
+            del self.pending_map[pending.card_name]
+        return due_list
+
+    def read_modes_snapshot(
+        self, card_name: str, connector_id_set: set[int] | None
+    ) -> tuple[tuple[str, str], ...]:
+        """
+        Reads the mode lists of a card's connectors from the topology, and
+        records them in the trace.
+        """
+
+        modes_snapshot: tuple[tuple[str, str], ...] = (
+            self.topology.get_modes_snapshot(card_name, connector_id_set)
+        )
+        if GlobalData.trace_writer is not None:
+            GlobalData.trace_writer.write(
+                "modes", card=card_name, snapshot=modes_snapshot
+            )
+        return modes_snapshot
+
+
+class Reconciler:
+    """
+    Remembers the display modes last confirmed by the compositor, so syncs
+    whose desired state has already been reached can be skipped without
+    asking the compositor. The remembered state is dropped whenever it may
+    have become stale: on compositor events, on failed applies and on
+    configuration changes. Failed applies are retried with exponential
+    backoff.
+    """
+
+    def __init__(self) -> None:
+        self.applied_map: dict[str, str] = {}
+        self.compositor_disp_list: list[DisplayInfo] | None = None
+        self.desired_map: dict[str, str] = {}
+        self.retry_count: int = 0
+        self.retry_timer: Timer | None = None
+        ## Set if a sync failed before the event loop could run a retry.
+        self.retry_pending: bool = False
+
+    def is_satisfied(self, desired_map: dict[str, str]) -> bool:
+        """
+        Checks whether all displays in desired_map (display name -> mode)
+        are known to already run at the desired mode.
+        """
+
+        if self.compositor_disp_list is None:
+            return False
+        return all(
+            self.applied_map.get(name) == mode
+            for name, mode in desired_map.items()
+        )
+
+    def record(
+        self,
+        compositor_disp_list: list[DisplayInfo],
+        matched_map: dict[str, str],
+    ) -> None:
+        """
+        Records a compositor state read after a sync. matched_map holds the
+        compositor outputs that displays were matched to, and the modes
+        they should run at. Only those the compositor reports at that mode
+        are remembered as applied. Displays that could not be matched are
+        never remembered, so later syncs keep asking the compositor.
+        """
+
+        self.compositor_disp_list = compositor_disp_list
+        for disp in compositor_disp_list:
+            mode: str | None = matched_map.get(disp.disp_name)
+            if mode is None:
+                continue
+            if disp.disp_mode == mode:
+                self.applied_map[disp.disp_name] = mode
+            else:
+                self.applied_map.pop(disp.disp_name, None)
+
+    def invalidate(self) -> None:
+        """
+        Forgets the remembered compositor state, so the next sync queries
+        the compositor again.
+        """
+
+        self.applied_map.clear()
+        self.compositor_disp_list = None
+
+
+## What identifies a display: its card, connector name, connector object ID
+## and EDID hash. The card is None for displays read from old traces.
+OutputKey = tuple[str | None, str, int | None, str | None]
+
+
+def get_connector_key(card_name: str, conn: ConnectorInfo) -> OutputKey:
+    """
+    Returns what identifies the display connected to a connector.
+    """
+
+    return (
+        card_name,
+        conn.disp_name,
+        conn.connector_id,
+        None if conn.edid is None else conn.edid.edid_hash,
+    )
+
+
+def get_output_key(disp: DisplayInfo) -> OutputKey:
+    """
+    Returns what identifies a display reported by the DRM topology index.
+    """
+
+    if not isinstance(disp, HwDisplayInfo):
+        return (None, disp.disp_name, None, None)
+    return (
+        disp.card_name,
+        disp.disp_name,
+        disp.connector_id,
+        None if disp.edid is None else disp.edid.edid_hash,
+    )
+
+
+def get_compositor_identity(disp: DisplayInfo) -> tuple[str, str] | None:
+    """
+    Returns the model and serial of a display as reported by the compositor
+    or derived from its EDID, for matching displays to compositor outputs,
+    or None if neither is known.
+    """
+
+    model: str
+    serial: str
+    if isinstance(disp, HwDisplayInfo) and disp.edid is not None:
+        model, serial = disp.edid.model, disp.edid.serial
+    elif isinstance(disp, CompositorDisplayInfo):
+        model, serial = disp.model, disp.serial
+    else:
+        return None
+    ## Older wlroots report a zero serial number instead of none.
+    if serial == "0x00000000":
+        serial = ""
+    if model == "" and serial == "":
+        return None
+    return (model, serial)
+
+
+class OutputIndex:
+    """
+    Index of which compositor output shows which display. Displays are
+    identified by their OutputKey, so displays with identically named
+    connectors on different cards are told apart, and a match survives the
+    compositor renaming its outputs as long as the display's EDID
+    identifies it. Built on the first sync and afterwards only updated for
+    the cards that are synced.
+
+    A display is matched to the compositor output it was matched to before
+    if that still exists, otherwise to the only output with the model and
+    serial from its EDID, otherwise to the output named like its connector.
+    Outputs matched to a display on another card are never taken over, and
+    names that are ambiguous are not matched.
+    """
+
+    def __init__(self) -> None:
+        self.output_map: dict[OutputKey, str] = {}
+        self.owner_map: dict[str, OutputKey] = {}
+        self.card_key_map: dict[str | None, set[OutputKey]] = {}
+
+    def lookup(self, disp: DisplayInfo) -> str:
+        """
+        Returns the name of the compositor output a display was last matched
+        to, or the name of its connector if it has not been matched yet.
+        """
+
+        return self.output_map.get(get_output_key(disp), disp.disp_name)
+
+    def lookup_key(self, key: OutputKey) -> str:
+        """
+        Same as lookup(), for a display given by its OutputKey.
+        """
+
+        return self.output_map.get(key, key[1])
+
+    def _forget(self, key: OutputKey) -> None:
+        output_name: str | None = self.output_map.pop(key, None)
+        if output_name is not None and self.owner_map.get(output_name) == key:
+            del self.owner_map[output_name]
+
+    def _claim(self, key: OutputKey, output_name: str) -> None:
+        self._forget(key)
+        self.output_map[key] = output_name
+        self.owner_map[output_name] = key
+        self.card_key_map.setdefault(key[0], set()).add(key)
+
+    # pylint: disable=too-many-locals
+    def update(
+        self,
+        card_list: list[str],
+        hw_disp_list: list[DisplayInfo],
+        compositor_disp_list: list[DisplayInfo],
+    ) -> list[DisplayInfo | None]:
+        """
+        Matches the displays on the listed cards to compositor outputs, and
+        forgets displays on these cards that are no longer connected.
+        Returns the compositor output of each display in hw_disp_list, None
+        for those that could not be matched.
+        """
+
+        key_list: list[OutputKey] = [get_output_key(x) for x in hw_disp_list]
+        key_set: set[OutputKey] = set(key_list)
+        for card_name in card_list:
+            old_key_set: set[OutputKey] = self.card_key_map.get(
+                card_name, set()
+            )
+            for key in old_key_set - key_set:
+                self._forget(key)
+            old_key_set &= key_set
+
+        ## Outputs the compositor reports under the same name cannot be
+        ## told apart when changing them, leave them alone.
+        compositor_map: dict[str, DisplayInfo] = {}
+        duplicate_name_set: set[str] = set()
+        for disp in compositor_disp_list:
+            if disp.disp_name in compositor_map:
+                duplicate_name_set.add(disp.disp_name)
+            compositor_map[disp.disp_name] = disp
+        for output_name in duplicate_name_set:
+            del compositor_map[output_name]
+
+        def is_free(output_name: str, key: OutputKey) -> bool:
+            return (
+                output_name in compositor_map
+                and self.owner_map.get(output_name, key) == key
+            )
+
+        match_map: dict[OutputKey, str] = {}
+        pending_list: list[tuple[OutputKey, DisplayInfo]] = []
+        for key, disp in zip(key_list, hw_disp_list):
+            output_name: str | None = self.output_map.get(key)
+            if output_name is not None and is_free(output_name, key):
+                match_map[key] = output_name
+            else:
+                pending_list.append((key, disp))
+
+        for match_func in (get_compositor_identity, lambda x: x.disp_name):
+            if not pending_list:
+                break
+            taken_set: set[str] = set(match_map.values())
+            candidate_map: dict[Any, list[str]] = {}
+            for disp in compositor_map.values():
+                if disp.disp_name not in taken_set:
+                    candidate_map.setdefault(match_func(disp), []).append(
+                        disp.disp_name
+                    )
+            identity_list: list[Any] = [match_func(x) for _, x in pending_list]
+            wanted_map: dict[Any, int] = {}
+            for identity in identity_list:
+                wanted_map[identity] = wanted_map.get(identity, 0) + 1
+            still_pending_list: list[tuple[OutputKey, DisplayInfo]] = []
+            for (key, disp), identity in zip(pending_list, identity_list):
+                candidate_list: list[str] = candidate_map.get(identity, [])
+                if (
+                    identity is not None
+                    and wanted_map[identity] == 1
+                    and len(candidate_list) == 1
+                    and is_free(candidate_list[0], key)
+                ):
+                    match_map[key] = candidate_list[0]
+                else:
+                    still_pending_list.append((key, disp))
+            pending_list = still_pending_list
+
+        out_list: list[DisplayInfo | None] = []
+        for key in key_list:
+            output_name = match_map.get(key)
+            if output_name is None:
+                out_list.append(None)
+                continue
+            if self.output_map.get(key) != output_name:
+                self._claim(key, output_name)
+            out_list.append(compositor_map[output_name])
+        return out_list
+
+
+def subscribe_udev_monitor(udev_mon: "pyudev.Monitor") -> None:
+    """
+    Narrows the events a udev monitor receives to DRM device nodes (cards
+    and render nodes), dropping the events for connector devices. libudev
+    turns this into a socket filter, so the kernel discards the other
+    events without waking the process up.
+    """
+
+    udev_mon.filter_by("drm", device_type="drm_minor")
+
+
+def is_card_hotplug_event(udev_dev: "pyudev.Device") -> bool:
+    """
+    Checks whether a udev event may have changed the displays of a DRM card:
+    a card being added or removed, or a hotplug event for a card.
+    """
+
+    action: str = udev_dev.action or "change"
+    if action == "change":
+        if udev_dev.properties.get("HOTPLUG") != "1":
+            return False
+    elif action not in ("add", "remove"):
+        return False
+    return GlobalData.drm_match_re.match(udev_dev.sys_path) is not None
+
+
+def read_udev_card_events(udev_mon: "pyudev.Monitor") -> list[CardEvent]:
+    """
+    Reads all pending udev events without blocking, and returns those
+    affecting the displays of a drm/card* device, along with the connector
+    named by each event, if any.
+    """
+
+    out_list: list[CardEvent] = []
+    while True:
+        udev_dev: pyudev.Device | None = udev_mon.poll(timeout=0)
+        if udev_dev is None:
+            return out_list
+        GlobalData.metrics.inc("udev_events_delivered")
+        ## Render nodes share the device type of cards, and the socket
+        ## filter can't look at actions or properties.
+        if not is_card_hotplug_event(udev_dev):
+            GlobalData.metrics.inc("udev_events_ignored")
+            continue
+        dev_name: str = udev_dev.sys_path
+        dev_name_parts: list[str] = dev_name.split("/")
+        connector_str: str | None = udev_dev.properties.get("CONNECTOR")
+        connector_id: int | None = None
+        if connector_str is not None and connector_str.isdigit():
+            connector_id = int(connector_str)
+        out_list.append(
+            CardEvent(
+                dev_name_parts[len(dev_name_parts) - 1],
+                udev_dev.action or "change",
+                connector_id,
+            )
+        )
+
+
+class CompositorBackend:
+    """
+    Interface for querying and changing the compositor's display
+    configuration.
+    """
+
+    def get_disp_list(self) -> list[DisplayInfo] | None:
+        """
+        Gets all enabled displays that the compositor currently sees, along
+        with their current resolution.
+        """
+
+        raise NotImplementedError
+
+    def apply_layout(
+        self, target_list: list[DisplayTarget], test_only: bool
+    ) -> bool:
+        """
+        Changes all displays in target_list in a single compositor
+        transaction, so either all of them change or none does. Modes are
+        set at the refresh rate of the target, or at 60 Hz if it is
+        unknown. With test_only, only checks whether the compositor would
+        accept the change. Returns True on success.
+        """
+
+        raise NotImplementedError
+
+    def fileno(self) -> int | None:
+        """
+        Returns a file descriptor that becomes readable when the compositor
+        sends events, or None if the backend has no persistent connection.
+        """
+
+        return None
+
+    def dispatch(self) -> None:
+        """
+        Handles events the compositor has sent since the last call.
+        """
+
+    def close(self) -> None:
+        """
+        Releases the backend's resources.
+        """
+
+
+def parse_wlr_randr_json(json_str: str) -> list[DisplayInfo] | None:
+    """
+    Parses the output of 'wlr-randr --json' into a list of all enabled
+    displays. Returns None if there are none, or if the output is
+    malformed. Modes without a refresh rate get 0 (unknown), modes without
+    the preferred or current flag are assumed not to be.
+    """
+
+    out_list: list[DisplayInfo] = []
+    try:
+        for output in json.loads(json_str):
+            if not output["enabled"]:
+                continue
+            mode_list: list[DisplayMode] = []
+            current_mode: DisplayMode | None = None
+            for mode in output["modes"]:
+                disp_mode: DisplayMode = DisplayMode(
+                    int(mode["width"]),
+                    int(mode["height"]),
+                    round(float(mode.get("refresh", 0)) * 1000),
+                    bool(mode.get("preferred", False)),
+                )
+                mode_list.append(disp_mode)
+                if mode.get("current", False):
+                    current_mode = disp_mode
+            if current_mode is None:
+                GlobalData.log.error(
+                    "Unable to find active display mode for a screen in "
+                    "wlr-randr output! wlr-randr output:\n%s",
+                    json_str,
+                )
+                return None
+            position: dict[str, int] = output.get("position", {})
+            out_list.append(
+                CompositorDisplayInfo(
+                    output["name"],
+                    f"{current_mode.width}x{current_mode.height}",
+                    current_mode.refresh,
+                    position.get("x", 0),
+                    position.get("y", 0),
+                    output.get("scale", 1.0),
+                    output.get("transform", "normal"),
+                    output.get("make") or "",
+                    output.get("model") or "",
+                    output.get("serial") or "",
+                    mode_list,
+                )
+            )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        GlobalData.log.error(
+            "Unexpected wlr-randr output! wlr-randr output:\n%s",
+            json_str,
+            exc_info=True,
+        )
+        return None
+
+    if len(out_list) == 0:
+        return None
+    return out_list
+
+
+class WlrRandrBackend(CompositorBackend):
+    """
+    Compositor backend that runs /usr/bin/wlr-randr for every query and
+    every mode change.
+    """
+
+    def __init__(self) -> None:
+        ## Built once instead of for every query.
+        self.wlr_randr_env: dict[str, str] = dict(os.environ, LC_ALL="C")
+
+    def get_disp_list(self) -> list[DisplayInfo] | None:
+        # pylint: disable=import-outside-toplevel
+        import subprocess
+
+        GlobalData.metrics.inc("subprocess_spawns")
+        try:
+            wlr_randr_json: str = subprocess.run(
+                [GlobalData.wlr_randr_path, "--json"],
+                env=self.wlr_randr_env,
+                check=True,
+                capture_output=True,
+                encoding="utf-8",
+            ).stdout
+        except Exception:
+            GlobalData.log.error(
+                "Could not get list of displays from compositor!",
+                exc_info=True,
+            )
+            sys.exit(1)
+
+        return parse_wlr_randr_json(wlr_randr_json)
+
+    def apply_layout(
+        self, target_list: list[DisplayTarget], test_only: bool
+    ) -> bool:
+        # pylint: disable=import-outside-toplevel
+        import subprocess
+
+        wlr_randr_cmd: list[str] = [GlobalData.wlr_randr_path]
+        if test_only:
+            wlr_randr_cmd.append("--dryrun")
+        ## wlr-randr puts all --output options into one output
+        ## configuration.
+        for target in target_list:
+            wlr_randr_cmd += ["--output", target.disp_name]
+            if target.disp_mode is not None:
+                wlr_randr_cmd += [
+                    "--mode" if target.advertised else "--custom-mode",
+                    f"{target.disp_mode}@{target.get_refresh_hz()}",
+                ]
+            if target.pos is not None:
+                wlr_randr_cmd += ["--pos", f"{target.pos[0]},{target.pos[1]}"]
+
+        GlobalData.metrics.inc("subprocess_spawns")
+        try:
+            subprocess.run(wlr_randr_cmd, check=True)
+        except subprocess.CalledProcessError:
+            if not test_only:
+                GlobalData.log.error(
+                    "wlr-randr failed to change the displays!", exc_info=True
+                )
+            return False
+        return True
+
+
+class WlrOutputManagementBackend(CompositorBackend):
+    """
+    Compositor backend that keeps one Wayland connection bound to
+    zwlr_output_manager_v1 for the lifetime of the process. Display state is
+    tracked from protocol events, so a query costs one roundtrip and a mode
+    change costs one output configuration commit.
+    """
+
+    def __init__(self) -> None:
+        self.client: OutputManagerClient = OutputManagerClient()
+        self.client.connect()
+
+    def get_disp_list(self) -> list[DisplayInfo] | None:
+        try:
+            self.client.roundtrip()
+        except WaylandError:
+            GlobalData.log.error(
+                "Could not get list of displays from compositor!",
+                exc_info=True,
+            )
+            sys.exit(1)
+
+        out_list: list[DisplayInfo] = []
+        for head in self.client.head_map.values():
+            if not head.enabled:
+                continue
+            if head.current_mode is None:
+                GlobalData.log.error(
+                    "Unable to find active display mode for display '%s' in "
+                    "compositor output state!",
+                    head.name,
+                )
+                sys.exit(1)
+            out_list.append(
+                CompositorDisplayInfo(
+                    head.name,
+                    f"{head.current_mode.width}x{head.current_mode.height}",
+                    head.current_mode.refresh,
+                    head.pos_x,
+                    head.pos_y,
+                    head.scale,
+                    GlobalData.transform_name_list[head.transform % 8],
+                    head.make,
+                    head.model,
+                    head.serial_number,
+                    [
+                        DisplayMode(x.width, x.height, x.refresh, x.preferred)
+                        for x in head.mode_list
+                    ],
+                )
+            )
+
+        if len(out_list) == 0:
+            return None
+        return out_list
+
+    def apply_layout(
+        self, target_list: list[DisplayTarget], test_only: bool
+    ) -> bool:
+        try:
+            ## A configuration is cancelled if the compositor's output state
+            ## changed since the last done event. Refresh the state and try
+            ## again once in that case.
+            for _ in range(2):
+                config_list: list[HeadConfig] | None = self._build_config(
+                    target_list
+                )
+                if config_list is None:
+                    return False
+                result: str = self.client.apply(config_list, test_only)
+                if result != "cancelled":
+                    return result == "succeeded"
+                self.client.roundtrip()
+        except WaylandError:
+            GlobalData.log.error(
+                "Lost connection to compositor while changing display "
+                "resolution!",
+                exc_info=True,
+            )
+            sys.exit(1)
+        return False
+
+    def _build_config(
+        self, target_list: list[DisplayTarget]
+    ) -> list[HeadConfig] | None:
+        config_list: list[HeadConfig] = []
+        for target in target_list:
+            head: OutputHead | None = self._find_head(target.disp_name)
+            if head is None:
+                GlobalData.log.warning(
+                    "Compositor has no display '%s'!", target.disp_name
+                )
+                return None
+            width: int = 0
+            height: int = 0
+            if target.disp_mode is not None:
+                mode_match: re.Match[str] | None = (
+                    GlobalData.mode_size_re.match(target.disp_mode)
+                )
+                if mode_match is None:
+                    GlobalData.log.warning(
+                        "Cannot parse display mode '%s'!", target.disp_mode
+                    )
+                    return None
+                width = int(mode_match.group(1))
+                height = int(mode_match.group(2))
+            config_list.append(
+                HeadConfig(
+                    head, width, height, target.refresh or 60000, target.pos
+                )
+            )
+        return config_list
+
+    def fileno(self) -> int | None:
+        return self.client.fileno()
+
+    def dispatch(self) -> None:
+        try:
+            self.client.dispatch()
+        except WaylandError:
+            GlobalData.log.error(
+                "Lost connection to compositor!", exc_info=True
+            )
+            sys.exit(1)
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _find_head(self, disp_name: str) -> OutputHead | None:
+        for head in self.client.head_map.values():
+            if head.name == disp_name:
+                return head
+        return None
+
+
+def init_compositor_backend(early: bool = False) -> bool:
+    """
+    Selects the compositor backend according to the compositor_backend
+    setting. In 'auto' mode, the native wlr-output-management client is
+    preferred and wlr-randr is used if the compositor cannot be reached that
+    way.
+
+    With early set, the compositor may not be fully up yet. If the native
+    client cannot connect, no backend is selected, so that the normal
+    startup path tries again later instead of falling back to wlr-randr for
+    the whole session or exiting. Returns whether a backend was selected.
+    """
+
+    if GlobalData.compositor_backend in ("auto", "wlr-output-management"):
+        try:
+            GlobalData.active_backend = WlrOutputManagementBackend()
+            GlobalData.log.info("compositor backend: wlr-output-management")
+            return True
+        except WaylandError:
+            if early:
+                GlobalData.log.info(
+                    "Cannot use the wlr-output-management protocol yet, "
+                    "trying again after the process wait."
+                )
+                return False
+            if GlobalData.compositor_backend == "wlr-output-management":
+                GlobalData.log.error(
+                    "Cannot use the wlr-output-management protocol!",
+                    exc_info=True,
+                )
+                sys.exit(1)
+            GlobalData.log.warning(
+                "Cannot use the wlr-output-management protocol, falling back "
+                "to wlr-randr!",
+                exc_info=True,
+            )
+
+    GlobalData.active_backend = WlrRandrBackend()
+    GlobalData.log.info("compositor backend: wlr-randr")
+    return True
+
+
+def get_compositor_disp_list() -> list[DisplayInfo] | None:
+    """
+    Gets all enabled displays that the compositor currently sees, along with
+    their current resolution.
+    """
+
+    assert GlobalData.active_backend is not None
+    with GlobalData.metrics.timed("compositor_query"):
+        disp_list: list[DisplayInfo] | None = (
+            GlobalData.active_backend.get_disp_list()
+        )
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write(
+            "compositor", disp_list=disp_list_to_json(disp_list)
+        )
+    if GlobalData.once_report is not None:
+        GlobalData.once_report.add_compositor_state(
+            disp_list_to_json(disp_list)
+        )
+    return disp_list
+
+
+def disp_list_to_json(
+    disp_list: list[DisplayInfo] | None,
+) -> list[dict[str, Any]] | None:
+    """
+    Converts a display list to a form that can be serialized to JSON, for
+    traces.
+    """
+
+    if disp_list is None:
+        return None
+    out_list: list[dict[str, Any]] = []
+    for disp in disp_list:
+        disp_dict: dict[str, Any] = {
+            "disp_name": disp.disp_name,
+            "disp_mode": disp.disp_mode,
+            "refresh": disp.refresh,
+        }
+        if isinstance(disp, HwDisplayInfo):
+            disp_dict.update(
+                card=disp.card_name,
+                connector_id=disp.connector_id,
+                edid=edid_to_json(disp.edid),
+            )
+        if isinstance(disp, CompositorDisplayInfo):
+            disp_dict.update(
+                pos_x=disp.pos_x,
+                pos_y=disp.pos_y,
+                scale=disp.scale,
+                transform=disp.transform,
+                make=disp.make,
+                model=disp.model,
+                serial=disp.serial,
+                mode_list=[
+                    [x.width, x.height, x.refresh, x.preferred]
+                    for x in disp.mode_list
+                ],
+            )
+        out_list.append(disp_dict)
+    return out_list
+
+
+def disp_list_from_json(
+    disp_dict_list: list[dict[str, Any]] | None,
+) -> list[DisplayInfo] | None:
+    """
+    Converts a display list read from a trace back. Raises KeyError,
+    TypeError or ValueError if it is malformed.
+    """
+
+    if disp_dict_list is None:
+        return None
+    out_list: list[DisplayInfo] = []
+    for disp_dict in disp_dict_list:
+        if "card" in disp_dict:
+            out_list.append(
+                HwDisplayInfo(
+                    str(disp_dict["disp_name"]),
+                    str(disp_dict["disp_mode"]),
+                    int(disp_dict["refresh"]),
+                    str(disp_dict["card"]),
+                    (
+                        None
+                        if disp_dict["connector_id"] is None
+                        else int(disp_dict["connector_id"])
+                    ),
+                    edid_from_json(disp_dict["edid"]),
+                )
+            )
+            continue
+        if "mode_list" not in disp_dict:
+            out_list.append(
+                DisplayInfo(
+                    str(disp_dict["disp_name"]),
+                    str(disp_dict["disp_mode"]),
+                    int(disp_dict["refresh"]),
+                )
+            )
+            continue
+        out_list.append(
+            CompositorDisplayInfo(
+                str(disp_dict["disp_name"]),
+                str(disp_dict["disp_mode"]),
+                int(disp_dict["refresh"]),
+                int(disp_dict["pos_x"]),
+                int(disp_dict["pos_y"]),
+                float(disp_dict["scale"]),
+                str(disp_dict["transform"]),
+                str(disp_dict["make"]),
+                str(disp_dict["model"]),
+                str(disp_dict["serial"]),
+                [
+                    DisplayMode(int(w), int(h), int(r), bool(p))
+                    for w, h, r, p in disp_dict["mode_list"]
+                ],
+            )
+        )
+    return out_list
+
+
+def edid_to_json(edid_info: EdidInfo | None) -> dict[str, str] | None:
+    """
+    Converts a display's EDID identity to a form that can be serialized to
+    JSON, for traces and the resize broker.
+    """
+
+    if edid_info is None:
+        return None
+    return {
+        "hash": edid_info.edid_hash,
+        "model": edid_info.model,
+        "serial": edid_info.serial,
+    }
+
+
+def edid_from_json(edid_dict: dict[str, str] | None) -> EdidInfo | None:
+    """
+    Converts an EDID identity read from a trace or received from the resize
+    broker back. Raises KeyError or TypeError if it is malformed.
+    """
+
+    if edid_dict is None:
+        return None
+    return EdidInfo(
+        str(edid_dict["hash"]),
+        str(edid_dict["model"]),
+        str(edid_dict["serial"]),
+    )
+
+
+def target_list_to_json(
+    target_list: list[DisplayTarget],
+) -> list[dict[str, Any]]:
+    """
+    Converts a list of display changes to a form that can be serialized to
+    JSON, for traces.
+    """
+
+    return [
+        {
+            "disp_name": x.disp_name,
+            "disp_mode": x.disp_mode,
+            "pos": None if x.pos is None else list(x.pos),
+            "refresh": x.refresh,
+            "advertised": x.advertised,
+        }
+        for x in target_list
+    ]
+
+
+def get_logical_width(disp: CompositorDisplayInfo, disp_mode: str) -> int:
+    """
+    Returns the width a display with the given mode takes up in the
+    compositor's layout, taking scale and rotation into account.
+    """
+
+    mode_match: re.Match[str] | None = GlobalData.mode_size_re.match(disp_mode)
+    assert mode_match is not None
+    width: int = int(mode_match.group(1))
+    if disp.transform in ("90", "270", "flipped-90", "flipped-270"):
+        width = int(mode_match.group(2))
+    return int(width / disp.scale)
+
+
+def compute_display_targets(
+    compositor_disp_list: list[DisplayInfo],
+    mode_map: dict[str, str],
+    refresh_map: dict[str, int] | None = None,
+) -> list[DisplayTarget]:
+    """
+    Works out the new mode and position of every display, given the new
+    modes in mode_map (display name -> mode) and optionally their refresh
+    rates in refresh_map (display name -> mHz). Displays arranged in a row
+    from left to right without gaps, the way compositors place them by
+    default, are kept in such a row with their new sizes. Any other
+    arrangement was chosen by the user and is left alone. Returns only the
+    displays whose state changes.
+    """
+
+    row_list: list[CompositorDisplayInfo] = sorted(
+        (
+            x
+            for x in compositor_disp_list
+            if isinstance(x, CompositorDisplayInfo)
+        ),
+        key=lambda x: (x.pos_x, x.pos_y),
+    )
+    pos_map: dict[str, tuple[int, int]] = {}
+    if 1 < len(row_list) == len(compositor_disp_list) and all(
+        cur.pos_y == row_list[0].pos_y
+        and cur.pos_x == prev.pos_x + get_logical_width(prev, prev.disp_mode)
+        for prev, cur in zip(row_list, row_list[1:])
+    ):
+        next_x: int = row_list[0].pos_x
+        for disp in row_list:
+            pos_map[disp.disp_name] = (next_x, disp.pos_y)
+            next_x += get_logical_width(
+                disp, mode_map.get(disp.disp_name, disp.disp_mode)
+            )
+
+    target_list: list[DisplayTarget] = []
+    for disp in compositor_disp_list:
+        new_mode: str | None = mode_map.get(disp.disp_name)
+        if new_mode == disp.disp_mode:
+            new_mode = None
+        new_pos: tuple[int, int] | None = pos_map.get(disp.disp_name)
+        if isinstance(disp, CompositorDisplayInfo) and new_pos == (
+            disp.pos_x,
+            disp.pos_y,
+        ):
+            new_pos = None
+        if new_mode is None and new_pos is None:
+            continue
+        refresh: int = 0
+        advertised: bool = False
+        if new_mode is not None and refresh_map is not None:
+            refresh = refresh_map.get(disp.disp_name, 0)
+        if refresh != 0 and isinstance(disp, CompositorDisplayInfo):
+            advertised = any(
+                f"{x.width}x{x.height}" == new_mode and x.refresh == refresh
+                for x in disp.mode_list
+            )
+        target_list.append(
+            DisplayTarget(
+                disp.disp_name, new_mode, new_pos, refresh, advertised
+            )
+        )
+    return target_list
+
+
+def apply_compositor_layout(target_list: list[DisplayTarget]) -> bool:
+    """
+    Changes all displays in target_list in one compositor transaction. The
+    change is tested first. If the compositor rejects it as a whole, the
+    displays it accepts on their own are still changed together. Returns
+    True if all displays were changed.
+    """
+
+    assert GlobalData.active_backend is not None
+    if len(target_list) == 0:
+        return True
+
+    accepted_list: list[DisplayTarget] = target_list
+    with GlobalData.metrics.timed("apply_test"):
+        if not apply_backend_layout(target_list, True):
+            accepted_list = [
+                x
+                for x in target_list
+                if len(target_list) > 1 and apply_backend_layout([x], True)
+            ]
+    for target in target_list:
+        if target not in accepted_list:
+            GlobalData.log.warning(
+                "Compositor rejects changing display %s!", target.describe()
+            )
+    if len(accepted_list) == 0:
+        GlobalData.metrics.inc("failed_applies", len(target_list))
+        return False
+
+    with GlobalData.metrics.timed("apply"):
+        success: bool = apply_backend_layout(accepted_list, False)
+    if not success:
+        GlobalData.metrics.inc("failed_applies", len(target_list))
+        return False
+    GlobalData.metrics.inc(
+        "failed_applies", len(target_list) - len(accepted_list)
+    )
+    return len(accepted_list) == len(target_list)
+
+
+def apply_backend_layout(
+    target_list: list[DisplayTarget], test_only: bool
+) -> bool:
+    """
+    Hands display changes to the compositor backend, and records them and
+    the outcome in the trace and the --once report.
+    """
+
+    assert GlobalData.active_backend is not None
+    apply_start_time: float = time.monotonic()
+    success: bool = GlobalData.active_backend.apply_layout(
+        target_list, test_only
+    )
+    if GlobalData.once_report is not None:
+        GlobalData.once_report.add_action(
+            target_list_to_json(target_list),
+            test_only,
+            success,
+            time.monotonic() - apply_start_time,
+        )
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write(
+            "apply",
+            target_list=target_list_to_json(target_list),
+            test_only=test_only,
+            success=success,
+        )
+    return success
+
+
+def get_hw_disp_list(card_list: list[str]) -> list[DisplayInfo] | None:
+    """
+    Gets all recognized displays present on the specified list of graphics
+    cards, and their native resolution, from the DRM topology index.
+    """
+
+    assert GlobalData.drm_topology is not None
+    out_list: list[DisplayInfo] = GlobalData.drm_topology.get_disp_list(
+        card_list
+    )
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write(
+            "hw", card_list=card_list, disp_list=disp_list_to_json(out_list)
+        )
+    if GlobalData.once_report is not None:
+        GlobalData.once_report.hw_disp_list = disp_list_to_json(out_list)
+    if len(out_list) == 0:
+        return None
+    return out_list
+
+
+def sync_hw_resolution_with_compositor(card_name: str | None) -> None:
+    """
+    Sets the compositor's display resolution for all displays on all specified
+    graphics cards to the native resolution.
+    """
+
+    sync_start_time: float = time.monotonic()
+    GlobalData.log.debug(
+        "sync_hw_resolution_with_compositor start (card_name=%r)",
+        card_name,
+        CARD=card_name or "",
+    )
+
+    not_resizing_display_message = '''
+Not changing screen resolution!
+
+Automatic screen resizing is turned off by default inside the workstation to improve privacy (it can reduce fingerprinting). If you want to turn it on, open the System Maintenance Panel and click 'Configure Dynamic Resolution'.
+
+Or run: configure-dynamic-resolution
+
+See also:
+https://www.whonix.org/wiki/resize
+    '''
+
+    ## Optionally send a notification and exit if dynamic resolution has
+    ## been disabled.
+    if not GlobalData.enable_dynamic_resolution:
+        GlobalData.log.info(
+            "Dynamic resolution disabled by config. Skipping sync."
+        )
+        if GlobalData.warn_on_dynamic_resolution_refuse:
+            GlobalData.warn_on_dynamic_resolution_refuse = False
+            GlobalData.log.info(
+                "warn_on_dynamic_resolution_refuse=1 -> sending notify and "
+                "disabling further warnings."
+            )
+            one_time_popup_status_file = os.path.expanduser(
+                "~/.wlr-resize-watcher_one-time-popup"
+            )
+            # pylint: disable=import-outside-toplevel
+            import subprocess
+
+            GlobalData.metrics.inc("subprocess_spawns", 2)
+            subprocess.run(
+                [
+                    "/usr/bin/notify-send",
+                    "--app-name=wlr_resize_watcher",
+                    not_resizing_display_message,
+                ],
+                check=False,
+            )
+            subprocess.run(
+                [
+                    "/usr/libexec/msgcollector/one-time-popup",
+                    one_time_popup_status_file,
+                    "wlr-resize-watcher",
+                    not_resizing_display_message,
+                ],
+                check=False,
+            )
+        return
+
+    assert GlobalData.drm_topology is not None
+    real_card_list: list[str]
+    if card_name is None:
+        ## Use all cards known to the DRM topology index.
+        GlobalData.log.debug(
+            "card_name=None -> using all cards in %s", GlobalData.drm_path
+        )
+        real_card_list = GlobalData.drm_topology.get_card_list()
+        GlobalData.log.debug("discovered cards: %r", real_card_list)
+    else:
+        real_card_list = [card_name]
+        GlobalData.log.debug(
+            "card_name provided -> using cards: %r", real_card_list
+        )
+
+    hw_disp_list: list[DisplayInfo] | None = get_hw_disp_list(real_card_list)
+    if hw_disp_list is None:
+        GlobalData.log.info(
+            "hw_disp_list=None (no connected displays found for cards %r) "
+            "-> returning",
+            real_card_list,
+        )
+        return
+    if GlobalData.log.is_enabled(logger.DEBUG):
+        GlobalData.log.debug(
+            "hardware reports %s display(s): %r",
+            len(hw_disp_list),
+            [(d.disp_name, d.disp_mode) for d in hw_disp_list],
+        )
+
+    ## Many udev events (render nodes, repeated events for the same
+    ## geometry) don't change what the displays should look like. Don't
+    ## bother the compositor for those.
+    assert GlobalData.reconciler is not None
+    assert GlobalData.output_index is not None
+    desired_map: dict[str, str] = {
+        GlobalData.output_index.lookup(x): x.disp_mode for x in hw_disp_list
+    }
+    if GlobalData.reconciler.is_satisfied(desired_map):
+        GlobalData.log.debug(
+            "displays already at their native modes -> returning"
+        )
+        GlobalData.metrics.inc("suppressed_syncs")
+        return
+    ## Give a new desired state the full number of retries.
+    if desired_map != GlobalData.reconciler.desired_map:
+        GlobalData.reconciler.desired_map = desired_map
+        GlobalData.reconciler.retry_count = 0
+
+    compositor_disp_list: list[DisplayInfo] | None = get_compositor_disp_list()
+    if compositor_disp_list is None:
+        GlobalData.log.info(
+            "compositor_disp_list=None (compositor likely sees no displays) "
+            "-> returning"
+        )
+        return
+    if GlobalData.log.is_enabled(logger.DEBUG):
+        GlobalData.log.debug(
+            "compositor reports %s display(s): %r",
+            len(compositor_disp_list),
+            [(d.disp_name, d.disp_mode) for d in compositor_disp_list],
+        )
+
+    ## Only the displays on the synced cards are looked up, instead of
+    ## comparing every display's name with every compositor output.
+    matched_list: list[DisplayInfo | None] = GlobalData.output_index.update(
+        real_card_list, hw_disp_list, compositor_disp_list
+    )
+    mode_map: dict[str, str] = {}
+    refresh_map: dict[str, int] = {}
+    matched_map: dict[str, str] = {}
+    for hw_display, matched_compositor_display in zip(
+        hw_disp_list, matched_list
+    ):
+        GlobalData.log.debug(
+            "checking hw display '%s' native_mode='%s'",
+            hw_display.disp_name,
+            hw_display.disp_mode,
+            OUTPUT=hw_display.disp_name,
+        )
+        if matched_compositor_display is None:
+            GlobalData.log.info(
+                "no compositor match for hw display '%s', skipping",
+                hw_display.disp_name,
+                OUTPUT=hw_display.disp_name,
+            )
+            continue
+        GlobalData.log.debug(
+            "matched compositor display '%s' current_mode='%s'",
+            matched_compositor_display.disp_name,
+            matched_compositor_display.disp_mode,
+            OUTPUT=matched_compositor_display.disp_name,
+        )
+        matched_map[matched_compositor_display.disp_name] = (
+            hw_display.disp_mode
+        )
+
+        if hw_display.disp_mode != matched_compositor_display.disp_mode:
+            GlobalData.log.info(
+                "mode mismatch -> attempting sync: '%s' %s -> %s",
+                hw_display.disp_name,
+                matched_compositor_display.disp_mode,
+                hw_display.disp_mode,
+                OUTPUT=matched_compositor_display.disp_name,
+            )
+            mode_map[matched_compositor_display.disp_name] = (
+                hw_display.disp_mode
+            )
+            refresh_map[matched_compositor_display.disp_name] = (
+                hw_display.refresh
+            )
+        else:
+            GlobalData.log.debug(
+                "display '%s' already matches native mode '%s', no action "
+                "needed",
+                hw_display.disp_name,
+                hw_display.disp_mode,
+                OUTPUT=hw_display.disp_name,
+            )
+
+    ## Apply all changes at once, so the compositor only has to lay out the
+    ## desktop once and no display is left in an intermediate state.
+    target_list: list[DisplayTarget] = compute_display_targets(
+        compositor_disp_list, mode_map, refresh_map
+    )
+    if len(target_list) == 0:
+        GlobalData.metrics.inc("noop_syncs")
+        GlobalData.reconciler.record(compositor_disp_list, matched_map)
+        cancel_sync_retry()
+        save_display_snapshot()
+    elif apply_compositor_layout(target_list):
+        ## The compositor may accept a mode and still end up using a
+        ## different one, check what it actually did.
+        with GlobalData.metrics.timed("verify"):
+            verified_disp_list: list[DisplayInfo] | None = (
+                get_compositor_disp_list()
+            )
+        if verify_compositor_layout(verified_disp_list, target_list):
+            phase_ms: float = (time.monotonic() - sync_start_time) * 1000
+            for target in target_list:
+                GlobalData.log.info(
+                    "synced display %s",
+                    target.describe(),
+                    OUTPUT=target.disp_name,
+                    PHASE_MS=f"{phase_ms:.1f}",
+                )
+            assert verified_disp_list is not None
+            GlobalData.reconciler.record(verified_disp_list, matched_map)
+            cancel_sync_retry()
+            save_display_snapshot()
+        else:
+            GlobalData.log.warning(
+                "Compositor did not keep the new display resolution for "
+                "displays %r!",
+                [x.disp_name for x in target_list],
+            )
+            GlobalData.metrics.inc("reverted_applies")
+            schedule_sync_retry()
+    else:
+        GlobalData.log.warning(
+            "Unable to sync display resolution for displays %r!",
+            [x.disp_name for x in target_list],
+        )
+        schedule_sync_retry()
+    GlobalData.log.debug(
+        "sync_hw_resolution_with_compositor end",
+        PHASE_MS=f"{(time.monotonic() - sync_start_time) * 1000:.1f}",
+    )
+
+
+def save_display_snapshot() -> None:
+    """
+    Saves the modes of all displays that are known to run at their native
+    mode, for restoring them at the start of the next session. The snapshot
+    is only written if it has changed.
+    """
+
+    if not GlobalData.enable_warm_start:
+        return
+    assert GlobalData.drm_topology is not None
+    assert GlobalData.reconciler is not None
+    assert GlobalData.output_index is not None
+    output_list: list[OutputSnapshot] = []
+    for card_name, conn_map in GlobalData.drm_topology.card_map.items():
+        for conn in conn_map.values():
+            if (
+                conn.disp_mode is None
+                or GlobalData.reconciler.applied_map.get(
+                    GlobalData.output_index.lookup_key(
+                        get_connector_key(card_name, conn)
+                    )
+                )
+                != conn.disp_mode
+            ):
+                continue
+            output_list.append(
+                OutputSnapshot(
+                    card_name,
+                    conn.disp_name,
+                    conn.connector_id,
+                    conn.disp_mode,
+                    conn.refresh,
+                )
+            )
+    if len(output_list) == 0:
+        return
+    snapshot_key: tuple[tuple[Any, ...], ...] = tuple(
+        sorted(x.identity() + (x.disp_mode, x.refresh) for x in output_list)
+    )
+    if snapshot_key == GlobalData.saved_snapshot_key:
+        return
+    snapshot_path: Path | None = warm_start.get_snapshot_path()
+    if snapshot_path is None:
+        return
+    try:
+        warm_start.save_snapshot(
+            snapshot_path, GlobalData.virtualizer_str, output_list
+        )
+    except OSError:
+        GlobalData.log.warning(
+            "Cannot write display snapshot '%s'!", snapshot_path, exc_info=True
+        )
+        return
+    GlobalData.saved_snapshot_key = snapshot_key
+
+
+def restore_display_snapshot() -> None:
+    """
+    Applies the display modes of the last session right away, if the same
+    displays are connected to the same virtualizer as back then. The normal
+    startup path corrects them later if they turn out to be wrong. This
+    avoids running at the compositor's default resolution until the resize
+    helper and the desktop have started.
+    """
+
+    ## The snapshot and the topology read here are not part of traces.
+    if not (
+        GlobalData.enable_warm_start
+        and GlobalData.resize_helper_present
+        and GlobalData.enable_dynamic_resolution
+        and GlobalData.trace_writer is None
+    ):
+        return
+    snapshot_path: Path | None = warm_start.get_snapshot_path()
+    if snapshot_path is None:
+        return
+    output_list: list[OutputSnapshot] | None = warm_start.load_snapshot(
+        snapshot_path, GlobalData.virtualizer_str
+    )
+    if output_list is None:
+        return
+
+    topology: DrmTopology | None = GlobalData.drm_topology
+    if topology is None:
+        topology = DrmTopology(GlobalData.drm_path, get_dri_path())
+        topology.rescan_all()
+    connected_set: set[tuple[str, str, int | None]] = {
+        (card_name, conn.disp_name, conn.connector_id)
+        for card_name, conn_map in topology.card_map.items()
+        for conn in conn_map.values()
+        if conn.disp_mode is not None
+    }
+    if connected_set != {x.identity() for x in output_list}:
+        GlobalData.log.info(
+            "Connected displays differ from the display snapshot, not "
+            "restoring it."
+        )
+        return
+
+    if not init_compositor_backend(early=True):
+        return
+    compositor_disp_list: list[DisplayInfo] | None = get_compositor_disp_list()
+    if compositor_disp_list is None:
+        return
+    assert GlobalData.output_index is not None
+    card_list: list[str] = topology.get_card_list()
+    hw_disp_list: list[DisplayInfo] = topology.get_disp_list(card_list)
+    snapshot_map: dict[tuple[str, str, int | None], OutputSnapshot] = {
+        x.identity(): x for x in output_list
+    }
+    mode_map: dict[str, str] = {}
+    refresh_map: dict[str, int] = {}
+    for hw_disp, compositor_disp in zip(
+        hw_disp_list,
+        GlobalData.output_index.update(
+            card_list, hw_disp_list, compositor_disp_list
+        ),
+    ):
+        assert isinstance(hw_disp, HwDisplayInfo)
+        if compositor_disp is None:
+            continue
+        output_snapshot: OutputSnapshot = snapshot_map[
+            (hw_disp.card_name, hw_disp.disp_name, hw_disp.connector_id)
+        ]
+        mode_map[compositor_disp.disp_name] = output_snapshot.disp_mode
+        refresh_map[compositor_disp.disp_name] = output_snapshot.refresh
+    target_list: list[DisplayTarget] = compute_display_targets(
+        compositor_disp_list, mode_map, refresh_map
+    )
+    if len(target_list) == 0:
+        return
+    if apply_compositor_layout(target_list):
+        for target in target_list:
+            GlobalData.log.info("restored display %s", target.describe())
+
+
+def verify_compositor_layout(
+    compositor_disp_list: list[DisplayInfo] | None,
+    target_list: list[DisplayTarget],
+) -> bool:
+    """
+    Checks that the compositor runs all displays in target_list at their
+    target mode.
+    """
+
+    if compositor_disp_list is None:
+        return False
+    mode_map: dict[str, str] = {
+        x.disp_name: x.disp_mode for x in compositor_disp_list
+    }
+    return all(
+        x.disp_mode is None or mode_map.get(x.disp_name) == x.disp_mode
+        for x in target_list
+    )
+
+
+def schedule_sync_retry() -> None:
+    """
+    Schedules another sync of all displays after a failed one, waiting
+    twice as long after every failure in a row. Gives up after
+    apply_retry_limit retries, until the next udev event.
+    """
+
+    assert GlobalData.reconciler is not None
+    reconciler: Reconciler = GlobalData.reconciler
+    reconciler.invalidate()
+    if reconciler.retry_timer is not None:
+        return
+    if GlobalData.event_loop is None:
+        ## Not running the event loop yet. The retry is scheduled once it
+        ## runs, see main().
+        reconciler.retry_pending = True
+        return
+    reconciler.retry_pending = False
+    if reconciler.retry_count >= GlobalData.apply_retry_limit:
+        GlobalData.log.warning(
+            "Giving up after %s retries!", reconciler.retry_count
+        )
+        return
+    delay_ms: int = min(
+        GlobalData.apply_retry_initial_delay_ms * 2**reconciler.retry_count,
+        GlobalData.apply_retry_max_delay_ms,
+    )
+    reconciler.retry_count += 1
+    GlobalData.log.info(
+        "Retrying display sync in %s ms (attempt %s of %s).",
+        delay_ms,
+        reconciler.retry_count,
+        GlobalData.apply_retry_limit,
+    )
+    reconciler.retry_timer = GlobalData.event_loop.call_later(
+        delay_ms / 1000, run_sync_retry
+    )
+
+
+def cancel_sync_retry() -> None:
+    """
+    Stops retrying after a successful sync.
+    """
+
+    assert GlobalData.reconciler is not None
+    reconciler: Reconciler = GlobalData.reconciler
+    reconciler.retry_count = 0
+    reconciler.retry_pending = False
+    if reconciler.retry_timer is not None:
+        reconciler.retry_timer.cancel()
+        reconciler.retry_timer = None
+
+
+def run_sync_retry() -> None:
+    """
+    Timer callback for a scheduled sync retry.
+    """
+
+    assert GlobalData.reconciler is not None
+    GlobalData.metrics.inc("apply_retries")
+    GlobalData.reconciler.retry_timer = None
+    sync_hw_resolution_with_compositor(None)
+
+
+def get_default_resolution(output_count: int) -> str:
+    """
+    Returns standard_default_resolution if output_count displays at that
+    resolution fit within the limits of all graphics cards, and
+    small_default_resolution otherwise. If no card's limits are known, the
+    small one is only used under Xen, whose emulated VGA is known to have
+    too little video memory.
+    """
+
+    limits_list: list[CardLimits] = []
+    if GlobalData.drm_topology is not None:
+        limits_list = [
+            x
+            for x in GlobalData.drm_topology.limits_map.values()
+            if x.is_limited()
+        ]
+    if not limits_list:
+        if GlobalData.virtualizer_str == "xen":
+            return GlobalData.small_default_resolution
+        return GlobalData.standard_default_resolution
+    mode_match: re.Match[str] | None = GlobalData.mode_size_re.match(
+        GlobalData.standard_default_resolution
+    )
+    assert mode_match is not None
+    if all(
+        x.fits(
+            int(mode_match.group(1)),
+            int(mode_match.group(2)),
+            output_count,
+            GlobalData.vram_buffers_per_output,
+        )
+        for x in limits_list
+    ):
+        return GlobalData.standard_default_resolution
+    return GlobalData.small_default_resolution
+
+
+def set_all_displays_resolution_to_default() -> None:
+    """
+    Sets the screen resolution of all displays to a default (hardcoded) value
+    that fits the graphics cards, see get_default_resolution().
+    """
+
+    disp_list: list[DisplayInfo] | None = get_compositor_disp_list()
+    if disp_list is None:
+        return
+    selected_res: str = get_default_resolution(len(disp_list))
+    target_list: list[DisplayTarget] = compute_display_targets(
+        disp_list, {x.disp_name: selected_res for x in disp_list}
+    )
+    if not apply_compositor_layout(target_list):
+        GlobalData.log.warning(
+            "Unable to set default display resolution for displays %r!",
+            [x.disp_name for x in target_list],
+        )
+
+
+def exit_without_work(message: str) -> NoReturn:
+    """
+    Exits successfully because there is nothing to do, e.g. on physical
+    hardware. The service manager is told that the service is ready and
+    stopping first, as it considers a Type=notify service that exits
+    without ever becoming ready to have failed, and restarts it.
+    """
+
+    GlobalData.log.info("%s", message)
+    sd_notify.notify("READY=1\nSTOPPING=1")
+    sys.exit(0)
+
+
+# pylint: disable=too-many-return-statements
+def check_virtualizer_type() -> None:
+    """
+    Records the currently-in-use virtualizer in a global variable and checks
+    to see if a display resize helper is present and running.
+    """
+
+    if GlobalData.broker_client is not None:
+        ## The resize broker has checked both already.
+        if GlobalData.virtualizer_str == "none":
+            exit_without_work("Running on physical hardware, exiting.")
+        return
+
+    try:
+        ## An empty value means systemd-detect-virt could not tell at boot.
+        GlobalData.virtualizer_str = (
+            GlobalData.probed_environment.get("virtualizer")
+            or detect_virtualizer()
+        )
+        if GlobalData.virtualizer_str is None:
+            ## Not enough information in /sys and /proc (e.g. no DMI tables
+            ## and no x86 CPU flags), ask systemd instead.
+            # pylint: disable=import-outside-toplevel
+            import subprocess
+
+            GlobalData.metrics.inc("subprocess_spawns")
+            GlobalData.virtualizer_str = subprocess.run(
+                ["/usr/bin/systemd-detect-virt"],
+                check=False,
+                capture_output=True,
+                encoding="utf-8",
+            ).stdout.strip()
+        if GlobalData.virtualizer_str in GlobalData.resize_helper_map:
+            helper_path: str = GlobalData.resize_helper_map[
+                GlobalData.virtualizer_str
+            ]
+            helper_name: str = Path(helper_path).name
+            if not Path(helper_path).is_file():
+                GlobalData.log.warning("%s is missing!", helper_name)
+                return
+            ## Keeps tracking the helper once the event loop runs.
+            GlobalData.helper_watcher = HelperWatcher(helper_path)
+            if not GlobalData.helper_watcher.find():
+                GlobalData.log.warning("%s is not running!", helper_name)
+                return
+
+        elif GlobalData.virtualizer_str == "xen":
+            ## Xen has no virtualizer helper.
+            return
+
+        elif GlobalData.virtualizer_str == "none":
+            exit_without_work("Running on physical hardware, exiting.")
+
+        else:
+            GlobalData.log.warning("Running on an unsupported virtualizer!")
+            return
+
+    except Exception:
+        GlobalData.log.warning(
+            "Cannot detect virtualizer in use!", exc_info=True
+        )
+        return
+
+    GlobalData.resize_helper_present = True
+
+
+def check_sysmaint_mode() -> None:
+    """
+    Detects if the system is running in sysmaint mode or not.
+    """
+
+    proc_cmdline_file_list: list[Path] = [
+        Path("/proc/cmdline"),
+        Path("/proc/1/cmdline"),
+    ]
+    chosen_proc_cmdline_file: str | None = None
+
+    for proc_cmdline_file in proc_cmdline_file_list:
+        if proc_cmdline_file.is_file():
             chosen_proc_cmdline_file = str(proc_cmdline_file)
             break
 
-    if chosen_proc_cmdline_file is None:
-        print(
-            "ERROR: Cannot find the kernel command line file!",
-            file=sys.stderr,
+    if chosen_proc_cmdline_file is None:
+        GlobalData.log.error("Cannot find the kernel command line file!")
+        sys.exit(1)
+
+    try:
+        with open(
+            chosen_proc_cmdline_file, "r", encoding="utf-8"
+        ) as kernel_cmdline_file:
+            kernel_cmdline: str = kernel_cmdline_file.read()
+        if "boot-role=sysmaint" in kernel_cmdline:
+            GlobalData.in_sysmaint_mode = True
+    except Exception:
+        GlobalData.log.error("Cannot open the kernel command line file!")
+        sys.exit(1)
+
+
+def scan_wait_procs(wait_proc_set: set[str]) -> dict[int, str]:
+    """
+    Returns the PIDs and names of all running processes whose name is in
+    wait_proc_set.
+    """
+
+    return {
+        pid: comm
+        for pid, comm in scan_proc_comm().items()
+        if comm in wait_proc_set
+    }
+
+
+def wait_for_required_processes() -> None:
+    """
+    Waits for all processes in the relevant wait_proc_list to be running,
+    then waits an additional wait_proc_post_start_delay_ms so that they have
+    time to finish starting up.
+
+    Process starts are reported by the kernel's process events connector if
+    it is available, so the wait ends as soon as the last process has
+    started. Otherwise, /proc is rescanned every 100 milliseconds.
+    """
+
+    GlobalData.log.info("Wait for wait_for_required_processes...")
+
+    wait_proc_set: set[str] = set(
+        GlobalData.sysmaint_wait_proc_list
+        if GlobalData.in_sysmaint_mode
+        else GlobalData.normal_wait_proc_list
+    )
+    deadline: float = time.monotonic() + GlobalData.wait_proc_timeout
+
+    proc_conn: ProcConnector | None = ProcConnector()
+    try:
+        proc_conn.open()  # type: ignore
+    except OSError:
+        GlobalData.log.info(
+            "Process events connector unavailable, scanning /proc instead."
+        )
+        proc_conn = None
+
+    ## Scan after subscribing, so that no process start can be missed.
+    found_proc_map: dict[int, str] = scan_wait_procs(wait_proc_set)
+
+    try:
+        while not wait_proc_set.issubset(found_proc_map.values()):
+            remaining_time: float = deadline - time.monotonic()
+            if remaining_time <= 0:
+                GlobalData.log.info(
+                    "Wait for wait_for_required_processes timeout."
+                )
+                return
+
+            if proc_conn is None:
+                time.sleep(min(0.1, remaining_time))
+                found_proc_map = scan_wait_procs(wait_proc_set)
+                continue
+
+            select.select([proc_conn], [], [], remaining_time)
+            proc_event_list: list[tuple[int, int]] | None = (
+                proc_conn.read_events()
+            )
+            if proc_event_list is None:
+                found_proc_map = scan_wait_procs(wait_proc_set)
+                continue
+            for event_type, pid in proc_event_list:
+                if event_type == PROC_EVENT_EXIT:
+                    found_proc_map.pop(pid, None)
+                    continue
+                comm: str | None = read_proc_comm(pid)
+                if comm in wait_proc_set:
+                    assert comm is not None
+                    found_proc_map[pid] = comm
+                else:
+                    found_proc_map.pop(pid, None)
+    finally:
+        if proc_conn is not None:
+            proc_conn.close()
+
+    GlobalData.log.info("Wait for wait_for_required_processes success.")
+    time.sleep(GlobalData.wait_proc_post_start_delay_ms / 1000)
+
+
+def build_conf_schema() -> "schema.Schema":
+    """
+    Returns the schema config files for wlr_resize_watcher are validated
+    against.
+    """
+
+    with GlobalData.startup_profiler.phase("import schema"):
+        # pylint: disable=import-outside-toplevel
+        import schema  # type: ignore
+
+    return schema.Schema(
+        {
+            "enable_dynamic_resolution": bool,
+            "warn_on_dynamic_resolution_refuse": bool,
+            "standard_default_resolution": schema.And(
+                str,
+                lambda s: re.match(r"\d+x\d+", s),
+            ),
+            "small_default_resolution": schema.And(
+                str,
+                lambda s: re.match(r"\d+x\d+", s),
+            ),
+            "normal_wait_proc_list": [str],
+            "sysmaint_wait_proc_list": [str],
+            "wait_proc_timeout": int,
+            "wait_proc_post_start_delay_ms": schema.And(int, lambda n: n >= 0),
+            "compositor_backend": schema.Or(
+                "auto", "wlr-output-management", "wlr-randr"
+            ),
+            "drm_backend": schema.Or("sysfs", "kms"),
+            "resize_settle_time_ms": schema.And(int, lambda n: n > 0),
+            "resize_max_delay_ms": schema.And(int, lambda n: n > 0),
+            "enable_metrics": bool,
+            "metrics_interval_ms": schema.And(int, lambda n: n > 0),
+            "apply_retry_initial_delay_ms": schema.And(int, lambda n: n > 0),
+            "apply_retry_max_delay_ms": schema.And(int, lambda n: n > 0),
+            "apply_retry_limit": schema.And(int, lambda n: n >= 0),
+            "enable_warm_start": bool,
+            "use_resize_broker": bool,
+            "memory_budget_mib": schema.And(int, lambda n: n >= 0),
+            "vram_buffers_per_output": schema.And(int, lambda n: n >= 0),
+            "log_level": schema.Or(*logger.LEVEL_NAME_MAP),
+            "log_rate_limit_interval_ms": schema.And(int, lambda n: n >= 0),
+            "log_rate_limit_burst": schema.And(int, lambda n: n > 0),
+        },
+    )
+
+
+def read_config_files(use_cache: bool = True) -> dict[str, Any]:
+    """
+    Parses and validates the config files for wlr_resize_watcher. Raises an
+    exception if the configuration is invalid. If use_cache is True and none
+    of the config files has changed since they were last parsed, the cached
+    result is used instead, without importing or running the parser and
+    validator. The cache is updated either way.
+    """
+
+    cache_key: list[Any] = config_cache.compute_cache_key(
+        GlobalData.conf_dir_list, [__file__]
+    )
+    user_cache_path: Path | None = config_cache.get_user_cache_path()
+    cached_config: dict[str, Any] | None = None
+    if use_cache and user_cache_path is not None:
+        cached_config = config_cache.load_cached_config(
+            user_cache_path, cache_key, False
+        )
+    if use_cache and cached_config is None:
+        cached_config = config_cache.load_cached_config(
+            config_cache.SYSTEM_CACHE_DIR / config_cache.CACHE_FILE_NAME,
+            cache_key,
+            True,
+        )
+    if cached_config is not None:
+        return cached_config
+
+    config_dict: dict[str, Any] = parse_and_validate_config_files()
+    if user_cache_path is not None:
+        try:
+            config_cache.save_cached_config(
+                user_cache_path, cache_key, config_dict
+            )
+        except OSError:
+            GlobalData.log.warning(
+                "Cannot write config cache '%s'!",
+                user_cache_path,
+                exc_info=True,
+            )
+    return config_dict
+
+
+def parse_and_validate_config_files() -> dict[str, Any]:
+    """
+    Parses and validates the config files for wlr_resize_watcher, without
+    using the config cache. Raises an exception if the configuration is
+    invalid.
+    """
+
+    with GlobalData.startup_profiler.phase("import strict_config_parser"):
+        # pylint: disable=import-outside-toplevel
+        from strict_config_parser import strict_config_parser
+
+    config_dict: dict[str, Any] = strict_config_parser.parse_config_files(
+        conf_item_list=GlobalData.conf_dir_list,
+        conf_schema=build_conf_schema(),
+        defaults_dict=GlobalData.conf_defaults,
+    )
+    assert isinstance(config_dict["enable_dynamic_resolution"], bool)
+    assert isinstance(config_dict["warn_on_dynamic_resolution_refuse"], bool)
+    assert isinstance(config_dict["standard_default_resolution"], str)
+    assert isinstance(config_dict["small_default_resolution"], str)
+    return config_dict
+
+
+def write_system_config_cache() -> NoReturn:
+    """
+    Parses and validates the config files, and writes the result to the
+    system-wide config cache, for the --write-config-cache option. Exits
+    non-zero if the configuration is invalid or the cache cannot be
+    written.
+    """
+
+    try:
+        config_dict: dict[str, Any] = parse_and_validate_config_files()
+    except Exception:
+        GlobalData.log.error("Cannot parse configuration!", exc_info=True)
+        sys.exit(1)
+    cache_path: Path = (
+        config_cache.SYSTEM_CACHE_DIR / config_cache.CACHE_FILE_NAME
+    )
+    try:
+        config_cache.save_cached_config(
+            cache_path,
+            config_cache.compute_cache_key(
+                GlobalData.conf_dir_list, [__file__]
+            ),
+            config_dict,
+        )
+    except OSError:
+        GlobalData.log.error(
+            "Cannot write config cache '%s'!", cache_path, exc_info=True
+        )
+        sys.exit(1)
+    sys.exit(0)
+
+
+def apply_config(config_dict: dict[str, Any]) -> None:
+    """
+    Modifies the GlobalData class to reflect a parsed configuration.
+    """
+
+    GlobalData.enable_dynamic_resolution = config_dict[
+        "enable_dynamic_resolution"
+    ]
+    GlobalData.warn_on_dynamic_resolution_refuse = config_dict[
+        "warn_on_dynamic_resolution_refuse"
+    ]
+    GlobalData.standard_default_resolution = config_dict[
+        "standard_default_resolution"
+    ]
+    GlobalData.small_default_resolution = config_dict[
+        "small_default_resolution"
+    ]
+    GlobalData.normal_wait_proc_list = config_dict["normal_wait_proc_list"]
+    GlobalData.sysmaint_wait_proc_list = config_dict[
+        "sysmaint_wait_proc_list"
+    ]
+    GlobalData.wait_proc_timeout = config_dict["wait_proc_timeout"]
+    GlobalData.wait_proc_post_start_delay_ms = config_dict[
+        "wait_proc_post_start_delay_ms"
+    ]
+    GlobalData.compositor_backend = config_dict["compositor_backend"]
+    GlobalData.drm_backend = config_dict["drm_backend"]
+    GlobalData.resize_settle_time_ms = config_dict["resize_settle_time_ms"]
+    GlobalData.resize_max_delay_ms = config_dict["resize_max_delay_ms"]
+    GlobalData.enable_metrics = config_dict["enable_metrics"]
+    GlobalData.metrics_interval_ms = config_dict["metrics_interval_ms"]
+    GlobalData.apply_retry_initial_delay_ms = config_dict[
+        "apply_retry_initial_delay_ms"
+    ]
+    GlobalData.apply_retry_max_delay_ms = config_dict[
+        "apply_retry_max_delay_ms"
+    ]
+    GlobalData.apply_retry_limit = config_dict["apply_retry_limit"]
+    GlobalData.enable_warm_start = config_dict["enable_warm_start"]
+    GlobalData.use_resize_broker = config_dict["use_resize_broker"]
+    GlobalData.memory_budget_mib = config_dict["memory_budget_mib"]
+    GlobalData.vram_buffers_per_output = config_dict["vram_buffers_per_output"]
+    GlobalData.log_level = config_dict["log_level"]
+    GlobalData.log_rate_limit_interval_ms = config_dict[
+        "log_rate_limit_interval_ms"
+    ]
+    GlobalData.log_rate_limit_burst = config_dict["log_rate_limit_burst"]
+    GlobalData.log.configure(
+        logger.LEVEL_NAME_MAP[GlobalData.log_level],
+        GlobalData.log_rate_limit_interval_ms / 1000,
+        GlobalData.log_rate_limit_burst,
+    )
+    GlobalData.loaded_config = config_dict
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write("config", config=config_dict)
+
+
+def parse_config_files() -> None:
+    """
+    Parses config files for wlr_resize_watcher, modifying the ConfigData class
+    to reflect the correct configuration state.
+    """
+
+    try:
+        config_dict: dict[str, Any] = read_config_files()
+    except Exception:
+        GlobalData.log.error("Cannot parse configuration!", exc_info=True)
+        sys.exit(1)
+    apply_config(config_dict)
+
+
+def reload_config() -> None:
+    """
+    Re-reads the configuration while running. An invalid configuration is
+    rejected as a whole and the previous one stays active. If the new
+    configuration changes how displays should be sized, all displays are
+    synced right away.
+    """
+
+    GlobalData.config_reload_timer = None
+    try:
+        ## A reload is explicitly asked for, always parse the files.
+        config_dict: dict[str, Any] = read_config_files(use_cache=False)
+    except Exception:
+        GlobalData.log.warning(
+            "Cannot parse configuration, keeping the current configuration!",
+            exc_info=True,
+        )
+        return
+
+    changed_key_list: list[str] = [
+        x
+        for x in config_dict
+        if config_dict[x] != GlobalData.loaded_config.get(x)
+    ]
+    if not changed_key_list:
+        return
+    GlobalData.log.info(
+        "Configuration reloaded, changed settings: %r", changed_key_list
+    )
+
+    warn_on_dynamic_resolution_refuse: bool = (
+        GlobalData.warn_on_dynamic_resolution_refuse
+    )
+    apply_config(config_dict)
+    if "warn_on_dynamic_resolution_refuse" not in changed_key_list:
+        ## Don't re-arm the one-time warning if it has been shown already.
+        GlobalData.warn_on_dynamic_resolution_refuse = (
+            warn_on_dynamic_resolution_refuse
+        )
+    if GlobalData.resize_scheduler is not None:
+        GlobalData.resize_scheduler.settle_time = (
+            GlobalData.resize_settle_time_ms / 1000
+        )
+        GlobalData.resize_scheduler.max_delay = (
+            GlobalData.resize_max_delay_ms / 1000
+        )
+    if "compositor_backend" in changed_key_list:
+        switch_compositor_backend()
+    if (
+        "drm_backend" in changed_key_list
+        or "vram_buffers_per_output" in changed_key_list
+    ):
+        switch_drm_backend()
+    if (
+        "enable_metrics" in changed_key_list
+        or "metrics_interval_ms" in changed_key_list
+    ):
+        configure_metrics()
+    if any(x in GlobalData.resync_conf_key_list for x in changed_key_list):
+        sync_all_displays()
+
+
+def get_dri_path() -> Path | None:
+    """
+    Returns the directory of the DRM device nodes if display modes should be
+    read through KMS according to the drm_backend setting, or None if they
+    should be read from sysfs.
+    """
+
+    if GlobalData.drm_backend == "kms":
+        return GlobalData.dri_path
+    return None
+
+
+def switch_drm_backend() -> None:
+    """
+    Rebuilds the DRM topology index with the way of reading display modes
+    selected by the current configuration.
+    """
+
+    if GlobalData.drm_topology is None or GlobalData.broker_client is not None:
+        return
+    GlobalData.drm_topology = DrmTopology(GlobalData.drm_path, get_dri_path())
+    GlobalData.drm_topology.rescan_all()
+    if GlobalData.resize_scheduler is not None:
+        GlobalData.resize_scheduler.topology = GlobalData.drm_topology
+
+
+def switch_compositor_backend() -> None:
+    """
+    Replaces the active compositor backend with the one selected by the
+    current configuration.
+    """
+
+    assert GlobalData.active_backend is not None
+    old_fd: int | None = GlobalData.active_backend.fileno()
+    if old_fd is not None and GlobalData.event_loop is not None:
+        GlobalData.event_loop.remove_reader(old_fd)
+    GlobalData.active_backend.close()
+    init_compositor_backend()
+    new_fd: int | None = GlobalData.active_backend.fileno()
+    if new_fd is not None and GlobalData.event_loop is not None:
+        GlobalData.event_loop.add_reader(new_fd, handle_compositor_events)
+
+
+def sync_all_displays() -> None:
+    """
+    Syncs all displays to their native resolution if dynamic resolution is
+    possible and enabled, or sets them to the default resolution otherwise.
+    """
+
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write("sync_all")
+    ## The desired state may have changed along with the configuration.
+    assert GlobalData.reconciler is not None
+    GlobalData.reconciler.invalidate()
+    cancel_sync_retry()
+    if (
+        GlobalData.resize_helper_present
+        and GlobalData.enable_dynamic_resolution
+    ):
+        GlobalData.log.debug(
+            "resize_helper_present and "
+            "GlobalData.enable_dynamic_resolution: yes"
+        )
+        sync_hw_resolution_with_compositor(None)
+    else:
+        GlobalData.log.debug(
+            "resize_helper_present and "
+            "GlobalData.enable_dynamic_resolution: no"
+        )
+        ## If we can't find an active virtualizer helper, set all displays to
+        ## a comfortable default display resolution.
+        set_all_displays_resolution_to_default()
+
+
+def handle_udev_events() -> None:
+    """
+    Event loop callback for the udev monitor. Queues all pending DRM card
+    events in the resize scheduler.
+    """
+
+    assert GlobalData.udev_monitor is not None
+    assert GlobalData.event_loop is not None
+    now: float = GlobalData.event_loop.time()
+    with GlobalData.metrics.timed("udev_receive"):
+        card_event_list: list[CardEvent] = read_udev_card_events(
+            GlobalData.udev_monitor
+        )
+    if GlobalData.trace_writer is not None:
+        for card_event in card_event_list:
+            GlobalData.trace_writer.write(
+                "udev",
+                card=card_event.card_name,
+                action=card_event.action,
+                connector_id=card_event.connector_id,
+            )
+    queue_card_events(card_event_list, now)
+
+
+def queue_card_events(card_event_list: list[CardEvent], now: float) -> None:
+    """
+    Queues DRM card events received at the given time in the resize
+    scheduler.
+    """
+
+    assert GlobalData.resize_scheduler is not None
+    for card_event in card_event_list:
+        GlobalData.metrics.inc("events_received")
+        if card_event.card_name in GlobalData.resize_scheduler.pending_map:
+            GlobalData.metrics.inc("events_coalesced")
+        GlobalData.resize_scheduler.add_event(card_event, now)
+    reschedule_resize_check()
+
+
+def reschedule_resize_check() -> None:
+    """
+    Sets the resize check timer to fire when the resize scheduler next needs
+    attention, or cancels it if nothing is pending.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.resize_scheduler is not None
+    if GlobalData.resize_check_timer is not None:
+        GlobalData.resize_check_timer.cancel()
+        GlobalData.resize_check_timer = None
+    timeout: float | None = GlobalData.resize_scheduler.next_timeout(
+        GlobalData.event_loop.time()
+    )
+    if timeout is None:
+        return
+    GlobalData.resize_check_timer = GlobalData.event_loop.call_later(
+        timeout, run_due_resizes
+    )
+
+
+def run_due_resizes() -> None:
+    """
+    Timer callback that syncs all cards whose pending resize is due, or, in
+    the resize broker, publishes their new state.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.drm_topology is not None
+    assert GlobalData.resize_scheduler is not None
+    GlobalData.resize_check_timer = None
+    now: float = GlobalData.event_loop.time()
+    for pending in GlobalData.resize_scheduler.pop_due_cards(now):
+        GlobalData.metrics.observe("settle", now - pending.first_event_time)
+        with GlobalData.metrics.timed("sysfs_read"):
+            GlobalData.drm_topology.refresh(
+                pending.card_name, pending.connector_id_set
+            )
+        if GlobalData.broker_server is not None:
+            publish_broker_state(pending.card_name)
+            continue
+        sync_hw_resolution_with_compositor(pending.card_name)
+        ## Both backends only report success once the compositor has
+        ## confirmed the new mode.
+        GlobalData.metrics.observe(
+            "event_to_verified",
+            GlobalData.event_loop.time() - pending.first_event_time,
+        )
+    reschedule_resize_check()
+    check_memory_budget()
+
+
+def check_memory_budget() -> None:
+    """
+    Compares the resident set size with memory_budget_mib, warning once
+    each time it is exceeded, and exports it as a metric.
+    """
+
+    if GlobalData.memory_budget_mib == 0 and not GlobalData.metrics.enabled:
+        return
+    rss: int | None = read_rss()
+    if rss is None:
+        return
+    GlobalData.metrics.set_gauge("resident_memory_bytes", rss)
+    if GlobalData.memory_budget_mib == 0:
+        return
+    over_memory_budget: bool = rss > GlobalData.memory_budget_mib * 1048576
+    if over_memory_budget and not GlobalData.over_memory_budget:
+        GlobalData.log.warning(
+            "Resident memory %s exceeds the memory budget of %s MiB!",
+            format_size(rss),
+            GlobalData.memory_budget_mib,
+        )
+    GlobalData.over_memory_budget = over_memory_budget
+
+
+def release_startup_modules() -> None:
+    """
+    Drops the modules that are only needed during startup, and collects
+    the garbage startup has left behind, so the long-running part of the
+    daemon starts from a small heap. A module's memory is only returned if
+    nothing refers to it or to anything it defined any more, so no objects
+    from these modules may be kept past startup.
+    """
+
+    for module_name in list(sys.modules):
+        if module_name.partition(".")[0] in GlobalData.startup_module_list:
+            del sys.modules[module_name]
+    gc.collect()
+
+
+def configure_metrics() -> None:
+    """
+    Turns metrics collection and the periodic metrics file updates on or
+    off, according to the configuration.
+    """
+
+    metrics_path: Path | None = get_metrics_path()
+    if GlobalData.metrics_timer is not None:
+        GlobalData.metrics_timer.cancel()
+        GlobalData.metrics_timer = None
+    GlobalData.metrics.enabled = (
+        GlobalData.enable_metrics and metrics_path is not None
+    )
+    if not GlobalData.metrics.enabled:
+        if metrics_path is not None:
+            ## Don't leave stale numbers behind.
+            metrics_path.unlink(missing_ok=True)
+        return
+    GlobalData.metrics.dirty = True
+    ## At startup, the metrics file is written for the first time once the
+    ## event loop exists.
+    if GlobalData.event_loop is not None:
+        write_metrics()
+
+
+def get_metrics_path() -> Path | None:
+    """
+    Returns the path of the metrics file, or None if XDG_RUNTIME_DIR is not
+    set.
+    """
+
+    runtime_dir: str | None = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        return None
+    return Path(runtime_dir) / "wlr-resize-watcher" / "metrics.prom"
+
+
+def write_metrics() -> None:
+    """
+    Timer callback that rewrites the metrics file.
+    """
+
+    assert GlobalData.event_loop is not None
+    metrics_path: Path | None = get_metrics_path()
+    assert metrics_path is not None
+    try:
+        GlobalData.metrics.write(metrics_path)
+    except OSError:
+        GlobalData.log.warning(
+            "Cannot write metrics file '%s'!", metrics_path, exc_info=True
+        )
+    GlobalData.metrics_timer = GlobalData.event_loop.call_later(
+        GlobalData.metrics_interval_ms / 1000, write_metrics
+    )
+
+
+def handle_compositor_events() -> None:
+    """
+    Event loop callback for the compositor connection. Keeps the backend's
+    view of the compositor's outputs up to date between syncs.
+    """
+
+    assert GlobalData.active_backend is not None
+    assert GlobalData.reconciler is not None
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write("compositor_event")
+    GlobalData.active_backend.dispatch()
+    ## Syncs read all events the compositor had sent so far, so anything
+    ## arriving here means the outputs were changed behind our back.
+    GlobalData.reconciler.invalidate()
+
+
+def handle_config_dir_events() -> None:
+    """
+    Event loop callback for the configuration directory watcher.
+    """
+
+    assert GlobalData.config_watcher is not None
+    assert GlobalData.event_loop is not None
+    if not GlobalData.config_watcher.read_changes():
+        return
+    ## Tools often write several files or write a file more than once in a
+    ## row, only reload once they are done.
+    if GlobalData.config_reload_timer is None:
+        GlobalData.config_reload_timer = GlobalData.event_loop.call_later(
+            GlobalData.config_reload_delay, reload_config
+        )
+
+
+def handle_early_sighup(signum: int, frame: Any) -> None:
+    """
+    SIGHUP handler until the event loop runs. Remembers the reload request,
+    instead of letting the signal terminate the process during startup.
+    """
+
+    # pylint: disable=unused-argument
+    GlobalData.reload_pending = True
+
+
+def handle_sigterm(signum: int, frame: Any) -> NoReturn:
+    """
+    SIGTERM handler. Exits normally, so that exit handlers, e.g. the
+    report of suppressed log messages, still run.
+    """
+
+    # pylint: disable=unused-argument
+    sys.exit(0)
+
+
+def handle_signal_wakeup(wakeup_fd: int) -> None:
+    """
+    Event loop callback for the signal wakeup pipe. SIGHUP triggers a
+    configuration reload.
+    """
+
+    try:
+        signal_bytes: bytes = os.read(wakeup_fd, 512)
+    except BlockingIOError:
+        return
+    if signal.SIGHUP in signal_bytes:
+        GlobalData.log.info("SIGHUP received, reloading configuration.")
+        reload_config()
+
+
+def start_helper_tracking() -> None:
+    """
+    Keeps track of the resize helper found by check_virtualizer_type() for
+    the rest of the session, so the displays follow it being started or
+    stopped.
+    """
+
+    helper_watcher: HelperWatcher | None = GlobalData.helper_watcher
+    if helper_watcher is None:
+        return
+    assert GlobalData.event_loop is not None
+    if helper_watcher.pid is None:
+        watch_helper_start()
+    elif helper_watcher.pidfd is None:
+        GlobalData.log.warning(
+            "Cannot watch the resize helper for exiting, pidfds are "
+            "unsupported!"
         )
-        sys.exit(1)
+    else:
+        GlobalData.event_loop.add_reader(
+            helper_watcher.pidfd, handle_helper_exit
+        )
+
+
+def watch_helper_start() -> None:
+    """
+    Starts watching for the resize helper to be started.
+    """
 
+    assert GlobalData.event_loop is not None
+    assert GlobalData.helper_watcher is not None
     try:
-        with open(
-            chosen_proc_cmdline_file, "r", encoding="utf-8"
-        ) as kernel_cmdline_file:
-            kernel_cmdline: str = kernel_cmdline_file.read()
-        if "boot-role=sysmaint" in kernel_cmdline:
-            GlobalData.in_sysmaint_mode = True
+        start_fd: int = GlobalData.helper_watcher.open_start_watch()
+    except OSError:
+        GlobalData.log.warning(
+            "Cannot watch for the resize helper to be started!", exc_info=True
+        )
+        return
+    GlobalData.event_loop.add_reader(start_fd, handle_helper_start_events)
+    ## Look once more, so a start right before the watch began is not
+    ## missed.
+    check_helper_started()
+
+
+def check_helper_started() -> None:
+    """
+    Looks for the resize helper in /proc, and switches to watching it for
+    exiting if it has started.
+    """
+
+    assert GlobalData.helper_watcher is not None
+    GlobalData.helper_recheck_timer = None
+    if GlobalData.helper_watcher.find():
+        on_helper_started()
+
+
+def handle_helper_start_events() -> None:
+    """
+    Event loop callback for the resize helper's start watch.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.helper_watcher is not None
+    if not GlobalData.helper_watcher.read_start_events():
+        return
+    if GlobalData.helper_watcher.pid is not None:
+        on_helper_started()
+    elif GlobalData.helper_recheck_timer is None:
+        GlobalData.helper_recheck_timer = GlobalData.event_loop.call_later(
+            GlobalData.helper_recheck_delay, check_helper_started
+        )
+
+
+def on_helper_started() -> None:
+    """
+    Stops watching for the resize helper to be started once it has been,
+    and watches it for exiting instead.
+    """
+
+    assert GlobalData.event_loop is not None
+    helper_watcher: HelperWatcher | None = GlobalData.helper_watcher
+    assert helper_watcher is not None
+    if helper_watcher.start_fd is not None:
+        GlobalData.event_loop.remove_reader(helper_watcher.start_fd)
+        helper_watcher.close_start_watch()
+    if GlobalData.helper_recheck_timer is not None:
+        GlobalData.helper_recheck_timer.cancel()
+        GlobalData.helper_recheck_timer = None
+    if helper_watcher.pidfd is not None:
+        GlobalData.event_loop.add_reader(
+            helper_watcher.pidfd, handle_helper_exit
+        )
+    if GlobalData.helper_grace_timer is not None:
+        ## Restarted in time, nothing has changed.
+        GlobalData.helper_grace_timer.cancel()
+        GlobalData.helper_grace_timer = None
+        GlobalData.log.info("Resize helper has been restarted.")
+        return
+    set_resize_helper_present(True)
+
+
+def handle_helper_exit() -> None:
+    """
+    Event loop callback for the resize helper's pidfd, which becomes
+    readable when the helper exits.
+    """
+
+    assert GlobalData.event_loop is not None
+    helper_watcher: HelperWatcher | None = GlobalData.helper_watcher
+    assert helper_watcher is not None and helper_watcher.pidfd is not None
+    GlobalData.event_loop.remove_reader(helper_watcher.pidfd)
+    helper_watcher.release()
+    ## Only switch to the default resolution if the helper does not come
+    ## back soon, e.g. if it is restarted, or if it has forked and left a
+    ## child running, which watch_helper_start() finds right away.
+    GlobalData.helper_grace_timer = GlobalData.event_loop.call_later(
+        GlobalData.helper_grace_time, run_helper_grace_timeout
+    )
+    watch_helper_start()
+
+
+def run_helper_grace_timeout() -> None:
+    """
+    Timer callback for when the resize helper has not come back after
+    exiting.
+    """
+
+    GlobalData.helper_grace_timer = None
+    set_resize_helper_present(False)
+
+
+def set_resize_helper_present(resize_helper_present: bool) -> None:
+    """
+    Switches between syncing the displays to their native resolution and
+    setting them to the default resolution when the resize helper has been
+    started or has stopped. The resize broker only tells its clients.
+    """
+
+    if resize_helper_present == GlobalData.resize_helper_present:
+        return
+    GlobalData.resize_helper_present = resize_helper_present
+    GlobalData.log.info(
+        "Resize helper has %s.",
+        "started" if resize_helper_present else "stopped",
+    )
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write(
+            "helper", resize_helper_present=resize_helper_present
+        )
+    if GlobalData.broker_server is not None:
+        publish_broker_state(None)
+        return
+    sync_all_displays()
+
+
+def ping_watchdog() -> None:
+    """
+    Timer callback that tells the service manager the event loop is still
+    running.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.watchdog_interval is not None
+    sd_notify.notify("WATCHDOG=1")
+    GlobalData.event_loop.call_later(
+        GlobalData.watchdog_interval, ping_watchdog
+    )
+
+
+def open_udev_monitor() -> None:
+    """
+    Starts listening for DRM udev events.
+    """
+
+    try:
+        with GlobalData.startup_profiler.phase("import pyudev"):
+            # pylint: disable=import-outside-toplevel
+            import pyudev  # type: ignore
+
+        udev_ctx: pyudev.Context = pyudev.Context()
+        GlobalData.udev_monitor = pyudev.Monitor.from_netlink(udev_ctx)
+        subscribe_udev_monitor(GlobalData.udev_monitor)
+        GlobalData.udev_monitor.start()
     except Exception:
-        print(
-            "ERROR: Cannot open the kernel command line file!",
-            file=sys.stderr,
+        GlobalData.log.error(
+            "Cannot listen for DRM udev events!", exc_info=True
         )
         sys.exit(1)
 
 
-def wait_for_required_processes() -> None:
+def connect_resize_broker() -> None:
     """
-    Waits for all processes in the relevant wait_proc_list to be running.
-    Ensures at least one second has passed since all processes in the list
-    have started.
+    Connects to the resize broker, and takes the virtualizer, the presence
+    of the resize helper and the DRM topology from the state it sends. If
+    the broker is unavailable, displays are watched locally instead.
     """
 
-    print(f"INFO: Wait for wait_for_required_processes...", file=sys.stderr,)
-
-    wait_proc_list: list[str] = (
-        GlobalData.sysmaint_wait_proc_list
-        if GlobalData.in_sysmaint_mode
-        else GlobalData.normal_wait_proc_list
+    try:
+        broker_client: broker.BrokerClient = broker.BrokerClient(
+            broker.SOCKET_PATH
+        )
+    except OSError as e:
+        GlobalData.log.warning(
+            "Cannot connect to the resize broker: %s, watching displays "
+            "locally!",
+            e,
+        )
+        return
+    state: dict[str, Any] | None = broker_client.wait_message(
+        GlobalData.broker_connect_timeout
     )
-    sleep_count: int = 0
+    topology: BrokerTopology = BrokerTopology(GlobalData.drm_path)
+    try:
+        if state is None:
+            raise ValueError("No usable state received!")
+        topology.load_card_map(state["card_map"])
+        virtualizer_str: str | None = state["virtualizer"]
+        resize_helper_present: bool = bool(state["resize_helper_present"])
+    except (KeyError, TypeError, ValueError):
+        GlobalData.log.warning(
+            "Cannot get the state from the resize broker, watching displays "
+            "locally!",
+            exc_info=True,
+        )
+        broker_client.close()
+        return
+    GlobalData.broker_client = broker_client
+    GlobalData.drm_topology = topology
+    GlobalData.virtualizer_str = virtualizer_str
+    GlobalData.resize_helper_present = resize_helper_present
+    GlobalData.log.info("Connected to the resize broker.")
 
-    while True:
-        running_proc_list: list[str] = subprocess.run(
-            ["ps", "axo", "comm"],
-            check=False,
-            capture_output=True,
-            encoding="utf-8",
-        ).stdout.split("\n")
-        time.sleep(1)
-        sleep_count += 1
-        if sleep_count >= GlobalData.wait_proc_timeout:
-            print(f"INFO: Wait for wait_for_required_processes timeout.", file=sys.stderr)
-            break
-        do_retry_loop: bool = False
-        for wait_proc in wait_proc_list:
-            if wait_proc not in running_proc_list:
-                do_retry_loop = True
-                break
-        if do_retry_loop:
+
+def handle_broker_events() -> None:
+    """
+    Event loop callback for the connection to the resize broker. Syncs the
+    displays every time the broker publishes a change.
+    """
+
+    assert GlobalData.broker_client is not None
+    assert isinstance(GlobalData.drm_topology, BrokerTopology)
+    message_list: list[dict[str, Any]] | None = (
+        GlobalData.broker_client.read_messages()
+    )
+    if message_list is None:
+        ## Let the service manager restart us, which either reconnects or
+        ## falls back to watching displays locally.
+        GlobalData.log.error("Lost the connection to the resize broker!")
+        sys.exit(1)
+    for message in message_list:
+        try:
+            GlobalData.drm_topology.load_card_map(message["card_map"])
+            card_name: str | None = message["changed_card"]
+            resize_helper_present: bool = bool(
+                message["resize_helper_present"]
+            )
+        except (KeyError, TypeError, ValueError):
+            GlobalData.log.warning(
+                "Ignoring malformed state from the resize broker!",
+                exc_info=True,
+            )
             continue
-        print(f"INFO: Wait for wait_for_required_processes success.", file=sys.stderr)
-        break
+        GlobalData.metrics.inc("broker_updates")
+        if resize_helper_present != GlobalData.resize_helper_present:
+            ## The broker has seen the resize helper start or stop.
+            set_resize_helper_present(resize_helper_present)
+            continue
+        if GlobalData.trace_writer is not None:
+            GlobalData.trace_writer.write("broker", card=card_name)
+        sync_hw_resolution_with_compositor(card_name)
+    check_memory_budget()
 
 
-def parse_config_files() -> None:
+def build_broker_state(card_name: str | None) -> dict[str, Any]:
     """
-    Parses config files for wlr_resize_watcher, modifying the ConfigData class
-    to reflect the correct configuration state.
+    Returns the message the resize broker publishes to its clients.
+    card_name is the card whose displays have changed, or None if the
+    message is sent for another reason.
+    """
+
+    assert GlobalData.drm_topology is not None
+    return {
+        "version": broker.PROTOCOL_VERSION,
+        "virtualizer": GlobalData.virtualizer_str,
+        "resize_helper_present": GlobalData.resize_helper_present,
+        "changed_card": card_name,
+        "card_map": GlobalData.drm_topology.export_card_map(),
+    }
+
+
+def publish_broker_state(card_name: str | None) -> None:
+    """
+    Sends the current state to all clients of the resize broker.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.broker_server is not None
+    for client_sock in GlobalData.broker_server.publish(
+        build_broker_state(card_name)
+    ):
+        drop_broker_client(client_sock)
+    for client_sock in GlobalData.broker_server.client_map:
+        GlobalData.event_loop.set_write_interest(
+            client_sock, GlobalData.broker_server.is_stalled(client_sock)
+        )
+
+
+def drop_broker_client(client_sock: "socket.socket") -> None:
+    """
+    Disconnects a client of the resize broker.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.broker_server is not None
+    GlobalData.event_loop.remove_reader(client_sock)
+    GlobalData.broker_server.drop(client_sock)
+
+
+def handle_broker_connection() -> None:
+    """
+    Event loop callback for the resize broker's listening socket. Sends the
+    current state to a newly connected client.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.broker_server is not None
+    client_sock: "socket.socket | None" = GlobalData.broker_server.accept()
+    if client_sock is None:
+        return
+    GlobalData.event_loop.add_reader(
+        client_sock, lambda: handle_broker_client_events(client_sock)
+    )
+    if not GlobalData.broker_server.send(
+        client_sock, build_broker_state(None)
+    ):
+        drop_broker_client(client_sock)
+        return
+    GlobalData.event_loop.set_write_interest(
+        client_sock, GlobalData.broker_server.is_stalled(client_sock)
+    )
+
+
+def handle_broker_client_events(client_sock: "socket.socket") -> None:
+    """
+    Event loop callback for a client of the resize broker. Runs when the
+    client has disconnected, or when output that it could not take before
+    can be sent.
+    """
+
+    assert GlobalData.event_loop is not None
+    assert GlobalData.broker_server is not None
+    if not GlobalData.broker_server.is_connected(
+        client_sock
+    ) or not GlobalData.broker_server.flush(client_sock):
+        drop_broker_client(client_sock)
+        return
+    GlobalData.event_loop.set_write_interest(
+        client_sock, GlobalData.broker_server.is_stalled(client_sock)
+    )
+
+
+def run_broker() -> NoReturn:
     """
+    Main function of the resize broker (--broker). Watches udev and the DRM
+    connectors, and publishes the settled state of the displays to the
+    per-session watchers, which apply it to their compositors.
+    """
+
+    parse_config_files()
+    check_virtualizer_type()
+    GlobalData.log.info("virtualizer: '%s'", GlobalData.virtualizer_str)
 
+    open_udev_monitor()
+    GlobalData.drm_topology = DrmTopology(GlobalData.drm_path, get_dri_path())
+    GlobalData.drm_topology.rescan_all()
     try:
-        config_dict: dict[str, Any] = strict_config_parser.parse_config_files(
-            conf_item_list=GlobalData.conf_dir_list,
-            conf_schema=GlobalData.conf_schema,
-            defaults_dict=GlobalData.conf_defaults,
+        GlobalData.broker_server = broker.BrokerServer(
+            broker.open_server_socket(broker.SOCKET_PATH)
         )
-    except Exception:
-        print(
-            "ERROR: Cannot parse configuration!",
-            file=sys.stderr,
+    except OSError:
+        GlobalData.log.error(
+            "Cannot listen on '%s'!", broker.SOCKET_PATH, exc_info=True
         )
-        traceback.print_exc(file=sys.stderr)
         sys.exit(1)
-    assert isinstance(config_dict["enable_dynamic_resolution"], bool)
-    assert isinstance(config_dict["warn_on_dynamic_resolution_refuse"], bool)
-    assert isinstance(config_dict["standard_default_resolution"], str)
-    assert isinstance(config_dict["small_default_resolution"], str)
-    GlobalData.enable_dynamic_resolution = config_dict[
-        "enable_dynamic_resolution"
-    ]
-    GlobalData.warn_on_dynamic_resolution_refuse = config_dict[
-        "warn_on_dynamic_resolution_refuse"
-    ]
-    GlobalData.standard_default_resolution = config_dict[
-        "standard_default_resolution"
-    ]
-    GlobalData.small_default_resolution = config_dict[
-        "small_default_resolution"
-    ]
-    GlobalData.normal_wait_proc_list = config_dict["normal_wait_proc_list"]
-    GlobalData.sysmaint_wait_proc_list = config_dict[
-        "sysmaint_wait_proc_list"
+
+    GlobalData.resize_scheduler = ResizeScheduler(
+        GlobalData.drm_topology,
+        GlobalData.resize_settle_time_ms / 1000,
+        GlobalData.resize_max_delay_ms / 1000,
+    )
+    GlobalData.event_loop = EventLoop()
+    GlobalData.log.call_later = GlobalData.event_loop.call_later
+    configure_metrics()
+    GlobalData.event_loop.add_reader(
+        GlobalData.udev_monitor, handle_udev_events
+    )
+    GlobalData.event_loop.add_reader(
+        GlobalData.broker_server, handle_broker_connection
+    )
+    start_helper_tracking()
+    sd_notify.notify("READY=1")
+    release_startup_modules()
+    check_memory_budget()
+
+    handle_udev_events()
+    GlobalData.event_loop.run_forever()
+
+
+def run_once_phases(report: "OnceReport") -> int:
+    """
+    Does what the daemon does at startup up to and including the first
+    sync, then checks what the compositor ended up with. Returns the exit
+    status for --once.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from wlr_resize_watcher import once_report
+
+    with report.phase("config parse"):
+        parse_config_files()
+    with report.phase("virtualizer check"):
+        check_virtualizer_type()
+    with report.phase("sysmaint check"):
+        check_sysmaint_mode()
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write(
+            "environment",
+            virtualizer=GlobalData.virtualizer_str,
+            resize_helper_present=GlobalData.resize_helper_present,
+            in_sysmaint_mode=GlobalData.in_sysmaint_mode,
+        )
+    with report.phase("process wait"):
+        wait_for_required_processes()
+    with report.phase("compositor connect"):
+        init_compositor_backend()
+    with report.phase("topology scan"):
+        GlobalData.drm_topology = DrmTopology(
+            GlobalData.drm_path, get_dri_path()
+        )
+        GlobalData.drm_topology.rescan_all()
+    GlobalData.reconciler = Reconciler()
+    GlobalData.output_index = OutputIndex()
+
+    ## The same choice sync_all_displays() makes.
+    report.mode = (
+        "native"
+        if GlobalData.resize_helper_present
+        and GlobalData.enable_dynamic_resolution
+        else "default"
+    )
+    with report.phase("sync"):
+        sync_all_displays()
+    if report.mode == "native" and not report.hw_disp_list:
+        return report.finish(
+            once_report.OUTCOME_NO_DISPLAYS,
+            "The graphics cards report no connected displays.",
+        )
+    if not report.compositor_state_list or (
+        report.compositor_state_list[0] is None
+    ):
+        return report.finish(
+            once_report.OUTCOME_NO_DISPLAYS,
+            "The compositor reports no displays.",
+        )
+    if len(report.action_list) == 0:
+        return report.finish(once_report.OUTCOME_UNCHANGED)
+
+    with report.phase("verify"):
+        final_disp_list: list[DisplayInfo] | None = get_compositor_disp_list()
+    if final_disp_list is None:
+        return report.finish(
+            once_report.OUTCOME_FAILED,
+            "The compositor reports no displays after the change.",
+        )
+    mode_map: dict[str, str] = {
+        x.disp_name: x.disp_mode for x in final_disp_list
+    }
+    ## The first change handed to the compositor is the whole one, later
+    ## ones are the parts it accepted, see apply_compositor_layout().
+    failed_name_list: list[str] = [
+        x["disp_name"]
+        for x in report.action_list[0]["target_list"]
+        if x["disp_mode"] is not None
+        and mode_map.get(x["disp_name"]) != x["disp_mode"]
     ]
-    GlobalData.wait_proc_timeout = config_dict["wait_proc_timeout"]
+    if failed_name_list:
+        return report.finish(
+            once_report.OUTCOME_FAILED,
+            f"The compositor did not change displays {failed_name_list!r}.",
+        )
+    return report.finish(once_report.OUTCOME_APPLIED)
+
+
+def run_once(json_output: bool) -> NoReturn:
+    """
+    Main function of --once. Syncs all displays a single time, then writes
+    a report of the phase timings, the displays found and the display
+    changes made to stdout, as JSON if json_output is set, and exits.
+    Exits non-zero if the displays could not be synced.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from wlr_resize_watcher import once_report
+
+    report: once_report.OnceReport = once_report.OnceReport()
+    GlobalData.once_report = report
+    exit_status: int
+    try:
+        exit_status = run_once_phases(report)
+    except SystemExit as exc:
+        ## Running on physical hardware, or an error the daemon would have
+        ## exited on as well. The report is still wanted.
+        exit_status = exc.code if isinstance(exc.code, int) else 1
+        report.finish(
+            (
+                once_report.OUTCOME_SKIPPED
+                if exit_status == 0
+                else once_report.OUTCOME_FAILED
+            ),
+            "Exited early, see the log for details.",
+        )
+    report.environment_map = {
+        "virtualizer": GlobalData.virtualizer_str,
+        "resize_helper_present": GlobalData.resize_helper_present,
+        "in_sysmaint_mode": GlobalData.in_sysmaint_mode,
+        "compositor_backend": (
+            None
+            if GlobalData.active_backend is None
+            else type(GlobalData.active_backend).__name__
+        ),
+    }
+    if json_output:
+        report.write_json()
+    else:
+        report.write_summary()
+    sys.exit(exit_status)
+
+
+def parse_args() -> dict[str, Any]:
+    """
+    Parses command line arguments, and returns them as a plain dict. The
+    argparse.Namespace is not kept, as it would keep the argparse module
+    alive after release_startup_modules().
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import argparse
+
+    arg_parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="wlr-resize-watcher",
+        description="Resizes Wayland displays to match the native resolution "
+        "of the virtual display.",
+    )
+    arg_parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="report the time spent in each startup phase; the modules of "
+        "wlr_resize_watcher itself are imported before this option is "
+        "parsed, so their import time is only reported in total, together "
+        "with interpreter startup (see 'python3 -X importtime' for a "
+        "breakdown)",
+    )
+    arg_parser.add_argument(
+        "--record",
+        metavar="FILE",
+        type=Path,
+        help="record udev events, display modes, compositor states and "
+        "display changes to a trace file",
+    )
+    arg_parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        type=Path,
+        help="run the resize logic against a trace file recorded with "
+        "--record instead of the system, and report where it behaves "
+        "differently",
+    )
+    arg_parser.add_argument(
+        "--replay-fast",
+        action="store_true",
+        help="with --replay, don't wait between events",
+    )
+    arg_parser.add_argument(
+        "--broker",
+        action="store_true",
+        help="run as the system-wide resize broker, publishing display "
+        f"changes to the per-session watchers on {broker.SOCKET_PATH}",
+    )
+    arg_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="sync all displays once, report the time spent in each phase, "
+        "the displays found and the changes made, and exit; exits non-zero "
+        "if the displays could not be synced",
+    )
+    arg_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="with --once, write the report as JSON",
+    )
+    arg_parser.add_argument(
+        "--write-config-cache",
+        action="store_true",
+        help="validate the configuration, write it to the system-wide "
+        f"config cache in {config_cache.SYSTEM_CACHE_DIR} and exit",
+    )
+    args: argparse.Namespace = arg_parser.parse_args()
+    if args.json and not args.once:
+        arg_parser.error("--json requires --once")
+    if args.once and (args.broker or args.replay is not None):
+        arg_parser.error("--once cannot be used with --broker or --replay")
+    if args.write_config_cache:
+        write_system_config_cache()
+    if args.replay is not None:
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher import replay
+
+        replay.run_replay(args.replay, args.replay_fast)
+    if args.record is not None:
+        try:
+            GlobalData.trace_writer = trace.TraceWriter(args.record)
+        except OSError:
+            GlobalData.log.error(
+                "Cannot create trace file '%s'!", args.record, exc_info=True
+            )
+            sys.exit(1)
+    return dict(vars(args))
+
 
 def main() -> NoReturn:
     """
     Main function.
     """
 
-    if Path("/usr/share/qubes/marker-vm").is_file():
-        print("INFO: Qubes OS detected, exiting.", file=sys.stderr)
-        sys.exit(0)
+    ## systemctl reload may already be called while starting up, e.g. by
+    ## configure-dynamic-resolution.
+    signal.signal(signal.SIGHUP, handle_early_sighup)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    GlobalData.probed_environment = read_probed_environment()
+    if "qubes" in GlobalData.probed_environment:
+        in_qubes: bool = GlobalData.probed_environment["qubes"] == "true"
+    else:
+        in_qubes = Path("/usr/share/qubes/marker-vm").is_file()
+    if in_qubes:
+        exit_without_work("Qubes OS detected, exiting.")
 
     ## The method we use for detecting display resolution changes is as
     ## follows:
     ##
     ## - Listen for udev events for all DRM cards on the system.
-    ## - Every time an event is received for a card, wait half a second so
-    ##   that the compositor has time to register any new displays that may
-    ##   have appeared.
-    ## - Enumerate all displays seen by the compositor.
+    ## - Every time an event is received for a card, wait until the mode
+    ##   lists of the card's displays stop changing, so that the hypervisor
+    ##   has finished the resize and the compositor has time to register any
+    ##   new displays that may have appeared. Further events for the same
+    ##   card arriving in the meantime are merged into the pending one. If
+    ##   the mode lists keep changing (e.g. while the VM window is being
+    ##   resized), go ahead anyway after resize_max_delay_ms.
+    ## - Enumerate all displays seen by the compositor. This is done through
+    ##   a persistent wlr-output-management protocol connection if possible,
+    ##   or by running wlr-randr otherwise.
     ## - Enumerate all displays supported by the card.
     ## - Determine the native display resolution of all displays on the card.
+    ##   Both are kept in an index (DrmTopology) that is built once at
+    ##   startup, and afterwards only updated for the connectors named in
+    ##   udev events.
     ## - For all displays seen by the compositor, whose current resolution
     ##   does not match the native resolution, change the resolution used by
     ##   the compositor to match.
     ##
-    ## The udev listening and sleep are done here, most of the rest of the
-    ## logic is in sync_hw_resolution_with_compositor().
+    ## The udev listening is done by an event loop set up here, which also
+    ## watches the compositor connection and the configuration directories.
+    ## Scheduling is done in ResizeScheduler, most of the rest of the logic
+    ## is in sync_hw_resolution_with_compositor().
     ##
-    ## Note that we always assume that the desired display frequency is 60 Hz.
-    ## This may not always hold true for physical screens, but should be fine
+    ## Note that displays are set to the refresh rate of their native mode,
+    ## as reported through KMS. Only if it is unknown (display modes read
+    ## from sysfs come without one), 60 Hz is assumed, which should be fine
     ## for virtual displays.
 
-    parse_config_files()
+    arg_map: dict[str, Any] = parse_args()
+    if arg_map["broker"]:
+        run_broker()
+    if arg_map["once"]:
+        run_once(arg_map["json"])
+    if arg_map["profile_startup"]:
+        GlobalData.startup_profiler.enable()
+    profiler: StartupProfiler = GlobalData.startup_profiler
 
-    check_virtualizer_type()
-    print(f"INFO: virtualizer: '{GlobalData.virtualizer_str}'", file=sys.stderr)
+    with profiler.phase("config parse"):
+        parse_config_files()
+    configure_metrics()
 
-    check_sysmaint_mode()
-    print(f"INFO: in_sysmaint_mode: '{GlobalData.in_sysmaint_mode}'", file=sys.stderr)
+    if GlobalData.use_resize_broker:
+        with profiler.phase("broker connect"):
+            connect_resize_broker()
 
-    wait_for_required_processes()
-    if (
-        GlobalData.resize_helper_present
-        and GlobalData.enable_dynamic_resolution
-    ):
-        print(f"INFO: resize_helper_present and GlobalData.enable_dynamic_resolution: yes", file=sys.stderr)
-        sync_hw_resolution_with_compositor(None)
-    else:
-        print(f"INFO: resize_helper_present and GlobalData.enable_dynamic_resolution: no", file=sys.stderr)
-        ## If we can't find an active virtualizer helper, set all displays to
-        ## a comfortable default display resolution.
-        set_all_displays_resolution_to_default()
+    with profiler.phase("virtualizer check"):
+        check_virtualizer_type()
+    GlobalData.log.info("virtualizer: '%s'", GlobalData.virtualizer_str)
 
+    with profiler.phase("sysmaint check"):
+        check_sysmaint_mode()
+    GlobalData.log.info("in_sysmaint_mode: '%s'", GlobalData.in_sysmaint_mode)
+    if GlobalData.trace_writer is not None:
+        GlobalData.trace_writer.write(
+            "environment",
+            virtualizer=GlobalData.virtualizer_str,
+            resize_helper_present=GlobalData.resize_helper_present,
+            in_sysmaint_mode=GlobalData.in_sysmaint_mode,
+        )
+
+    GlobalData.output_index = OutputIndex()
+    with profiler.phase("warm start"):
+        restore_display_snapshot()
+
+    with profiler.phase("process wait"):
+        wait_for_required_processes()
+    if GlobalData.active_backend is None:
+        with profiler.phase("compositor connect"):
+            init_compositor_backend()
+
+    ## Start listening for udev events before the topology is scanned and the
+    ## first sync happens, so that no change in between can be missed. With
+    ## the resize broker, its changes queue up in our connection instead.
+    if GlobalData.broker_client is None:
+        open_udev_monitor()
+
+    with profiler.phase("first sync"):
+        if GlobalData.drm_topology is None:
+            GlobalData.drm_topology = DrmTopology(
+                GlobalData.drm_path, get_dri_path()
+            )
+            GlobalData.drm_topology.rescan_all()
+        GlobalData.reconciler = Reconciler()
+        sync_all_displays()
+    sd_notify.notify("READY=1")
+    profiler.report()
+    release_startup_modules()
+
+    GlobalData.event_loop = EventLoop()
+    GlobalData.log.call_later = GlobalData.event_loop.call_later
+    configure_metrics()
+    ## Retry a failed first sync, now that timers can run. A static display
+    ## may never cause another udev event.
+    assert GlobalData.reconciler is not None
+    if GlobalData.reconciler.retry_pending:
+        schedule_sync_retry()
+    if GlobalData.broker_client is not None:
+        GlobalData.event_loop.add_reader(
+            GlobalData.broker_client, handle_broker_events
+        )
+    else:
+        GlobalData.resize_scheduler = ResizeScheduler(
+            GlobalData.drm_topology,
+            GlobalData.resize_settle_time_ms / 1000,
+            GlobalData.resize_max_delay_ms / 1000,
+        )
+        GlobalData.event_loop.add_reader(
+            GlobalData.udev_monitor, handle_udev_events
+        )
+    assert GlobalData.active_backend is not None
+    compositor_fd: int | None = GlobalData.active_backend.fileno()
+    if compositor_fd is not None:
+        GlobalData.event_loop.add_reader(
+            compositor_fd, handle_compositor_events
+        )
     try:
-        udev_ctx: pyudev.Context = pyudev.Context()
-        udev_mon: pyudev.Monitor = pyudev.Monitor.from_netlink(udev_ctx)
-        udev_mon.filter_by("drm")
-    except Exception:
-        print(
-            "ERROR: Cannot listen for DRM udev events!",
-            file=sys.stderr,
+        # pylint: disable=import-outside-toplevel
+        from wlr_resize_watcher.inotify import DirWatcher
+
+        GlobalData.config_watcher = DirWatcher(GlobalData.conf_dir_list)
+        GlobalData.event_loop.add_reader(
+            GlobalData.config_watcher, handle_config_dir_events
+        )
+    except OSError:
+        GlobalData.log.warning(
+            "Cannot watch configuration directories for changes!",
+            exc_info=True,
         )
-        traceback.print_exc(file=sys.stderr)
-        sys.exit(1)
 
-    while True:
-        mod_card: str = get_udev_card_event(udev_mon)
-        time.sleep(0.5)
-        sync_hw_resolution_with_compositor(mod_card)
+    signal_read_fd, signal_write_fd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+    signal.set_wakeup_fd(signal_write_fd)
+    signal.signal(signal.SIGHUP, lambda signum, frame: None)
+    GlobalData.event_loop.add_reader(
+        signal_read_fd, lambda: handle_signal_wakeup(signal_read_fd)
+    )
+    if GlobalData.reload_pending:
+        GlobalData.reload_pending = False
+        GlobalData.log.info(
+            "SIGHUP received during startup, reloading configuration."
+        )
+        reload_config()
+
+    GlobalData.watchdog_interval = sd_notify.watchdog_interval()
+    if GlobalData.watchdog_interval is not None:
+        GlobalData.event_loop.call_later(
+            GlobalData.watchdog_interval, ping_watchdog
+        )
+
+    start_helper_tracking()
+    check_memory_budget()
+    ## Events that arrived during startup are picked up right away.
+    if GlobalData.broker_client is not None:
+        handle_broker_events()
+    else:
+        handle_udev_events()
+    GlobalData.event_loop.run_forever()
 
 if __name__ == "__main__":
     main()